@@ -1,13 +1,11 @@
 """Agents module"""
 
-import os
 from typing import List
 
-from pydantic import BaseModel
-from tavily import TavilyClient
-from langchain_core.messages import SystemMessage, HumanMessage
+from pydantic import BaseModel, Field
+from langchain_core.messages import AnyMessage, SystemMessage, HumanMessage
 from langgraph.graph import StateGraph, END, START
-from langgraph.types import Send
+from langgraph.types import Send, StreamWriter
 
 # local imports
 from agents.prompts import (
@@ -15,15 +13,42 @@ from agents.prompts import (
     FINAL_REVISION_PROMPT,
     RESEARCH_CRITIQUE_PROMPT,
     RESEARCH_PROMPT_TEMPLATE,
+    REVISION_PROMPT_TEMPLATE,
     WRITER_PROMPT_TEMPLATE,
 )
 from agents.constants import (
-    ALL_TOPICS,
+    DRAFT_CONVERGENCE_THRESHOLD,
+    REVISION_MIN_LENGTH_RATIO,
+    SEARCH_CACHE_TTL_SECONDS,
     SUBTOPICS_MAPPING,
     TOPIC_NAMES_MAPPING,
+    WRITER_CONTEXT_TOKEN_BUDGET,
+    WRITER_REVISION_MODE,
 )
+from agents import corpus, sections
+from agents.context import current_run
+from agents.documents import DocumentStore, estimate_tokens, text_similarity
 from agents.states import ResearchState, TopicState
 from agents.llm import call_model
+from agents.metrics import SIZE_BUCKETS, increment, instrument_node, observe
+from agents.progress import section_progress
+from agents.retrieval import build_evidence, subtopic_queries
+from agents.search import search_all
+
+
+def shared_evidence(topic: str) -> List[str]:
+    """Documents the other topic agents of the current run found that are relevant to `topic`"""
+    run = current_run()
+    if run is None:
+        return []
+    return run.evidence.shared_with(topic)
+
+
+# why a topic's revision loop stopped
+STOP_MAX_DRAFTS = "max_drafts"
+STOP_ACCEPTABLE = "acceptable"  # the critique found nothing substantive to fix
+STOP_NO_NEW_DOCS = "no_new_docs"  # refining found nothing the draft could use
+STOP_CONVERGED = "converged"  # the last revision barely changed the draft
 
 
 class SearchQueries(BaseModel):
@@ -31,13 +56,24 @@ class SearchQueries(BaseModel):
     queries: List[str]
 
 
-tavily = TavilyClient(os.environ.get("TAVILY_API_KEY"))
+class Critique(BaseModel):
+    """the reviewer's verdict on a draft"""
+    notes: str = Field(description="recommendations for revising the draft")
+    acceptable: bool = Field(description="whether the draft is good enough to publish without more research")
 
 
 class TopicAgent:
-    def __init__(self, model, task_id: str=None):
+    def __init__(
+        self,
+        model,
+        task_id: str=None,
+        context_budget: int=WRITER_CONTEXT_TOKEN_BUDGET,
+        revision_mode: str=WRITER_REVISION_MODE,
+    ):
         self.model = model
         self.task_id = task_id
+        self.context_budget = context_budget  # max tokens of documents per writer prompt
+        self.revision_mode = revision_mode  # "delta" or "full", see WRITER_REVISION_MODE
         self.workflow = self.build()
 
     def run_research(self, state: TopicState):
@@ -62,11 +98,12 @@ class TopicAgent:
     def build(self) -> StateGraph:
         """Create workflow for topic agent"""
         workflow = StateGraph(TopicState)
-        workflow.add_node(self.node_name("research"), self.research_node)
-        workflow.add_node(self.node_name("generate"), self.generate_node)
-        workflow.add_node(self.node_name("critique"), self.critique_node)
-        workflow.add_node(self.node_name("refine"), self.refine_node)
-        workflow.add_node(self.node_name("to_parent"), self.to_parent_graph)
+        self.add_node(workflow, "research", self.research_node)
+        self.add_node(workflow, "generate", self.generate_node)
+        self.add_node(workflow, "critique", self.critique_node)
+        self.add_node(workflow, "refine", self.refine_node)
+        self.add_node(workflow, "polish", self.polish_node)
+        self.add_node(workflow, "to_parent", self.to_parent_graph)
 
         workflow.set_entry_point(self.node_name("research"))
 
@@ -74,10 +111,19 @@ class TopicAgent:
         workflow.add_conditional_edges(
             self.node_name("generate"),
             self.is_ready,
-            {True: self.node_name("to_parent"), False: self.node_name("critique")},
+            {True: self.node_name("polish"), False: self.node_name("critique")},
+        )
+        workflow.add_conditional_edges(
+            self.node_name("critique"),
+            self.is_ready,
+            {True: self.node_name("polish"), False: self.node_name("refine")},
+        )
+        workflow.add_conditional_edges(
+            self.node_name("refine"),
+            self.is_ready,
+            {True: self.node_name("polish"), False: self.node_name("generate")},
         )
-        workflow.add_edge(self.node_name("critique"), self.node_name("refine"))
-        workflow.add_edge(self.node_name("refine"), self.node_name("generate"))
+        workflow.add_edge(self.node_name("polish"), self.node_name("to_parent"))
         workflow.add_edge(self.node_name("to_parent"), END)
 
         return workflow
@@ -86,6 +132,11 @@ class TopicAgent:
         """Helper function to generate node names from topic and node function"""
         return node + "_node"
 
+    def add_node(self, workflow: StateGraph, node: str, function) -> None:
+        """Adds an instrumented node to the workflow"""
+        name = self.node_name(node)
+        workflow.add_node(name, instrument_node(function, name))
+
     async def research_node(self, state: TopicState):
         """Generate search queries and gathers relevant documents using Tavily"""
 
@@ -105,61 +156,153 @@ class TopicAgent:
             output_type=SearchQueries,
         )
 
-        documents = state.get("docs", [])
-        for query in search_queries.queries:
-            # Normally I'd make the search tool configurable,
-            # but since we're using Tavily, I just hardcode it here
-            response = tavily.search(
-                query=query,
-                max_results=3,
-                topic="news" if state['topic'] == "recent_news" else "general",
-            )
-            for result in response["results"]:
-                documents.append(result["content"])
+        documents = DocumentStore(await corpus.load(state.get("docs", [])))
+        # queries are independent, so run them all at once
+        responses = await search_all(
+            search_queries.queries,
+            requester=state['topic'],
+            max_results=3,
+            topic="news" if state['topic'] == "recent_news" else "general",
+            ttl=SEARCH_CACHE_TTL_SECONDS[state['topic']],
+        )
+        for response in responses:
+            documents.extend(result["content"] for result in response["results"])
+        # plus what the other topics of this run have found so far that's relevant here
+        shared = documents.extend(shared_evidence(state['topic']))
+        increment("evidence_docs_shared_total", shared, topic=state['topic'])
 
-        return {"docs": documents, "topic": state['topic']}
+        # the state (and so every checkpoint) only carries references to the documents
+        return {"docs": await corpus.store(documents.docs), "topic": state['topic']}
 
     async def generate_node(self, state: TopicState):
-        """Generates a draft based on the documents collected by Tavily."""
+        """
+        Generates a draft based on the documents collected by Tavily.
+        In delta mode, revisions start from the previous draft and the critique
+        and only get the documents found since; a revision that comes back
+        truncated is redone from scratch with all documents.
+        """
+        refs = state.get("docs", [])
+        previous_draft = state.get("draft")
+        mode, prompt_tokens = "full", 0
+        if self.revision_mode == "delta" and previous_draft and state.get("critique"):
+            mode = "delta"
+            new_docs = await corpus.load(refs[state.get("drafted_docs", 0):])
+            messages = self.revision_messages(state, new_docs)
+            prompt_tokens += sum(estimate_tokens(message.content) for message in messages)
+            response = await call_model(messages=messages, model=self.model)
+            if len(response.content) < REVISION_MIN_LENGTH_RATIO * len(previous_draft):
+                mode = "fallback"
+        if mode != "delta":
+            messages = self.writer_messages(state, await corpus.load(refs))
+            prompt_tokens += sum(estimate_tokens(message.content) for message in messages)
+            response = await call_model(messages=messages, model=self.model)
+
+        draft_number = state.get("draft_number", 0) + 1
+        stop_reason = ""
+        if draft_number >= state.get("max_drafts"):
+            stop_reason = STOP_MAX_DRAFTS
+        elif previous_draft and text_similarity(previous_draft, response.content) >= DRAFT_CONVERGENCE_THRESHOLD:
+            stop_reason = STOP_CONVERGED
+        observe(
+            "writer_prompt_tokens", prompt_tokens, SIZE_BUCKETS,
+            topic=state.get("topic"), mode=mode, draft=draft_number,
+        )
+        return {
+            "topic": state.get("topic"),
+            "draft": response.content,
+            "draft_number": draft_number,
+            "drafted_docs": len(refs),
+            "prompt_tokens": state.get("prompt_tokens", []) + [prompt_tokens],
+            "stop_reason": stop_reason,
+        }
 
-        # Join the docs gathered in the previous step
-        docs = "\n\n".join(state.get("docs", []))
+    def writer_messages(self, state: TopicState, docs: List[str]) -> List[AnyMessage]:
+        """Prompt for writing the section from scratch with the best evidence per subtopic"""
+        # Pick the passages gathered so far that best cover each subtopic, within the budget
+        content = build_evidence(
+            docs,
+            subtopic_queries(TOPIC_NAMES_MAPPING[state['topic']], SUBTOPICS_MAPPING[state['topic']]),
+            token_budget=self.context_budget,
+        )
         prompt = WRITER_PROMPT_TEMPLATE.invoke(
             {
                 "topic": TOPIC_NAMES_MAPPING[state['topic']],
                 "subtopics": SUBTOPICS_MAPPING[state['topic']],
-                "content": docs,
+                "content": content,
             }
         )
-
-        messages = [
+        return [
             SystemMessage(content=prompt.text),
             HumanMessage(content=state["company"]),
         ]
-        response = await call_model(
-            messages=messages,
-            model=self.model,
+
+    def revision_messages(self, state: TopicState, new_docs: List[str]) -> List[AnyMessage]:
+        """Prompt for revising the previous draft with the critique and the new docs"""
+        content = build_evidence(
+            new_docs,
+            subtopic_queries(
+                TOPIC_NAMES_MAPPING[state['topic']], SUBTOPICS_MAPPING[state['topic']], state["critique"]
+            ),
+            token_budget=self.context_budget,
         )
-        return {
-            "topic": state.get("topic"),
-            "draft": response.content,
-            "draft_number": state.get("draft_number", 0) + 1,
-        }
+        prompt = REVISION_PROMPT_TEMPLATE.invoke(
+            {
+                "topic": TOPIC_NAMES_MAPPING[state['topic']],
+                "subtopics": SUBTOPICS_MAPPING[state['topic']],
+                "draft": state["draft"],
+                "critique": state["critique"],
+                "content": content,
+            }
+        )
+        return [
+            SystemMessage(content=prompt.text),
+            HumanMessage(content=state["company"]),
+        ]
 
     def is_ready(self, state: TopicState) -> bool:
-        """Checks if the draft numbder has reached its max"""
-        return state.get("draft_number") == state.get("max_drafts")
+        """
+        Checks if the draft is done: the draft number has reached its max,
+        or revising has stopped paying off (see the STOP_* reasons)
+        """
+        return bool(state.get("stop_reason"))
     
-    def to_parent_graph(self, state: TopicState):
-        """Passes relevant TopicAgent output to parent graph"""
+    async def polish_node(self, state: TopicState):
+        """
+        Polishes the final draft of the section for publishing.
+        Runs as soon as this topic is done, so sections can be
+        streamed to the user without waiting for the other topics.
+        """
+        messages = [
+            SystemMessage(content=FINAL_REVISION_PROMPT),
+            HumanMessage(content=state["draft"]),
+        ]
+        response = await call_model(messages=messages, model=self.model)
+        return {"draft": response.content, "topic": state.get("topic")}
 
+    async def to_parent_graph(self, state: TopicState, writer: StreamWriter):
+        """
+        Passes relevant TopicAgent output to parent graph, and keeps the section for later runs.
+        The finished section is also written to the stream, for when polishing
+        wasn't streamed token by token (e.g. a cached model response).
+        """
+        topic, stop_reason = state['topic'], state.get("stop_reason")
+        increment("topic_loops_total", topic=topic, stop_reason=stop_reason)
+        increment("topic_drafts_total", state.get("draft_number", 0), topic=topic, stop_reason=stop_reason)
+        iterations = {
+            "drafts": state.get("draft_number", 0),
+            "stop_reason": stop_reason,
+            "prompt_tokens": state.get("prompt_tokens", []),
+        }
+        await sections.save(state['company'], topic, self.model.model_name, state['draft'], iterations)
+        writer(section_progress(topic, state['draft']))
         return {
-            "reports": {state['topic']: state['draft']},
-            "task_status": {state['topic']: "complete"},
+            "reports": {topic: state['draft']},
+            "task_status": {topic: "complete"},
+            "iterations": {topic: iterations},
         }
 
     async def critique_node(self, state: TopicState):
-        """Generates a critique for the draft"""
+        """Generates a critique for the draft, with a verdict on whether it needs more work"""
 
         prompt = CRITIQUE_PROMPT_TEMPLATE.invoke(
             {"topic": TOPIC_NAMES_MAPPING[state['topic']]}
@@ -169,8 +312,12 @@ class TopicAgent:
             SystemMessage(content=prompt.text),
             HumanMessage(content=state["draft"]),
         ]
-        response = await call_model(messages=messages, model=self.model)
-        return {"critique": response.content, "topic": state.get("topic"),}
+        critique = await call_model(messages=messages, model=self.model, output_type=Critique)
+        return {
+            "critique": critique.notes,
+            "stop_reason": STOP_ACCEPTABLE if critique.acceptable else "",
+            "topic": state.get("topic"),
+        }
 
     async def refine_node(self, state: TopicState):
         """Finds more relevant info based on notes from critique"""
@@ -184,44 +331,58 @@ class TopicAgent:
             model=self.model,
             output_type=SearchQueries,
         )
-        documents = state["docs"] or []
-        for query in search_queries.queries:
-            response = tavily.search(query=query, max_results=2)
-            for result in response["results"]:
-                documents.append(result["content"])
-
-        return {"docs": documents, "topic": state.get("topic")}
+        documents = DocumentStore(await corpus.load(state["docs"] or []))
+        responses = await search_all(
+            search_queries.queries,
+            requester=state['topic'],
+            max_results=2,
+            ttl=SEARCH_CACHE_TTL_SECONDS[state['topic']],
+        )
+        added = sum(
+            documents.extend(result["content"] for result in response["results"])
+            for response in responses
+        )
+        shared = documents.extend(shared_evidence(state['topic']))
+        increment("evidence_docs_shared_total", shared, topic=state['topic'])
+        added += shared
+        return {
+            "docs": await corpus.store(documents.docs),
+            "stop_reason": "" if added else STOP_NO_NEW_DOCS,
+            "topic": state.get("topic"),
+        }
 
 
 class CoordinatorAgent:
-    def __init__(self, model, task: str, task_id: str):
+    def __init__(self, model):
 
-        self.task = task
         self.model = model
-        self.task_id = task_id
         self.workflow = self.build()
 
     def build(self) -> StateGraph:
         """Builds CoordinatorAgent workflow"""
-        topic_agent = TopicAgent(self.model, self.task_id)
+        topic_agent = TopicAgent(self.model)
 
         # Add nodes
         workflow = StateGraph(ResearchState)
-        workflow.add_node("router", self.router_node)
+        workflow.add_node("router", instrument_node(self.router_node, "router"))
         workflow.add_node("topic_agent", topic_agent.workflow.compile())
-        workflow.add_node("aggregate", self.aggregate_node)
-        workflow.add_node("polish", self.formatting_node)
+        workflow.add_node("aggregate", instrument_node(self.aggregate_node, "aggregate"))
 
         # Add edges
         workflow.add_edge(START, "router")
-        workflow.add_conditional_edges("router", self.parent_fanout, ["topic_agent"])
+        workflow.add_conditional_edges("router", self.parent_fanout, ["topic_agent", "aggregate"])
         workflow.add_edge("topic_agent", "aggregate")
-        workflow.add_edge("aggregate", "polish")
-        workflow.add_edge("polish", END)
+        workflow.add_edge("aggregate", END)
         return workflow
 
     def parent_fanout(self, state: ResearchState):
-        """Sends relevant information to topic agents given user topics"""
+        """
+        Sends relevant information to topic agents given user topics,
+        skipping topics with a fresh section from an earlier run
+        """
+        stale = [topic for topic in state["topics"] if topic not in state.get("reports", {})]
+        if not stale:
+            return "aggregate"
         return [
             Send(
                 "topic_agent",
@@ -230,32 +391,30 @@ class CoordinatorAgent:
                     "topic": topic,
                     "max_drafts": state['max_drafts']
                 },
-            ) for topic in state["topics"]
+            ) for topic in stale
         ]
 
-    def router_node(self, state: ResearchState):
-        """Sends initial input to all topic agents"""
+    async def router_node(self, state: ResearchState, writer: StreamWriter):
+        """Sends initial input to all topic agents, and picks up the fresh sections of earlier runs"""
+        cached = await sections.load_fresh(state["company"], state["topics"], self.model.model_name)
+        for topic, section in cached.items():
+            writer(section_progress(topic, section["section"]))
         return {
             "company": state["company"],
             "max_drafts": state["max_drafts"],
-            "task_id": self.task_id,
+            "reports": {topic: section["section"] for topic, section in cached.items()},
+            "task_status": {topic: "cached" for topic in cached},
+            "iterations": {
+                topic: dict(section["iterations"], cached_at=section["created_at"].isoformat())
+                for topic, section in cached.items()
+            },
         }
 
     def aggregate_node(self, state: ResearchState):
-        """Aggregates results from topic agents"""
-
-        sections = "\n\n".join(state["reports"].values())
-        return {"final_report": sections}
-
-    async def formatting_node(self, state: ResearchState):
-        """Polishes the aggregataed report for publishing"""
-        prompt = FINAL_REVISION_PROMPT
-
-        messages = [
-            SystemMessage(content=prompt),
-            HumanMessage(content=state["final_report"]),
-        ]
-        response = await call_model(
-            messages=messages, model=self.model,
-        )
-        return {"final_report": response.content}
+        """
+        Stitches the results from topic agents into the final report,
+        in the order the user asked for them.
+        Sections are already polished by their topic agents (or were, by earlier runs).
+        """
+        ordered = [state["reports"][topic] for topic in state["topics"] if topic in state["reports"]]
+        return {"final_report": "\n\n".join(ordered)}
@@ -0,0 +1,203 @@
+"""Caching utilities for all agents to use"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from agents import metrics
+
+logger = logging.getLogger(__name__)
+
+# sentinel for cache misses, since None can be a legitimate cached value
+MISSING = object()
+
+
+class TTLCache:
+    """In-memory LRU cache whose entries expire after a per-entry TTL"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return MISSING
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return MISSING
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: float) -> None:
+        self._entries[key] = (value, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+class MongoCacheStore:
+    """
+    Persistent cache tier backed by a MongoDB collection.
+    Expired documents are pruned by a TTL index on `expires_at`.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def ensure_indexes(self) -> None:
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    async def get(self, key: str) -> Any:
+        """Returns a (value, remaining ttl in seconds) tuple, or MISSING"""
+        doc = await self.collection.find_one({"_id": key})
+        if doc is None:
+            return MISSING
+        # the TTL monitor only runs periodically, so double check expiry
+        expires_at = doc["expires_at"].replace(tzinfo=timezone.utc)
+        remaining = (expires_at - datetime.now(timezone.utc)).total_seconds()
+        if remaining <= 0:
+            return MISSING
+        return doc["value"], remaining
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        await self.collection.replace_one(
+            {"_id": key},
+            {
+                "value": value,
+                "expires_at": datetime.now(timezone.utc) + timedelta(seconds=ttl),
+            },
+            upsert=True,
+        )
+
+
+class InFlight:
+    """
+    Coalesces concurrent computations of the same key: the first caller
+    starts the computation and later callers wait for its result instead of
+    repeating it. The computation is cancelled only once all of its callers are.
+    """
+
+    def __init__(self):
+        # key -> [computation task, number of callers waiting for it]
+        self._flights: Dict[Hashable, list] = {}
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    async def run(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Returns the result of `compute()` and whether it was shared with an earlier caller"""
+        flight = self._flights.get(key)
+        shared = flight is not None
+        if flight is None:
+            task = asyncio.ensure_future(compute())
+            flight = self._flights[key] = [task, 0]
+            task.add_done_callback(lambda _: self._forget(key, flight))
+        task = flight[0]
+        flight[1] += 1
+        try:
+            # one caller going away must not cancel the others' result
+            return await asyncio.shield(task), shared
+        finally:
+            flight[1] -= 1
+            if flight[1] == 0 and not task.done():
+                task.cancel()
+                # later callers start over instead of joining the cancelled computation
+                self._forget(key, flight)
+
+    def _forget(self, key: Hashable, flight: list) -> None:
+        # a newer computation may have taken the key since
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+
+class TieredCache:
+    """
+    Two-tier cache: an in-memory LRU in front of an optional persistent store.
+    Errors from the persistent tier are logged and treated as misses,
+    so a flaky database never fails a research run.
+    """
+
+    def __init__(self, name: str, memory: TTLCache, store: Optional[MongoCacheStore] = None):
+        self.name = name
+        self.memory = memory
+        self.store = store
+        self.hits = {"memory": 0, "store": 0}
+        self.misses = 0
+        self.in_flight = InFlight()
+        self.shared = 0  # misses served by another caller's computation
+
+    async def get(self, key: str) -> Any:
+        value = self.memory.get(key)
+        if value is not MISSING:
+            self.hits["memory"] += 1
+            metrics.increment("cache_lookups_total", cache=self.name, result="memory_hit")
+            return value
+        if self.store is not None:
+            try:
+                entry = await self.store.get(key)
+            except Exception as e:
+                logger.warning("Cache store read failed: %r", e)
+                entry = MISSING
+            if entry is not MISSING:
+                self.hits["store"] += 1
+                metrics.increment("cache_lookups_total", cache=self.name, result="store_hit")
+                value, ttl = entry
+                self.memory.set(key, value, ttl)
+                return value
+        self.misses += 1
+        metrics.increment("cache_lookups_total", cache=self.name, result="miss")
+        return MISSING
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        self.memory.set(key, value, ttl)
+        if self.store is not None:
+            try:
+                await self.store.set(key, value, ttl)
+            except Exception as e:
+                logger.warning("Cache store write failed: %r", e)
+
+    async def get_or_compute(
+        self, key: str, compute: Callable[[], Awaitable[Any]], ttl: float
+    ) -> Tuple[Any, str]:
+        """
+        Returns the cached value for `key`, computing and caching it on a miss.
+        Callers missing the same key at the same time share one computation.
+        Also returns where the value came from: "hit", "shared" or "miss".
+        """
+        value = await self.get(key)
+        if value is not MISSING:
+            return value, "hit"
+
+        async def fill():
+            value = await compute()
+            await self.set(key, value, ttl)
+            return value
+
+        value, shared = await self.in_flight.run(key, fill)
+        if shared:
+            self.shared += 1
+            metrics.increment("cache_lookups_total", cache=self.name, result="shared")
+        return value, "shared" if shared else "miss"
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns hit/miss counters for monitoring"""
+        hits = sum(self.hits.values())
+        lookups = hits + self.misses
+        return {
+            "hits": dict(self.hits),
+            "misses": self.misses,
+            "shared": self.shared,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "memory_entries": len(self.memory),
+        }
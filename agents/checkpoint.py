@@ -0,0 +1,385 @@
+"""Checkpointer wrappers and maintenance"""
+
+import asyncio
+import contextvars
+import logging
+import os
+import socket
+import time
+from datetime import datetime, timedelta, timezone
+from inspect import signature
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+)
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.checkpoint.serde.base import SerializerProtocol
+from pymongo.errors import DuplicateKeyError
+
+from agents import metrics
+from agents.constants import (
+    CHECKPOINT_DURABILITY,
+    CHECKPOINT_FLUSH_SECONDS,
+    CHECKPOINT_FLUSH_SIZE,
+    CHECKPOINT_PRUNE_INTERVAL_SECONDS,
+    CHECKPOINT_RETENTION_SECONDS,
+)
+from agents.context import RunContext, bound_run, current_run
+
+logger = logging.getLogger(__name__)
+
+# threads whose checkpoints are deleted per query when pruning
+PRUNE_BATCH_SIZE = 500
+
+# Durability modes, see DurableCheckpointer
+EVERY_STEP = "every-step"
+BATCHED = "batched"
+BOUNDARY_ONLY = "boundary-only"
+DURABILITY_MODES = (EVERY_STEP, BATCHED, BOUNDARY_ONLY)
+
+
+class MeasuringSerializer(SerializerProtocol):
+    """Serializer that records how many bytes it produces, in total and per run"""
+
+    def __init__(self, serde: SerializerProtocol):
+        self.serde = serde
+
+    def _measure(self, data: bytes) -> None:
+        metrics.increment("checkpoint_bytes_total", len(data))
+        run = current_run()
+        if run is not None:
+            run.checkpoint_bytes += len(data)
+
+    def dumps(self, obj: Any) -> bytes:
+        data = self.serde.dumps(obj)
+        self._measure(data)
+        return data
+
+    def loads(self, data: bytes) -> Any:
+        return self.serde.loads(data)
+
+    def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+        type_, data = self.serde.dumps_typed(obj)
+        self._measure(data)
+        return type_, data
+
+    def loads_typed(self, data: Tuple[str, bytes]) -> Any:
+        return self.serde.loads_typed(data)
+
+
+class InstrumentedCheckpointer(BaseCheckpointSaver):
+    """
+    Delegates to another checkpointer, timing every read/write and
+    counting the bytes it serializes.
+    """
+
+    def __init__(self, saver: BaseCheckpointSaver):
+        saver.serde = MeasuringSerializer(saver.serde)
+        super().__init__(serde=saver.serde)
+        self.saver = saver
+        # older savers (e.g. the MongoDB one) don't take a task path
+        self._takes_task_path = "task_path" in signature(saver.aput_writes).parameters
+
+    @property
+    def config_specs(self):
+        return self.saver.config_specs
+
+    def get_next_version(self, current: Optional[Any], channel: Any) -> Any:
+        return self.saver.get_next_version(current, channel)
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        with metrics.timed("checkpoint", "get"):
+            return await self.saver.aget_tuple(config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        async for item in self.saver.alist(config, filter=filter, before=before, limit=limit):
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        with metrics.timed("checkpoint", "put"):
+            return await self.saver.aput(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        with metrics.timed("checkpoint", "put_writes"):
+            if self._takes_task_path:
+                await self.saver.aput_writes(config, writes, task_id, task_path)
+            else:
+                await self.saver.aput_writes(config, writes, task_id)
+
+
+class DurableCheckpointer(BaseCheckpointSaver):
+    """
+    Delegates to another checkpointer, persisting each step ("every-step"),
+    batches of steps in the background ("batched"), or only the latest
+    checkpoint when a run ends ("boundary-only", see `boundary`). Threads
+    running in this process are read from memory until then.
+    """
+
+    def __init__(
+        self,
+        saver: BaseCheckpointSaver,
+        mode: str = CHECKPOINT_DURABILITY,
+        flush_size: int = CHECKPOINT_FLUSH_SIZE,
+        flush_seconds: float = CHECKPOINT_FLUSH_SECONDS,
+    ):
+        if mode not in DURABILITY_MODES:
+            raise ValueError(f"Unknown checkpoint durability {mode!r}, expected one of {DURABILITY_MODES}")
+        super().__init__(serde=saver.serde)
+        self.saver = saver
+        self.mode = mode
+        self.flush_size = flush_size
+        self.flush_seconds = flush_seconds
+        self._takes_task_path = "task_path" in signature(saver.aput_writes).parameters
+        # checkpoints of the threads running in this process, not all persisted yet
+        self.local = MemorySaver()
+        # thread id -> operations not persisted yet, in order: ("put", args) or ("writes", args)
+        self._pending: Dict[str, List[Tuple[str, tuple]]] = {}
+        # thread id -> run that buffered its operations, charged for the bytes they serialize
+        self._runs: Dict[str, Optional[RunContext]] = {}
+        self._flush_lock = asyncio.Lock()
+        self._full = asyncio.Event()
+        self._flusher: Optional[asyncio.Task] = None
+
+    @property
+    def config_specs(self):
+        return self.saver.config_specs
+
+    def get_next_version(self, current: Optional[Any], channel: Any) -> Any:
+        return self.saver.get_next_version(current, channel)
+
+    def _buffered(self, config: Optional[RunnableConfig]) -> bool:
+        return config is not None and config["configurable"].get("thread_id") in self._pending
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        if self._buffered(config):
+            return await self.local.aget_tuple(config)
+        return await self.saver.aget_tuple(config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        source = self.local if self._buffered(config) else self.saver
+        async for item in source.alist(config, filter=filter, before=before, limit=limit):
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        if self.mode == EVERY_STEP:
+            return await self.saver.aput(config, checkpoint, metadata, new_versions)
+        self._buffer(config, "put", (config, checkpoint, metadata, new_versions))
+        return await self.local.aput(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        if self.mode == EVERY_STEP:
+            return await self._put_writes(config, writes, task_id, task_path)
+        self._buffer(config, "writes", (config, writes, task_id, task_path))
+        await self.local.aput_writes(config, writes, task_id, task_path)
+
+    async def _put_writes(self, config, writes, task_id, task_path) -> None:
+        if self._takes_task_path:
+            await self.saver.aput_writes(config, writes, task_id, task_path)
+        else:
+            await self.saver.aput_writes(config, writes, task_id)
+
+    def _buffer(self, config: RunnableConfig, kind: str, args: tuple) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        self._pending.setdefault(thread_id, []).append((kind, args))
+        self._runs[thread_id] = current_run()
+        if self.mode != BATCHED:
+            return
+        if sum(len(ops) for ops in self._pending.values()) >= self.flush_size:
+            self._full.set()
+        if self._flusher is None or self._flusher.done():
+            # in an empty context: the flusher outlives the run that started it,
+            # and flushes other runs' threads too (see _flush_thread)
+            self._flusher = contextvars.Context().run(asyncio.create_task, self._flush_later())
+
+    async def _flush_later(self) -> None:
+        while any(self._pending.values()):
+            # sooner once flush_size operations are pending
+            full = asyncio.ensure_future(self._full.wait())
+            try:
+                await asyncio.wait({full}, timeout=self.flush_seconds)
+            finally:
+                full.cancel()
+            self._full.clear()
+            try:
+                await self.flush()
+            except Exception:
+                # the operations stay pending and are retried by the next flush
+                logger.exception("Failed to flush checkpoints")
+
+    async def flush(self, thread_id: Optional[str] = None) -> None:
+        """Persists the pending operations of a thread, or of all threads"""
+        async with self._flush_lock:
+            threads = [thread_id] if thread_id is not None else list(self._pending)
+            await asyncio.gather(*(self._flush_thread(thread) for thread in threads))
+
+    async def _flush_thread(self, thread_id: str) -> None:
+        ops = list(self._pending.get(thread_id, []))
+        if not ops:
+            return
+        flushed = len(ops)
+        if self.mode == BOUNDARY_ONLY:
+            ops = _latest(ops)
+        # charge the bytes serialized, and the time taken, to the thread's run
+        with bound_run(self._runs.get(thread_id)):
+            with metrics.timed("checkpoint", "flush", mode=self.mode) as span:
+                for kind, args in ops:
+                    if kind == "put":
+                        await self.saver.aput(*args)
+                    else:
+                        await self._put_writes(*args)
+                span.update(operations=len(ops))
+        metrics.increment("checkpoint_flushed_total", len(ops), mode=self.mode)
+        # operations buffered while this flush ran stay pending
+        del self._pending[thread_id][:flushed]
+
+    async def boundary(self, thread_id: str) -> None:
+        """Ends a run of the thread: persists what's pending and drops the thread from memory"""
+        if self.mode == EVERY_STEP:
+            return
+        await self.flush(thread_id)
+        if not self._pending.get(thread_id):
+            self._pending.pop(thread_id, None)
+            self._runs.pop(thread_id, None)
+            self.local.storage.pop(thread_id, None)
+            for key in [key for key in self.local.writes if key[0] == thread_id]:
+                del self.local.writes[key]
+
+
+def _latest(ops: List[Tuple[str, tuple]]) -> List[Tuple[str, tuple]]:
+    """The last checkpoint of each namespace and the writes made against it"""
+    last_put: Dict[str, tuple] = {}
+    for kind, args in ops:
+        if kind == "put":
+            config, checkpoint = args[0], args[1]
+            last_put[config["configurable"]["checkpoint_ns"]] = (checkpoint["id"], args)
+    latest = [("put", args) for _, args in last_put.values()]
+    latest_ids = {(ns, checkpoint_id) for ns, (checkpoint_id, _) in last_put.items()}
+    for kind, args in ops:
+        if kind == "writes":
+            configurable = args[0]["configurable"]
+            if (configurable.get("checkpoint_ns", ""), configurable["checkpoint_id"]) in latest_ids:
+                latest.append((kind, args))
+    return latest
+
+
+async def checkpoint_boundary(checkpointer: Optional[BaseCheckpointSaver], config: RunnableConfig) -> None:
+    """Tells a DurableCheckpointer that a run of the thread in `config` has ended"""
+    if isinstance(checkpointer, DurableCheckpointer):
+        await checkpointer.boundary(config["configurable"]["thread_id"])
+
+
+def checkpoint_id_at(timestamp: float) -> str:
+    """
+    Lowest checkpoint id LangGraph could have generated at `timestamp`.
+    Checkpoint ids are UUIDv6, which sort by creation time.
+    """
+    # 100-ns intervals since the UUID epoch, 1582-10-15
+    ticks = int(timestamp * 10_000_000) + 0x01B21DD213814000
+    value = ((ticks >> 12) & 0xFFFFFFFFFFFF) << 80 | 6 << 76 | (ticks & 0x0FFF) << 64 | 0b10 << 62
+    return str(UUID(int=value))
+
+
+async def ensure_indexes(checkpoints, writes) -> None:
+    """Indexes the MongoDB checkpoint collections for lookups and pruning by thread"""
+    await checkpoints.create_index([("thread_id", 1), ("checkpoint_ns", 1), ("checkpoint_id", -1)])
+    await writes.create_index([("thread_id", 1), ("checkpoint_ns", 1), ("checkpoint_id", -1)])
+
+
+async def prune_threads(checkpoints, writes, retention: float = CHECKPOINT_RETENTION_SECONDS) -> int:
+    """
+    Deletes the checkpoints and writes of threads idle for `retention` seconds,
+    judged by their time-ordered checkpoint ids; returns how many were pruned
+    """
+    cutoff = checkpoint_id_at(time.time() - retention)
+    with metrics.timed("checkpoint", "prune") as span:
+        cursor = await checkpoints.aggregate([
+            {"$group": {"_id": "$thread_id", "latest": {"$max": "$checkpoint_id"}}},
+            {"$match": {"latest": {"$lt": cutoff}}},
+        ])
+        threads = [doc["_id"] async for doc in cursor]
+        for start in range(0, len(threads), PRUNE_BATCH_SIZE):
+            batch = {"thread_id": {"$in": threads[start:start + PRUNE_BATCH_SIZE]}}
+            await checkpoints.delete_many(batch)
+            await writes.delete_many(batch)
+        span.update(threads=len(threads))
+    metrics.increment("checkpoint_threads_pruned_total", len(threads))
+    return len(threads)
+
+
+async def take_lease(leases, name: str, holder: str, duration: float) -> bool:
+    """Takes or renews the lease `name` for `duration` seconds; returns whether `holder` has it"""
+    now = datetime.now(timezone.utc)
+    try:
+        await leases.update_one(
+            {"_id": name, "$or": [{"holder": holder}, {"expires_at": {"$lt": now}}]},
+            {"$set": {"holder": holder, "expires_at": now + timedelta(seconds=duration)}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        # the lease exists and someone else holds it, so the upsert tried to insert it again
+        return False
+    return True
+
+
+async def prune_periodically(
+    checkpoints,
+    writes,
+    leases,
+    interval: float = CHECKPOINT_PRUNE_INTERVAL_SECONDS,
+) -> None:
+    """Prunes old threads every `interval` seconds, in whichever process holds the pruning lease"""
+    holder = f"{socket.gethostname()}:{os.getpid()}"
+    while True:
+        try:
+            if await take_lease(leases, "checkpoint-pruner", holder, interval * 2):
+                pruned = await prune_threads(checkpoints, writes)
+                if pruned:
+                    logger.info("Pruned the checkpoints of %d old threads", pruned)
+        except Exception:
+            logger.exception("Failed to prune old checkpoints")
+        await asyncio.sleep(interval)
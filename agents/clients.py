@@ -0,0 +1,78 @@
+"""
+Process-wide network clients, created on first use and shared by all requests.
+Nothing connects at import time, so a launcher can import the app once and
+fork workers (see gunicorn.conf.py); each worker opens its own connections.
+"""
+
+import logging
+import os
+from typing import Dict
+
+import httpx
+from pymongo import AsyncMongoClient
+from pymongo.server_api import ServerApi
+
+from agents.constants import (
+    HTTP_KEEPALIVE_EXPIRY_SECONDS,
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    MONGO_MAX_POOL_SIZE,
+    MONGO_SERVER_SELECTION_TIMEOUT_MS,
+)
+
+logger = logging.getLogger(__name__)
+
+# provider -> pooled HTTP client
+_http: Dict[str, httpx.AsyncClient] = {}
+_mongo = None
+
+
+def http_client(provider: str, **kwargs) -> httpx.AsyncClient:
+    """
+    Returns the HTTP client of `provider` (e.g. "openai", "search"), creating it
+    on first use; `kwargs` (base_url, timeout, ...) only apply then. Its keep-alive
+    connections are reused by every call to the provider, sparing a TLS handshake per call.
+    """
+    if provider not in _http:
+        _http[provider] = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SECONDS,
+            ),
+            **kwargs,
+        )
+    return _http[provider]
+
+
+def mongo_client() -> AsyncMongoClient:
+    """Returns the MongoDB client, creating it on first use; it connects in the background"""
+    global _mongo
+    if _mongo is None:
+        _mongo = AsyncMongoClient(
+            os.environ.get("MONGO_URI"),
+            server_api=ServerApi("1"),
+            uuidRepresentation="standard",
+            maxPoolSize=MONGO_MAX_POOL_SIZE,
+            serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        )
+    return _mongo
+
+
+async def ping_mongo() -> None:
+    """Raises if MongoDB can't be reached"""
+    await mongo_client().admin.command("ping")
+
+
+async def close() -> None:
+    """Closes the clients created so far; later calls create new ones"""
+    global _mongo
+    for provider, client in list(_http.items()):
+        try:
+            await client.aclose()
+        except Exception as e:
+            logger.warning("Closing the %s client failed: %r", provider, e)
+    _http.clear()
+    if _mongo is not None:
+        await _mongo.close()
+        _mongo = None
@@ -1,12 +1,93 @@
 """Application constants"""
 
-from typing import Mapping, Sequence
+from typing import Any, Mapping, Sequence, Tuple
 
 DEFAULT_MAX_REVISIONS: int = 2
+MAX_REVISIONS_LIMIT: int = 5  # most drafts per topic a request can ask for
+# consecutive drafts at least this similar (0-1) end the revision loop early
+DRAFT_CONVERGENCE_THRESHOLD: float = 0.9
+
+# Search concurrency limits
+SEARCH_MAX_CONCURRENCY: int = 16  # in-flight searches across the whole process
+SEARCH_MAX_CONCURRENCY_PER_REQUEST: int = 6  # in-flight searches per research request
+SEARCH_TIMEOUT_SECONDS: float = 20.0
+SEARCH_REQUESTS_PER_MINUTE: int = 100
+
+# Model tiers: each graph node calls the model of its profile, see agents.llm.ModelRouter
+MODEL_PROFILES: Mapping[str, Mapping[str, Any]] = {
+    # long-form drafting and the HTML polish
+    "writer": {"model": "gpt-4o-mini", "temperature": 0.1, "max_tokens": 4096, "timeout": 90.0},
+    # short structured tasks: search queries and critiques
+    "fast": {"model": "gpt-4.1-nano", "temperature": 0.0, "max_tokens": 1024, "timeout": 20.0},
+}
+NODE_MODEL_PROFILES: Mapping[str, str] = {
+    "research_node": "fast",
+    "refine_node": "fast",
+    "critique_node": "fast",
+    "generate_node": "writer",
+    "polish_node": "writer",
+}
+DEFAULT_MODEL_PROFILE: str = "writer"  # for nodes not listed above
+# USD per million (prompt, completion) tokens, for the llm_cost_usd_total metric
+MODEL_PRICES_PER_MILLION_TOKENS: Mapping[str, Tuple[float, float]] = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4.1-nano": (0.10, 0.40),
+}
+
+# OpenAI rate limits, see agents.scheduler
+OPENAI_REQUESTS_PER_MINUTE: int = 500
+OPENAI_TOKENS_PER_MINUTE: int = 200_000
+OPENAI_MAX_CONCURRENCY: int = 32
+OPENAI_TARGET_LATENCY_SECONDS: float = 30.0  # slower responses shrink the concurrency limit
+SEARCH_TARGET_LATENCY_SECONDS: float = 8.0
+LLM_EXPECTED_COMPLETION_TOKENS: int = 800  # reserved per call until the actual usage is known
+
+# Retries and backoff of rate-limited calls
+SCHEDULER_MAX_RETRIES: int = 4
+SCHEDULER_RETRY_BASE_DELAY_SECONDS: float = 0.5
+SCHEDULER_RETRY_MAX_DELAY_SECONDS: float = 20.0
+SCHEDULER_DECREASE_COOLDOWN_SECONDS: float = 2.0  # min time between two concurrency cuts
+
+# Writer context
+WRITER_CONTEXT_TOKEN_BUDGET: int = 6000  # max tokens of documents in the writer prompt
+# "delta": revisions get the previous draft, the critique and only the documents found since;
+# "full": every draft is written from scratch from all documents
+WRITER_REVISION_MODE: str = "delta"
+# a delta revision shorter than this fraction of the previous draft is redone in full
+REVISION_MIN_LENGTH_RATIO: float = 0.5
+NEAR_DUPLICATE_THRESHOLD: float = 0.8  # estimated Jaccard similarity above which docs are duplicates
+# Evidence selection: documents are split into overlapping passages, ranked with BM25
+PASSAGE_WORDS: int = 120
+PASSAGE_OVERLAP_WORDS: int = 20
+PASSAGES_PER_QUERY: int = 3  # passages per subtopic (and for the reviewer's notes)
+
+# Evidence shared by the topic agents of a run
+QUERY_SIMILARITY_THRESHOLD: float = 0.75  # word overlap (Jaccard) above which two queries are the same search
+EVIDENCE_SHARE_MIN_TERMS: int = 2  # subtopic words a document must mention to be offered to another topic
 
 MONGO_DB_NAME = "checkpoints"
 MONGO_CHECKPOINTS_COLLECTION_NAME = "state_snapshots"
 MONGO_WRITES_COLLECTION_NAME = "state_snapshots_writes"
+MONGO_SEARCH_CACHE_COLLECTION_NAME = "search_cache"
+MONGO_LLM_CACHE_COLLECTION_NAME = "llm_cache"
+MONGO_JOBS_COLLECTION_NAME = "jobs"
+MONGO_JOB_EVENTS_COLLECTION_NAME = "job_events"
+MONGO_SECTIONS_COLLECTION_NAME = "sections"
+MONGO_DOCUMENTS_COLLECTION_NAME = "documents"
+MONGO_LEASES_COLLECTION_NAME = "leases"
+
+# Research documents, stored once by content hash, see agents.corpus
+CORPUS_MEMORY_MAX_ENTRIES: int = 8192  # documents kept in this process
+CORPUS_MEMORY_TTL_SECONDS: int = 60 * 60
+# Checkpoints of threads without activity for this long are pruned, see agents.checkpoint
+CHECKPOINT_RETENTION_SECONDS: int = 7 * 24 * 60 * 60
+CHECKPOINT_PRUNE_INTERVAL_SECONDS: int = 60 * 60
+# "every-step", "batched" or "boundary-only", see agents.checkpoint.DurableCheckpointer
+CHECKPOINT_DURABILITY: str = "every-step"
+CHECKPOINT_FLUSH_SIZE: int = 64  # batched: checkpoints and writes persisted together
+CHECKPOINT_FLUSH_SECONDS: float = 0.5  # batched: max time a checkpoint waits to be persisted
+# documents outlive the checkpoints that reference them
+CORPUS_RETENTION_SECONDS: int = CHECKPOINT_RETENTION_SECONDS + 24 * 60 * 60
 
 BACKGROUND_INFO = "background"
 FINANCIAL_HEALTH = "financial_health"
@@ -34,14 +115,68 @@ SUBTOPICS_MAPPING: Mapping[str, str] = {
     BACKGROUND_INFO: "Mission, vision, history, leadership, company culture",
 }
 
+# How long search results stay fresh, per topic (seconds)
+SEARCH_CACHE_TTL_SECONDS: Mapping[str, int] = {
+    RECENT_NEWS: 60 * 60,
+    FINANCIAL_HEALTH: 6 * 60 * 60,
+    MARKET_POSITION: 24 * 60 * 60,
+    BACKGROUND_INFO: 7 * 24 * 60 * 60,
+}
+SEARCH_CACHE_DEFAULT_TTL_SECONDS: int = 60 * 60
+
+# How long a finished section is reused by later research of the same company, per topic (seconds)
+SECTION_FRESHNESS_SECONDS: Mapping[str, int] = {
+    RECENT_NEWS: 60 * 60,
+    FINANCIAL_HEALTH: 24 * 60 * 60,
+    MARKET_POSITION: 3 * 24 * 60 * 60,
+    BACKGROUND_INFO: 30 * 24 * 60 * 60,
+}
+SEARCH_CACHE_MAX_ENTRIES: int = 2048  # in-memory tier size
+
+# LLM response cache
+LLM_CACHE_TTL_SECONDS: int = 24 * 60 * 60
+LLM_CACHE_MAX_ENTRIES: int = 1024  # in-memory tier size
+
+# Report streaming: tokens are sent in batches of up to this size/age
+TOKEN_BATCH_MAX_CHARS: int = 256
+TOKEN_BATCH_MAX_DELAY_SECONDS: float = 0.05
+DISCONNECT_POLL_SECONDS: float = 2.0  # check for a gone client after this long without events
+
+# Background research jobs, see server/jobs.py
+JOB_WORKERS: int = 4  # jobs run concurrently by each worker process
+JOB_POLL_SECONDS: float = 1.0  # how often idle workers and remote readers check for news
+JOB_HEARTBEAT_SECONDS: float = 10.0
+JOB_STALE_SECONDS: float = 60.0  # a running job without heartbeat for this long is taken over
+JOB_ABANDON_SECONDS: float = 30.0  # jobs that ask for it are cancelled once nobody has followed them this long
+JOB_EVENT_FLUSH_SIZE: int = 32  # job events are persisted in batches of up to this many
+JOB_EVENT_FLUSH_SECONDS: float = 0.5  # ... or at least this often
+JOB_RETENTION_SECONDS: int = 7 * 24 * 60 * 60
+
+# Batch research, see server/batch.py
+BATCH_MAX_CONCURRENCY: int = 8  # companies researched at a time
+BATCH_MAX_COMPANIES: int = 200
+
 NODE_TO_TEXT: Mapping[str, str] = {
     "router": "Initializing search...",
     "research_node": "Drafting the {topic} section...",
     "generate_node": "Finished drafting the {topic} section...",
     "critique_node": "Revising the {topic} section...",
     "refine_node": "Redrafting {topic} section...",
+    "polish_node": "Polishing the {topic} section...",
     "topic_agent": "Finished the {topic} section...",
     "to_parent_node": "Finished the {topic} section...",
     "aggregate": "Final touches...",
-    "polish": ""
 }
+
+# Shared clients, see agents.clients
+HTTP_MAX_CONNECTIONS: int = 100  # per provider (OpenAI, search), per process
+HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 32
+HTTP_KEEPALIVE_EXPIRY_SECONDS: float = 30.0
+MONGO_MAX_POOL_SIZE: int = 50
+MONGO_SERVER_SELECTION_TIMEOUT_MS: int = 5000
+
+# Process lifecycle, see server/lifecycle.py
+HEALTH_CHECK_TIMEOUT_SECONDS: float = 2.0
+HEALTH_CHECK_INTERVAL_SECONDS: float = 10.0  # /readyz reuses a dependency check this recent
+DRAIN_TIMEOUT_SECONDS: float = 30.0  # in-flight requests get this long to finish on shutdown
+WEB_WORKERS: int = 2  # gunicorn web worker processes (WEB_CONCURRENCY)
@@ -0,0 +1,53 @@
+"""Per-request run context shared by all agents working on one research task"""
+
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+from agents.constants import SEARCH_MAX_CONCURRENCY_PER_REQUEST
+from agents.evidence import EvidencePool
+
+
+@dataclass
+class RunContext:
+    """State scoped to a single research run (i.e. one /research request)"""
+
+    task_id: Optional[str] = None
+    started_at: float = field(default_factory=time.monotonic)
+    search_semaphore: asyncio.Semaphore = field(
+        default_factory=lambda: asyncio.Semaphore(SEARCH_MAX_CONCURRENCY_PER_REQUEST)
+    )
+    trace: List[Dict[str, Any]] = field(default_factory=list)  # timed spans, see agents.metrics
+    evidence: EvidencePool = field(default_factory=EvidencePool)  # queries and docs shared by topics
+    checkpoint_bytes: int = 0  # serialized by the checkpointer, see agents.checkpoint
+
+
+_current_run: ContextVar[Optional[RunContext]] = ContextVar("current_run", default=None)
+
+
+def current_run() -> Optional[RunContext]:
+    """Returns the context of the run being executed, if any"""
+    return _current_run.get()
+
+
+@contextmanager
+def run_context(**kwargs) -> Iterator[RunContext]:
+    """
+    Binds a new RunContext for the duration of the block.
+    Tasks spawned inside the block (e.g. parallel graph nodes) inherit it.
+    """
+    with bound_run(RunContext(**kwargs)) as context:
+        yield context
+
+
+@contextmanager
+def bound_run(context: Optional[RunContext]) -> Iterator[Optional[RunContext]]:
+    """Binds an existing RunContext (or none) for the duration of the block"""
+    token = _current_run.set(context)
+    try:
+        yield context
+    finally:
+        _current_run.reset(token)
@@ -0,0 +1,106 @@
+"""Content-addressed storage of research documents"""
+
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Sequence
+
+from pymongo import UpdateOne
+
+from agents import metrics
+from agents.cache import MISSING, TTLCache
+from agents.constants import CORPUS_MEMORY_MAX_ENTRIES, CORPUS_MEMORY_TTL_SECONDS, CORPUS_RETENTION_SECONDS
+from agents.documents import content_hash
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryCorpusStore:
+    """Document store kept in this process, for development and benchmarks"""
+
+    def __init__(self):
+        self.docs: Dict[str, str] = {}
+
+    async def ensure_indexes(self) -> None:
+        pass
+
+    async def get_many(self, refs: Iterable[str]) -> Dict[str, str]:
+        return {ref: self.docs[ref] for ref in refs if ref in self.docs}
+
+    async def put_many(self, docs: Dict[str, str]) -> None:
+        self.docs.update(docs)
+
+
+class MongoCorpusStore:
+    """
+    Document store backed by a MongoDB collection, shared by all processes.
+    Each document is written once under its hash; documents no run has
+    stored for CORPUS_RETENTION_SECONDS are pruned by a TTL index on `used_at`.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def ensure_indexes(self) -> None:
+        await self.collection.create_index("used_at", expireAfterSeconds=CORPUS_RETENTION_SECONDS)
+
+    async def get_many(self, refs: Iterable[str]) -> Dict[str, str]:
+        cursor = self.collection.find({"_id": {"$in": list(refs)}})
+        return {doc["_id"]: doc["text"] for doc in await cursor.to_list(None)}
+
+    async def put_many(self, docs: Dict[str, str]) -> None:
+        now = datetime.now(timezone.utc)
+        await self.collection.bulk_write(
+            [
+                UpdateOne({"_id": ref}, {"$setOnInsert": {"text": text}, "$set": {"used_at": now}}, upsert=True)
+                for ref, text in docs.items()
+            ],
+            ordered=False,
+        )
+
+
+_store = MemoryCorpusStore()
+# documents recently stored or loaded by this process; an entry expires after
+# CORPUS_MEMORY_TTL_SECONDS so documents still in use get their `used_at` refreshed
+_memory = TTLCache(CORPUS_MEMORY_MAX_ENTRIES)
+
+
+def set_store(store) -> None:
+    """Sets where documents are kept (MemoryCorpusStore or MongoCorpusStore)"""
+    global _store
+    _store = store
+    _memory.clear()
+
+
+async def store(texts: Sequence[str]) -> List[str]:
+    """Stores documents, writing only those this process hasn't recently, and returns their refs"""
+    refs = [content_hash(text) for text in texts]
+    # size of the text behind the refs the node returns (its state only carries the refs)
+    size = sum(len(text) for text in texts)
+    metrics.observe("node_doc_bytes", size, metrics.SIZE_BUCKETS, **metrics.current_node())
+    new = {ref: text for ref, text in zip(refs, texts) if _memory.get(ref) is MISSING}
+    if new:
+        with metrics.timed("corpus", "put") as span:
+            span.update(docs=len(new))
+            await _store.put_many(new)
+        metrics.increment("corpus_docs_total", len(new), name="put")
+        for ref, text in new.items():
+            _memory.set(ref, text, CORPUS_MEMORY_TTL_SECONDS)
+    return refs
+
+
+async def load(refs: Sequence[str]) -> List[str]:
+    """Returns the documents behind `refs`, in order; documents that were pruned are skipped"""
+    texts = {ref: _memory.get(ref) for ref in refs}
+    missing = [ref for ref, text in texts.items() if text is MISSING]
+    if missing:
+        with metrics.timed("corpus", "get") as span:
+            span.update(docs=len(missing))
+            found = await _store.get_many(missing)
+        metrics.increment("corpus_docs_total", len(missing), name="get")
+        for ref, text in found.items():
+            _memory.set(ref, text, CORPUS_MEMORY_TTL_SECONDS)
+            texts[ref] = text
+        if len(found) < len(missing):
+            logger.warning("%d of %d documents are no longer stored", len(missing) - len(found), len(refs))
+            metrics.increment("corpus_docs_missing_total", len(missing) - len(found))
+    return [texts[ref] for ref in refs if texts[ref] is not MISSING]
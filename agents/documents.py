@@ -0,0 +1,115 @@
+"""Document deduplication and text utilities"""
+
+import difflib
+import hashlib
+import math
+import re
+from collections import defaultdict
+from functools import lru_cache
+from typing import Dict, Iterable, List, Set, Tuple
+
+from agents.constants import NEAR_DUPLICATE_THRESHOLD
+
+SHINGLE_SIZE = 5  # words per shingle
+MINHASH_BANDS = 16
+MINHASH_ROWS = 4  # rows per band; MINHASH_BANDS * MINHASH_ROWS permutations
+CHARS_PER_TOKEN = 4  # rough average for English text with OpenAI tokenizers
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+# fixed seeds keep signatures stable across processes
+_PERMUTATIONS = [
+    (
+        int.from_bytes(hashlib.blake2b(f"a{i}".encode(), digest_size=8).digest(), "big") % _MERSENNE_PRIME | 1,
+        int.from_bytes(hashlib.blake2b(f"b{i}".encode(), digest_size=8).digest(), "big") % _MERSENNE_PRIME,
+    )
+    for i in range(MINHASH_BANDS * MINHASH_ROWS)
+]
+
+
+def tokenize(text: str) -> List[str]:
+    return re.findall(r"\w+", text.lower())
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token count estimate, good enough for budgeting prompts"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def content_hash(text: str) -> str:
+    """Hash of the document text, insensitive to case and whitespace"""
+    return hashlib.sha1(" ".join(text.lower().split()).encode()).hexdigest()
+
+
+def text_similarity(a: str, b: str) -> float:
+    """Similarity (0-1) of two texts, word by word"""
+    return difflib.SequenceMatcher(None, tokenize(a), tokenize(b), autojunk=False).ratio()
+
+
+@lru_cache(maxsize=4096)
+def minhash(text: str) -> Tuple[int, ...]:
+    """MinHash signature of the document's word shingles"""
+    words = tokenize(text)
+    shingles = {
+        int.from_bytes(
+            hashlib.blake2b(" ".join(words[i:i + SHINGLE_SIZE]).encode(), digest_size=4).digest(),
+            "big",
+        )
+        for i in range(max(len(words) - SHINGLE_SIZE + 1, 1))
+    }
+    return tuple(
+        min(((a * shingle + b) % _MERSENNE_PRIME) & _MAX_HASH for shingle in shingles)
+        for a, b in _PERMUTATIONS
+    )
+
+
+def similarity(sig1: Tuple[int, ...], sig2: Tuple[int, ...]) -> float:
+    """Estimated Jaccard similarity of the documents behind two signatures"""
+    return sum(h1 == h2 for h1, h2 in zip(sig1, sig2)) / len(sig1)
+
+
+class DocumentStore:
+    """
+    Ordered collection of documents that drops exact and near duplicates on insert.
+    Near duplicates are found with MinHash + LSH banding, so an insert only
+    compares against documents that share at least one band.
+    """
+
+    def __init__(self, docs: Iterable[str] = (), threshold: float = NEAR_DUPLICATE_THRESHOLD):
+        self.threshold = threshold
+        self.docs: List[str] = []
+        self._hashes: Set[str] = set()
+        self._signatures: List[Tuple[int, ...]] = []
+        self._buckets: Dict[Tuple, List[int]] = defaultdict(list)
+        self.extend(docs)
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def add(self, text: str) -> bool:
+        """Adds a document; returns False if it was a duplicate"""
+        if not text or not text.strip():
+            return False
+        digest = content_hash(text)
+        if digest in self._hashes:
+            return False
+
+        signature = minhash(text)
+        bands = [
+            (band, signature[band * MINHASH_ROWS:(band + 1) * MINHASH_ROWS])
+            for band in range(MINHASH_BANDS)
+        ]
+        candidates = {index for band in bands for index in self._buckets.get(band, [])}
+        if any(similarity(signature, self._signatures[i]) >= self.threshold for i in candidates):
+            return False
+
+        for band in bands:
+            self._buckets[band].append(len(self.docs))
+        self.docs.append(text)
+        self._hashes.add(digest)
+        self._signatures.append(signature)
+        return True
+
+    def extend(self, texts: Iterable[str]) -> int:
+        """Adds documents; returns how many were new"""
+        return sum(self.add(text) for text in texts)
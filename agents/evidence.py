@@ -0,0 +1,70 @@
+"""Search queries and documents shared by the topic agents of one research run"""
+
+from collections import defaultdict
+from typing import Any, Dict, FrozenSet, Hashable, Iterable, List, Set, Tuple
+
+from agents.constants import EVIDENCE_SHARE_MIN_TERMS, QUERY_SIMILARITY_THRESHOLD, SUBTOPICS_MAPPING
+from agents.documents import DocumentStore, content_hash, tokenize
+
+
+def topic_terms(topic: str) -> Set[str]:
+    """Words of the topic's subtopics, e.g. {"revenue", "profits", "debt", ...}"""
+    return set(tokenize(SUBTOPICS_MAPPING.get(topic, "")))
+
+
+def _jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+class EvidencePool:
+    """
+    Evidence gathered by all topic agents of one research run.
+
+    Topic agents often come up with the same or nearly the same queries
+    (e.g. "<company> revenue 2024" for both financial health and market
+    position); a query whose words overlap enough with one already made
+    in this run is replaced by that earlier query, so it's served by the
+    search cache (or shares the call still in flight) instead of paying
+    for a new search. Documents found for one topic are offered to the
+    other topics whose subtopics they mention.
+    """
+
+    def __init__(self, threshold: float = QUERY_SIMILARITY_THRESHOLD):
+        self.threshold = threshold
+        # every query asked for: {"topic", "query", "searched"}, "searched" being the query sent
+        self.requests: List[Dict[str, Any]] = []
+        self.documents = DocumentStore()
+        self._queries: Dict[Hashable, List[Tuple[FrozenSet[str], str]]] = defaultdict(list)
+        self._requesters: Dict[str, Set[str]] = {}  # doc content hash -> topics that found it
+
+    def resolve(self, query: str, topic: str, scope: Hashable = None) -> Tuple[str, bool]:
+        """
+        Returns the query to search for `query` asked by `topic`, and whether
+        it's shared: an earlier, near-identical query of the run with the same
+        `scope` (the search parameters), or `query` itself.
+        """
+        terms = frozenset(tokenize(query))
+        for known_terms, known in self._queries[scope]:
+            if _jaccard(terms, known_terms) >= self.threshold:
+                searched, shared = known, True
+                break
+        else:
+            self._queries[scope].append((terms, query))
+            searched, shared = query, False
+        self.requests.append({"topic": topic, "query": query, "searched": searched})
+        return searched, shared
+
+    def add(self, topic: str, texts: Iterable[str]) -> None:
+        """Adds documents found by `topic`"""
+        for text in texts:
+            if self.documents.add(text) or content_hash(text) in self._requesters:
+                self._requesters.setdefault(content_hash(text), set()).add(topic)
+
+    def shared_with(self, topic: str) -> List[str]:
+        """Documents found by other topics that mention enough of `topic`'s subtopics"""
+        terms = topic_terms(topic)
+        return [
+            doc for doc in self.documents.docs
+            if topic not in self._requesters[content_hash(doc)]
+            and len(terms.intersection(tokenize(doc))) >= EVIDENCE_SHARE_MIN_TERMS
+        ]
@@ -1,27 +1,274 @@
 """LLM-related functions for all agents to use"""
 
-from typing import List, Optional, TypedDict
+import asyncio
+import hashlib
+import json
+import os
+from typing import Any, Dict, List, Mapping, Optional, Tuple, Type, Union
+
+import openai
 from pydantic import BaseModel
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import AnyMessage
+from langchain_core.callbacks import BaseCallbackHandler, BaseCallbackManager
+from langchain_core.messages import AIMessage, AnyMessage
+from langchain_core.runnables import Runnable, RunnableConfig
+from langchain_core.runnables.config import ensure_config
 from langchain_openai import ChatOpenAI
 
+from agents import metrics
+from agents.cache import MongoCacheStore, TieredCache, TTLCache
+from agents.constants import (
+    DEFAULT_MODEL_PROFILE,
+    LLM_CACHE_MAX_ENTRIES,
+    LLM_CACHE_TTL_SECONDS,
+    LLM_EXPECTED_COMPLETION_TOKENS,
+    MODEL_PRICES_PER_MILLION_TOKENS,
+    MODEL_PROFILES,
+    NODE_MODEL_PROFILES,
+    OPENAI_MAX_CONCURRENCY,
+    OPENAI_REQUESTS_PER_MINUTE,
+    OPENAI_TARGET_LATENCY_SECONDS,
+    OPENAI_TOKENS_PER_MINUTE,
+)
+from agents.documents import estimate_tokens
+from agents.scheduler import Scheduler
 
-async def call_model(
+# set LLM_CACHE=0 to always call the model
+CACHE_ENABLED = os.environ.get("LLM_CACHE", "1") != "0"
+
+# model responses, keyed on a hash of everything that determines them
+cache = TieredCache("llm", TTLCache(LLM_CACHE_MAX_ENTRIES))
+
+# admits every OpenAI call in the process; models should be created with
+# max_retries=0 so rate-limit errors reach it instead of being retried blindly
+scheduler = Scheduler(
+    "openai",
+    requests_per_minute=OPENAI_REQUESTS_PER_MINUTE,
+    tokens_per_minute=OPENAI_TOKENS_PER_MINUTE,
+    max_concurrency=OPENAI_MAX_CONCURRENCY,
+    target_latency=OPENAI_TARGET_LATENCY_SECONDS,
+    overload_on=(openai.RateLimitError,),
+    retry_on=(openai.APIConnectionError, openai.InternalServerError),
+)
+
+# structured-output runnables, bound once per (model, schema)
+_structured_models: Dict[Tuple[int, Type[BaseModel]], Tuple[ChatOpenAI, Runnable]] = {}
+
+
+class ModelRouter:
+    """
+    Routes the calls of each graph node to the model of its profile
+    (see MODEL_PROFILES and NODE_MODEL_PROFILES), so short structured tasks
+    can run on a faster tier than drafting. Agents take one in place of a
+    single model; call_model resolves it for the node being executed.
+
+    Parameters:
+        models (dict): model of each profile
+        nodes (dict): profile of each node
+        default (str): profile of nodes that aren't listed
+    """
+
+    def __init__(
+        self,
+        models: Mapping[str, ChatOpenAI],
+        nodes: Mapping[str, str] = NODE_MODEL_PROFILES,
+        default: str = DEFAULT_MODEL_PROFILE,
+    ):
+        self.models = dict(models)
+        self.nodes = dict(nodes)
+        self.default = default
+
+    @classmethod
+    def from_profiles(cls, profiles: Mapping[str, Mapping[str, Any]] = MODEL_PROFILES, **kwargs) -> "ModelRouter":
+        """Creates a model per profile; `kwargs` are settings shared by all of them"""
+        models = {
+            name: ChatOpenAI(
+                model=profile["model"],
+                temperature=profile["temperature"],
+                max_tokens=profile["max_tokens"],
+                timeout=profile["timeout"],
+                **kwargs,
+            )
+            for name, profile in profiles.items()
+        }
+        return cls(models)
+
+    def for_node(self, node: Optional[str]) -> ChatOpenAI:
+        return self.models[self.nodes.get(node, self.default)]
+
+    @property
+    def model_name(self) -> str:
+        """Which model each node uses, e.g. to key compiled graphs and cached sections"""
+        routes = {node: self.for_node(node).model_name for node in sorted(self.nodes)}
+        routes["*"] = self.for_node(None).model_name
+        return ",".join(f"{node}={name}" for node, name in routes.items())
+
+
+class TokenWatcher(BaseCallbackHandler):
+    """Notes whether a model call has streamed any tokens"""
+
+    run_inline = True
+
+    def __init__(self):
+        self.streamed = False
+
+    def on_llm_new_token(self, token: str, **kwargs) -> None:
+        self.streamed = True
+
+
+def watched_config(watcher: TokenWatcher) -> RunnableConfig:
+    """The config of the node being executed, with `watcher` added to its callbacks"""
+    config = ensure_config()
+    callbacks = config.get("callbacks")
+    if isinstance(callbacks, BaseCallbackManager):
+        callbacks = callbacks.copy()
+        callbacks.add_handler(watcher, inherit=True)
+    else:
+        callbacks = [*(callbacks or []), watcher]
+    return {"callbacks": callbacks}
+
+
+def set_cache_store(store: Optional[MongoCacheStore]) -> None:
+    """Attaches a persistent tier to the LLM response cache"""
+    cache.store = store
+
+
+def structured_model(model: ChatOpenAI, output_type: Type[BaseModel]) -> Runnable:
+    """Returns the model bound to the output schema, binding it on first use"""
+    key = (id(model), output_type)
+    if key not in _structured_models:
+        # keep a reference to the model so its id can't be reused
+        _structured_models[key] = (model, model.with_structured_output(output_type, include_raw=True))
+    return _structured_models[key][1]
+
+
+def cache_key(
     messages: List[AnyMessage],
     model: ChatOpenAI,
+    output_type: Optional[Type[BaseModel]] = None,
+) -> str:
+    """Stable hash of the model settings, messages and output schema"""
+    # every request parameter of the model (its tier's max_tokens, top_p, seed, ...)
+    settings = dict(getattr(model, "_identifying_params", {}))
+    # streaming changes how the response arrives, not what it is
+    settings.pop("stream", None)
+    payload = {
+        "model": getattr(model, "model_name", type(model).__name__),
+        "temperature": getattr(model, "temperature", None),
+        "settings": settings,
+        "messages": [[message.type, message.content] for message in messages],
+        "schema": output_type.model_json_schema() if output_type is not None else None,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+async def call_model(
+    messages: List[AnyMessage],
+    model: Union[ChatOpenAI, ModelRouter],
     output_type: Optional[BaseModel] = None,
-) -> str:  # type: ignore
+    cache_response: bool = True,
+    refresh: bool = False,
+) -> Any:
     """
     Calls OpenAI model with the given messages and returns (structured) output.
+    Identical calls are served from the response cache, and concurrent
+    identical calls share a single model call.
 
     Parameters:
-        model (str): name of the model to use, from [...]
-        temperature (float): temperature to use for model
         messages (list): list of LangGraph messages to send to the model
-        output_type (TypedDict): type of structured output to return
+        model (ChatOpenAI or ModelRouter): the model to call, or the models of each node
+        output_type (BaseModel): type of structured output to return
+        cache_response (bool): set to False to bypass the cache entirely
+        refresh (bool): skip the cache lookup but store the fresh response
     """
+    if isinstance(model, ModelRouter):
+        model = model.for_node(metrics.current_node().get("node"))
+    use_cache = CACHE_ENABLED and cache_response
+    labels = dict(metrics.current_node(), model=getattr(model, "model_name", None))
+    if not use_cache:
+        return await _invoke(messages, model, output_type, labels)
+
+    key = cache_key(messages, model, output_type)
+    if refresh:
+        response = await _invoke(messages, model, output_type, labels)
+        await cache.set(key, _dump(response, output_type), LLM_CACHE_TTL_SECONDS)
+        return response
+
+    async def compute() -> Dict[str, Any]:
+        return _dump(await _invoke(messages, model, output_type, labels), output_type)
+
+    # identical prompts running at the same time (e.g. across a batch) share one call
+    value, source = await cache.get_or_compute(key, compute, LLM_CACHE_TTL_SECONDS)
+    if source != "miss":
+        metrics.increment("llm_calls_total", cache=source, **metrics.current_node())
+    return _load(value, output_type)
+
+
+async def _invoke(
+    messages: List[AnyMessage],
+    model: ChatOpenAI,
+    output_type: Optional[Type[BaseModel]],
+    labels: Dict[str, Any],
+) -> Any:
+    """Sends the messages to the model through the scheduler, recording latency and token usage"""
+    metrics.increment("llm_calls_total", cache="miss", **labels)
+    try:
+        runnable = model if output_type is None else structured_model(model, output_type)
+        estimate = _estimate_prompt_tokens(messages) + LLM_EXPECTED_COMPLETION_TOKENS
+        # tokens streamed to the client (see the messages stream mode) can't be taken
+        # back, so a call that fails after streaming some isn't retried
+        watcher = TokenWatcher()
+        config = watched_config(watcher)
+        with metrics.timed("llm", "structured" if output_type else "text", **labels) as span:
+            response = await scheduler.run(
+                lambda: runnable.ainvoke(input=messages, config=config),
+                tokens=estimate,
+                retry_if=lambda: not watcher.streamed,
+            )
+            raw = response if output_type is None else None
+            # structured models are bound with include_raw so token usage stays visible
+            if output_type is not None and isinstance(response, dict) and "parsed" in response:
+                if response.get("parsing_error"):
+                    raise response["parsing_error"]
+                response, raw = response["parsed"], response["raw"]
+            span.update(_token_usage(messages, raw))
+            scheduler.settle(span["prompt_tokens"] + span["completion_tokens"] - estimate)
+    except asyncio.CancelledError:
+        # e.g. the client went away; count the work we didn't pay for
+        metrics.increment("llm_calls_cancelled_total")
+        raise
+    metrics.increment("llm_prompt_tokens_total", span["prompt_tokens"], **labels)
+    metrics.increment("llm_completion_tokens_total", span["completion_tokens"], **labels)
+    prices = MODEL_PRICES_PER_MILLION_TOKENS.get(labels.get("model"))
+    if prices is not None:
+        cost = (span["prompt_tokens"] * prices[0] + span["completion_tokens"] * prices[1]) / 1_000_000
+        metrics.increment("llm_cost_usd_total", cost, **labels)
+    return response
+
+
+def _token_usage(messages: List[AnyMessage], raw: Optional[AIMessage]) -> Dict[str, int]:
+    """Token counts reported by the API, or estimated when they're missing"""
+    usage = getattr(raw, "usage_metadata", None)
+    if usage:
+        return {"prompt_tokens": usage["input_tokens"], "completion_tokens": usage["output_tokens"]}
+    return {
+        "prompt_tokens": _estimate_prompt_tokens(messages),
+        "completion_tokens": estimate_tokens(str(raw.content)) if raw is not None else 0,
+    }
+
+
+def _estimate_prompt_tokens(messages: List[AnyMessage]) -> int:
+    return sum(estimate_tokens(str(message.content)) for message in messages)
+
+
+def _dump(response: Any, output_type: Optional[Type[BaseModel]]) -> Dict[str, Any]:
+    """Converts a model response to a JSON-serializable cache value"""
     if output_type is None:
-        return await model.ainvoke(input=messages)
-    else:
-        return await model.with_structured_output(output_type).ainvoke(input=messages)
+        return {"content": response.content}
+    return response.model_dump()
+
+
+def _load(value: Dict[str, Any], output_type: Optional[Type[BaseModel]]) -> Any:
+    """Rebuilds a model response from its cached value"""
+    if output_type is None:
+        return AIMessage(content=value["content"])
+    return output_type.model_validate(value)
@@ -0,0 +1,201 @@
+"""Process-wide metrics and per-run timing traces"""
+
+import functools
+import inspect
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langgraph.types import StreamWriter
+
+from agents.context import current_run
+from agents.progress import node_progress
+
+# upper bounds of histogram buckets, in seconds
+LATENCY_BUCKETS: Sequence[float] = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# upper bounds of histogram buckets for sizes (tokens, bytes, counts)
+SIZE_BUCKETS: Sequence[float] = (10, 100, 1_000, 10_000, 100_000, 1_000_000)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# (name, labels) -> value
+_counters: Dict[Tuple[str, Labels], float] = defaultdict(float)
+# (name, labels) -> [bucket counts..., sum, count]
+_histograms: Dict[Tuple[str, Labels], List[float]] = {}
+_buckets: Dict[str, Sequence[float]] = {}
+# (name, labels) -> latest value
+_gauges: Dict[Tuple[str, Labels], float] = {}
+
+# labels of the graph node being executed, so calls made inside it are tagged
+_current_node: ContextVar[Dict[str, Any]] = ContextVar("current_node", default={})
+
+
+def current_node() -> Dict[str, Any]:
+    """Returns {"node", "topic"} labels of the graph node being executed"""
+    return _current_node.get()
+
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+def increment(metric: str, value: float = 1, **labels) -> None:
+    """Adds `value` to the counter `metric` with the given labels"""
+    _counters[(metric, _labels(labels))] += value
+
+
+def set_gauge(metric: str, value: float, **labels) -> None:
+    """Sets the gauge `metric` with the given labels to `value`"""
+    _gauges[(metric, _labels(labels))] = value
+
+
+def observe(metric: str, value: float, buckets: Sequence[float] = LATENCY_BUCKETS, **labels) -> None:
+    """Records `value` in the histogram `metric` with the given labels"""
+    bounds = _buckets.setdefault(metric, buckets)
+    key = (metric, _labels(labels))
+    if key not in _histograms:
+        _histograms[key] = [0.0] * (len(bounds) + 2)
+    histogram = _histograms[key]
+    for i, bound in enumerate(bounds):
+        if value <= bound:
+            histogram[i] += 1
+    histogram[-2] += value
+    histogram[-1] += 1
+
+
+def record_span(kind: str, span_name: str, start: float, duration: float, **attributes) -> None:
+    """Appends a timed span to the trace of the current run, if any"""
+    run = current_run()
+    if run is None:
+        return
+    run.trace.append({
+        "kind": kind,
+        "name": span_name,
+        "start": round(start - run.started_at, 4),
+        "duration": round(duration, 4),
+        **{k: v for k, v in attributes.items() if v is not None},
+    })
+
+
+@contextmanager
+def timed(kind: str, span_name: str, **labels) -> Iterator[Dict[str, Any]]:
+    """
+    Times the block, recording a `<kind>_duration_seconds` histogram and
+    a trace span. The yielded dict collects extra span attributes.
+    """
+    attributes: Dict[str, Any] = {}
+    start = time.monotonic()
+    status = "error"
+    try:
+        yield attributes
+        status = "ok"
+    finally:
+        duration = time.monotonic() - start
+        observe(f"{kind}_duration_seconds", duration, name=span_name, status=status, **labels)
+        record_span(kind, span_name, start, duration, status=status, **labels, **attributes)
+
+
+def instrument_node(node: Callable, name: str) -> Callable:
+    """
+    Wraps a graph node so each call is timed and tagged by node and topic,
+    the number of documents it returns is recorded, and a progress event
+    (see agents.progress) is written to the `custom` stream.
+    Nodes that take a `writer` get it passed on, to write their own events.
+    """
+    passes_writer = "writer" in inspect.signature(node).parameters
+
+    def record(result: Optional[Dict[str, Any]], attributes: Dict[str, Any], topic: Optional[str]) -> None:
+        docs = (result or {}).get("docs") if isinstance(result, dict) else None
+        # `docs` holds references; their size is recorded by agents.corpus.store
+        if docs is not None:
+            attributes.update(docs=len(docs))
+            observe("node_docs", len(docs), SIZE_BUCKETS, node=name, topic=topic)
+
+    if inspect.iscoroutinefunction(node):
+        async def wrapper(state, writer: StreamWriter):
+            topic = state.get("topic")
+            token = _current_node.set({"node": name, "topic": topic})
+            start = time.monotonic()
+            try:
+                with timed("node", name, topic=topic) as attributes:
+                    result = await (node(state, writer=writer) if passes_writer else node(state))
+                    record(result, attributes, topic)
+            finally:
+                _current_node.reset(token)
+            writer(node_progress(name, state, result, time.monotonic() - start))
+            return result
+    else:
+        def wrapper(state, writer: StreamWriter):
+            topic = state.get("topic")
+            token = _current_node.set({"node": name, "topic": topic})
+            start = time.monotonic()
+            try:
+                with timed("node", name, topic=topic) as attributes:
+                    result = node(state, writer=writer) if passes_writer else node(state)
+                    record(result, attributes, topic)
+            finally:
+                _current_node.reset(token)
+            writer(node_progress(name, state, result, time.monotonic() - start))
+            return result
+    functools.update_wrapper(wrapper, node)
+    # LangGraph injects `writer` by looking at the signature, which must be the wrapper's own
+    del wrapper.__wrapped__
+    return wrapper
+
+
+def snapshot() -> Dict[str, Dict[str, float]]:
+    """Returns all counters and gauges as {name: {"label=value,...": value}}"""
+    values = defaultdict(dict)
+    for (name, labels), value in [*_counters.items(), *_gauges.items()]:
+        values[name][",".join(f"{k}={v}" for k, v in labels)] = value
+    return dict(values)
+
+
+def summarize_trace(trace: List[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    """Totals of a run's trace per span kind and name"""
+    summary: Dict[str, Dict[str, float]] = defaultdict(lambda: {"count": 0, "seconds": 0.0})
+    for span in trace:
+        entry = summary[f"{span['kind']}:{span['name']}"]
+        entry["count"] += 1
+        entry["seconds"] = round(entry["seconds"] + span["duration"], 4)
+    return dict(summary)
+
+
+def _format_labels(labels: Labels, extra: Labels = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    escaped = (
+        (k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in pairs
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+def render_prometheus() -> str:
+    """Renders all metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in sorted({name for name, _ in _counters}):
+        lines.append(f"# TYPE {metric} counter")
+        for (name, labels), value in sorted(_counters.items()):
+            if name == metric:
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+    for metric in sorted({name for name, _ in _gauges}):
+        lines.append(f"# TYPE {metric} gauge")
+        for (name, labels), value in sorted(_gauges.items()):
+            if name == metric:
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+    for metric in sorted({name for name, _ in _histograms}):
+        bounds = _buckets[metric]
+        lines.append(f"# TYPE {metric} histogram")
+        for (name, labels), histogram in sorted(_histograms.items()):
+            if name != metric:
+                continue
+            for bound, count in zip(bounds, histogram):
+                lines.append(f"{name}_bucket{_format_labels(labels, (('le', str(bound)),))} {count}")
+            lines.append(f"{name}_bucket{_format_labels(labels, (('le', '+Inf'),))} {histogram[-1]}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {histogram[-2]}")
+            lines.append(f"{name}_count{_format_labels(labels)} {histogram[-1]}")
+    return "\n".join(lines) + "\n"
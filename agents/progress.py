@@ -0,0 +1,44 @@
+"""Small progress events graph nodes emit on the `custom` stream channel"""
+
+from typing import Any, Dict, Optional, TypedDict
+
+# kinds of progress events
+NODE = "node"  # a node finished a step
+SECTION = "section"  # a section is done without having been streamed (e.g. reused from an earlier run)
+
+
+class NodeProgress(TypedDict):
+    kind: str
+    node: str
+    topic: Optional[str]
+    iteration: int  # drafts written so far
+    docs: int  # documents gathered so far
+    elapsed: float  # seconds the step took
+
+
+class SectionProgress(TypedDict):
+    kind: str
+    topic: str
+    text: str
+
+
+def node_progress(
+    node: str,
+    state: Dict[str, Any],
+    result: Optional[Dict[str, Any]],
+    elapsed: float,
+) -> NodeProgress:
+    """Summarizes a finished step from the node's input state and its update"""
+    latest = {**state, **result} if isinstance(result, dict) else state
+    return {
+        "kind": NODE,
+        "node": node,
+        "topic": latest.get("topic"),
+        "iteration": latest.get("draft_number") or 0,
+        "docs": len(latest.get("docs") or []),
+        "elapsed": round(elapsed, 3),
+    }
+
+
+def section_progress(topic: str, text: str) -> SectionProgress:
+    return {"kind": SECTION, "topic": topic, "text": text}
@@ -26,12 +26,37 @@ Generate an insightful section about the company's {topic}. Use the information
 {content}
 """
 )
+REVISION_PROMPT_TEMPLATE = PromptTemplate.from_template(
+    """ \
+You are a professional writer revising the {topic} section of a company research analysis \
+for the user's company. \
+This section should provide insights on things like {subtopics}. \
+Revise the current draft below to address the reviewer's notes, \
+using the new information below where it helps. \
+Keep what is already good and output the complete revised section.
+------
+Current draft:
+
+{draft}
+------
+Reviewer's notes:
+
+{critique}
+------
+New information:
+
+{content}
+"""
+)
+
 CRITIQUE_PROMPT_TEMPLATE = PromptTemplate.from_template(
     """ \
 You are a writing instructor reviewing the {topic} section of a company analysis. \
 Provide detailed recommendations for the user's draft. \
 If you think it deviates from the sections topic ({topic}), \
 or could use more information, make sure to note it. \
+Mark the draft as acceptable only if it is on topic, well supported \
+and would not improve substantively with more research. \
 """
 )
 
@@ -0,0 +1,43 @@
+"""Registry of compiled research graphs"""
+
+from typing import Dict, Hashable, Sequence, Union
+
+from langchain_openai import ChatOpenAI
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langgraph.graph.state import CompiledStateGraph
+
+from agents.agents import CoordinatorAgent
+from agents.llm import ModelRouter
+
+
+class GraphRegistry:
+    """
+    Builds and compiles each research graph variant once and shares it
+    across requests. Per-request values (company, topics, max_drafts) travel
+    in the graph state, and the task id travels in the `thread_id` config,
+    so a compiled graph is safe to reuse concurrently.
+    """
+
+    def __init__(
+        self,
+        checkpointer: BaseCheckpointSaver,
+        interrupt_before: Sequence[str] = (),
+    ):
+        self.checkpointer = checkpointer
+        self.interrupt_before = list(interrupt_before)
+        self._graphs: Dict[Hashable, CompiledStateGraph] = {}
+
+    def register(self, key: Hashable, model: Union[ChatOpenAI, ModelRouter]) -> CompiledStateGraph:
+        """Compiles the graph variant for the given model (or models per node) and stores it under `key`"""
+        agent = CoordinatorAgent(model=model)
+        self._graphs[key] = agent.workflow.compile(
+            checkpointer=self.checkpointer,
+            interrupt_before=self.interrupt_before,
+        )
+        return self._graphs[key]
+
+    def get(self, key: Hashable) -> CompiledStateGraph:
+        return self._graphs[key]
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._graphs
@@ -0,0 +1,116 @@
+"""In-process passage index with BM25 ranking, for picking the writer's evidence"""
+
+import heapq
+import math
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+from agents.constants import PASSAGE_OVERLAP_WORDS, PASSAGE_WORDS, PASSAGES_PER_QUERY
+from agents.documents import estimate_tokens, tokenize
+
+# standard BM25 parameters: term frequency saturation and length normalization
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+
+def chunk(text: str, size: int = PASSAGE_WORDS, overlap: int = PASSAGE_OVERLAP_WORDS) -> List[str]:
+    """Splits a document into passages of `size` words, overlapping by `overlap` words"""
+    words = text.split()
+    if len(words) <= size:
+        return [" ".join(words)] if words else []
+    step = size - overlap
+    return [" ".join(words[start:start + size]) for start in range(0, len(words) - overlap, step)]
+
+
+class PassageIndex:
+    """
+    BM25 index over the passages of a set of documents.
+    Cheap enough to rebuild from the topic's documents for every draft.
+    """
+
+    def __init__(self, docs: Iterable[str] = ()):
+        self.passages: List[str] = []
+        self.lengths: List[int] = []
+        # term -> [(passage index, term frequency), ...]
+        self.postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        for doc in docs:
+            self.add(doc)
+
+    def __len__(self) -> int:
+        return len(self.passages)
+
+    def add(self, doc: str) -> None:
+        for passage in chunk(doc):
+            index = len(self.passages)
+            terms = tokenize(passage)
+            self.passages.append(passage)
+            self.lengths.append(len(terms))
+            for term, count in Counter(terms).items():
+                self.postings[term].append((index, count))
+
+    def search(self, query: str, k: int) -> List[int]:
+        """Indices of the (at most) `k` passages that best match the query, best first"""
+        if not self.passages:
+            return []
+        n = len(self.passages)
+        average_length = sum(self.lengths) / n
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for index, count in postings:
+                length_norm = 1 - BM25_B + BM25_B * self.lengths[index] / average_length
+                scores[index] += idf * count * (BM25_K1 + 1) / (count + BM25_K1 * length_norm)
+        return heapq.nlargest(k, scores, key=lambda index: (scores[index], -index))
+
+    def select(self, queries: Mapping[str, str], k: int, token_budget: int) -> Dict[str, List[str]]:
+        """
+        Picks the top `k` passages for each named query within `token_budget`.
+        Queries take turns, best passages first, so the budget is shared
+        fairly between them; a passage is used for one query at most.
+        """
+        ranked = {name: self.search(query, k) for name, query in queries.items()}
+        selected: Dict[str, List[str]] = {name: [] for name in queries}
+        used, tokens = set(), 0
+        for rank in range(k):
+            for name, indices in ranked.items():
+                if rank >= len(indices) or indices[rank] in used:
+                    continue
+                passage = self.passages[indices[rank]]
+                cost = estimate_tokens(passage)
+                if tokens + cost > token_budget:
+                    continue
+                used.add(indices[rank])
+                selected[name].append(passage)
+                tokens += cost
+        return selected
+
+
+def subtopic_queries(topic_name: str, subtopics: str, critique: Optional[str] = None) -> Dict[str, str]:
+    """One query per subtopic (e.g. "Mission, vision, ..."), plus the reviewer's notes if any"""
+    queries = {
+        subtopic.strip(): f"{topic_name} {subtopic.strip()}"
+        for subtopic in subtopics.split(",") if subtopic.strip()
+    }
+    if critique:
+        queries["Reviewer's notes"] = critique
+    return queries
+
+
+def build_evidence(
+    docs: Iterable[str],
+    queries: Mapping[str, str],
+    token_budget: int,
+    k: int = PASSAGES_PER_QUERY,
+) -> str:
+    """
+    Indexes the documents' passages and returns the top `k` per query
+    within `token_budget`, grouped under the query names, as a prompt block.
+    """
+    selected = PassageIndex(docs).select(queries, k, token_budget)
+    return "\n\n".join(
+        f"### {name}\n" + "\n\n".join(passages)
+        for name, passages in selected.items() if passages
+    )
@@ -0,0 +1,264 @@
+"""Process-wide scheduling of calls to rate-limited providers (OpenAI, search)"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, Type, TypeVar
+
+from agents import metrics
+from agents.constants import (
+    SCHEDULER_DECREASE_COOLDOWN_SECONDS,
+    SCHEDULER_MAX_RETRIES,
+    SCHEDULER_RETRY_BASE_DELAY_SECONDS,
+    SCHEDULER_RETRY_MAX_DELAY_SECONDS,
+)
+from agents.context import current_run
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# factors the concurrency limit is multiplied by on overload / slow responses
+OVERLOAD_BACKOFF = 0.5
+LATENCY_BACKOFF = 0.9
+
+
+class TokenBucket:
+    """Allows `rate_per_minute` units per minute, with bursts of up to a minute's worth"""
+
+    def __init__(self, rate_per_minute: float):
+        self.rate = rate_per_minute / 60
+        self.capacity = float(rate_per_minute)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1) -> None:
+        """Waits until `amount` units are available and takes them"""
+        # a single call larger than the bucket still goes through once it's full
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.level >= amount:
+                    self.level -= amount
+                    return
+                await asyncio.sleep((amount - self.level) / self.rate)
+
+    def adjust(self, amount: float) -> None:
+        """Takes (or gives back) units after the fact, e.g. once actual token usage is known"""
+        self._refill()
+        self.level = min(self.capacity, self.level - amount)
+
+
+def request_priority() -> float:
+    """
+    Priority of calls made by the current run: the run's start time, so
+    older requests go first and started reports finish before new ones
+    get going. Calls made outside a run are queued by arrival.
+    """
+    run = current_run()
+    return run.started_at if run is not None else time.monotonic()
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Seconds the provider asked us to wait, if the error carries a Retry-After header"""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    try:
+        return float(headers.get("retry-after")) if headers else None
+    except (TypeError, ValueError):
+        return None
+
+
+class Scheduler:
+    """
+    Admits calls to one provider so a burst of traffic degrades throughput
+    gracefully instead of tipping everyone into rate-limit errors.
+
+    - Request and token budgets per minute are enforced with token buckets.
+    - Concurrency adapts (AIMD): it grows by about one slot per window of
+      fast successes and is cut multiplicatively on overload errors (429s)
+      or responses slower than `target_latency`.
+    - Waiting calls are admitted oldest request first.
+    - Overload and transient errors are retried with jittered exponential
+      backoff, honouring the provider's Retry-After.
+
+    Parameters:
+        name (str): provider name, used as a metric label
+        requests_per_minute (float): request budget
+        max_concurrency (int): upper bound of the adaptive concurrency limit
+        tokens_per_minute (float): token budget, if the provider has one
+        min_concurrency (int): lower bound of the adaptive concurrency limit
+        target_latency (float): seconds above which a response counts as slow
+        overload_on (tuple): exception types that signal overload (e.g. 429s)
+        retry_on (tuple): further exception types worth retrying
+        max_retries (int): retries per call before the error is raised
+    """
+
+    def __init__(
+        self,
+        name: str,
+        requests_per_minute: float,
+        max_concurrency: int,
+        tokens_per_minute: Optional[float] = None,
+        min_concurrency: int = 1,
+        target_latency: float = 30.0,
+        overload_on: Tuple[Type[BaseException], ...] = (),
+        retry_on: Tuple[Type[BaseException], ...] = (),
+        max_retries: int = SCHEDULER_MAX_RETRIES,
+    ):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.target_latency = target_latency
+        self.overload_on = overload_on
+        self.retry_on = overload_on + retry_on
+        self.max_retries = max_retries
+
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self._waiters: List[Tuple[float, int, asyncio.Future]] = []  # heap of (priority, seq, future)
+        self._sequence = itertools.count()
+        self._resume_at = 0.0  # no calls are started before this time after an overload
+        self._last_decrease = 0.0
+        self._record_limit()
+
+    async def run(
+        self,
+        call: Callable[[], Awaitable[T]],
+        tokens: float = 0,
+        priority: Optional[float] = None,
+        retry_if: Optional[Callable[[], bool]] = None,
+    ) -> T:
+        """
+        Runs `call()` once a slot and enough rate budget are available,
+        retrying it on overload and transient errors.
+
+        Parameters:
+            call (callable): returns a new awaitable for each attempt
+            tokens (float): estimated tokens the call will use
+            priority (float): lower runs first; defaults to the request's start time
+            retry_if (callable): whether a failed attempt may be retried, e.g. not
+                once part of its output has been streamed to the client
+        """
+        if priority is None:
+            priority = request_priority()
+        for attempt in itertools.count():
+            queued_at = time.monotonic()
+            await self._acquire(priority)
+            try:
+                await self._wait_for_budget(tokens)
+                metrics.observe("scheduler_wait_seconds", time.monotonic() - queued_at, scheduler=self.name)
+                start = time.monotonic()
+                try:
+                    result = await call()
+                except self.retry_on as error:
+                    failure = error
+                    self._on_failure(error)
+                    if attempt >= self.max_retries or (retry_if is not None and not retry_if()):
+                        raise
+                else:
+                    self._on_success(time.monotonic() - start)
+                    return result
+            finally:
+                self._release()
+
+            delay = self._backoff(attempt, failure)
+            metrics.increment("scheduler_retries_total", scheduler=self.name, error=type(failure).__name__)
+            logger.info("%s call failed with %r, retrying in %.1fs", self.name, failure, delay)
+            await asyncio.sleep(delay)
+
+    def settle(self, tokens: float) -> None:
+        """Corrects the token budget by the difference between actual and estimated usage"""
+        if self.tokens is not None and tokens:
+            self.tokens.adjust(tokens)
+
+    async def _acquire(self, priority: float) -> None:
+        """Waits for a concurrency slot; waiters are admitted in priority order"""
+        if not self._waiters and self.in_flight < self._slots():
+            self.in_flight += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        self._wake()  # in case the queue only held cancelled waiters
+        try:
+            await future
+        except asyncio.CancelledError:
+            # the slot may have been handed over just before the cancellation
+            if future.done() and not future.cancelled():
+                self._release()
+            raise
+
+    def _release(self) -> None:
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters and self.in_flight < self._slots():
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():  # cancelled while waiting
+                continue
+            self.in_flight += 1
+            future.set_result(None)
+
+    def _slots(self) -> int:
+        return max(self.min_concurrency, int(self.limit))
+
+    async def _wait_for_budget(self, tokens: float) -> None:
+        delay = self._resume_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await self.requests.acquire()
+        if self.tokens is not None and tokens:
+            await self.tokens.acquire(tokens)
+
+    def _on_success(self, latency: float) -> None:
+        if latency > self.target_latency:
+            self._decrease(LATENCY_BACKOFF)
+        elif self.limit < self.max_concurrency:
+            # additive increase: about one more slot per `limit` successes
+            self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            self._record_limit()
+            self._wake()
+
+    def _on_failure(self, error: BaseException) -> None:
+        if not isinstance(error, self.overload_on):
+            return
+        self._decrease(OVERLOAD_BACKOFF)
+        wait = retry_after(error)
+        if wait:
+            self._resume_at = max(self._resume_at, time.monotonic() + wait)
+
+    def _decrease(self, factor: float) -> None:
+        now = time.monotonic()
+        # calls that were in flight together tend to fail together; count them once
+        if now - self._last_decrease < SCHEDULER_DECREASE_COOLDOWN_SECONDS:
+            return
+        self._last_decrease = now
+        self.limit = max(float(self.min_concurrency), self.limit * factor)
+        self._record_limit()
+
+    def _backoff(self, attempt: int, error: BaseException) -> float:
+        """Full-jitter exponential backoff, but no sooner than the provider asked for"""
+        ceiling = min(SCHEDULER_RETRY_MAX_DELAY_SECONDS, SCHEDULER_RETRY_BASE_DELAY_SECONDS * 2**attempt)
+        return max(random.uniform(0, ceiling), retry_after(error) or 0)
+
+    def _record_limit(self) -> None:
+        metrics.set_gauge("scheduler_concurrency_limit", self._slots(), scheduler=self.name)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "limit": self._slots(),
+            "in_flight": self.in_flight,
+            "waiting": sum(not future.done() for _, _, future in self._waiters),
+        }
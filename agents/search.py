@@ -0,0 +1,205 @@
+"""Async web search layer for all agents to use"""
+
+import asyncio
+import logging
+import os
+import re
+from contextlib import AsyncExitStack
+from typing import Any, Dict, List, Optional, Sequence
+
+import httpx
+from tavily.errors import InvalidAPIKeyError, MissingAPIKeyError, UsageLimitExceededError
+
+from agents import clients, metrics
+from agents.cache import MongoCacheStore, TieredCache, TTLCache
+from agents.constants import (
+    SEARCH_CACHE_DEFAULT_TTL_SECONDS,
+    SEARCH_CACHE_MAX_ENTRIES,
+    SEARCH_MAX_CONCURRENCY,
+    SEARCH_REQUESTS_PER_MINUTE,
+    SEARCH_TARGET_LATENCY_SECONDS,
+    SEARCH_TIMEOUT_SECONDS,
+)
+from agents.context import current_run
+from agents.scheduler import Scheduler
+
+logger = logging.getLogger(__name__)
+
+# admits search calls across the whole process, shared by all requests
+scheduler = Scheduler(
+    "search",
+    requests_per_minute=SEARCH_REQUESTS_PER_MINUTE,
+    max_concurrency=SEARCH_MAX_CONCURRENCY,
+    target_latency=SEARCH_TARGET_LATENCY_SECONDS,
+    overload_on=(UsageLimitExceededError,),
+    retry_on=(httpx.TransportError,),
+)
+_client = None
+TAVILY_API_URL = "https://api.tavily.com"
+# parameters AsyncTavilyClient.search sends unless told otherwise; sent here too,
+# so results don't change with the client (e.g. `days` limits news searches)
+TAVILY_SEARCH_DEFAULTS: Dict[str, Any] = {
+    "search_depth": "basic",
+    "topic": "general",
+    "days": 3,
+    "max_results": 5,
+    "include_domains": None,
+    "exclude_domains": None,
+    "include_answer": False,
+    "include_raw_content": False,
+    "include_images": False,
+}
+# search results, keyed on the normalized query and search parameters
+cache = TieredCache("search", TTLCache(SEARCH_CACHE_MAX_ENTRIES))
+
+
+class TavilySearchClient:
+    """
+    Tavily search over the process's pooled connections (see agents.clients);
+    AsyncTavilyClient opens a new connection, and TLS handshake, for every search.
+    """
+
+    def __init__(self, api_key: Optional[str] = None):
+        self.api_key = api_key or os.environ.get("TAVILY_API_KEY")
+        if not self.api_key:
+            raise MissingAPIKeyError()
+
+    async def search(self, query: str, **kwargs) -> Dict[str, Any]:
+        http = clients.http_client("search", base_url=TAVILY_API_URL, timeout=SEARCH_TIMEOUT_SECONDS)
+        payload = {"api_key": self.api_key, "query": query, **TAVILY_SEARCH_DEFAULTS, **kwargs}
+        response = await http.post("/search", json=payload)
+        if response.status_code == 429:
+            raise UsageLimitExceededError(response.text)
+        if response.status_code == 401:
+            raise InvalidAPIKeyError()
+        response.raise_for_status()
+        return response.json()
+
+
+def get_client():
+    """Returns the search client, creating it on first use"""
+    global _client
+    if _client is None:
+        _client = TavilySearchClient()
+    return _client
+
+
+async def check_client() -> None:
+    """Raises if searches can't be made, e.g. when TAVILY_API_KEY isn't set"""
+    get_client()
+
+
+def set_client(client) -> None:
+    """Replaces the search client (any object with an async `search` method)"""
+    global _client
+    _client = client
+
+
+def set_cache_store(store: Optional[MongoCacheStore]) -> None:
+    """Attaches a persistent tier to the search cache"""
+    cache.store = store
+
+
+def normalize_query(query: str) -> str:
+    """Normalizes a query so trivially different phrasings share a cache entry"""
+    query = re.sub(r"[^\w\s]", " ", query.lower())
+    return " ".join(query.split())
+
+
+def cache_key(query: str, topic: str, max_results: int) -> str:
+    return f"{topic}:{max_results}:{normalize_query(query)}"
+
+
+async def search(
+    query: str,
+    max_results: int = 3,
+    topic: str = "general",
+    timeout: float = SEARCH_TIMEOUT_SECONDS,
+    ttl: float = SEARCH_CACHE_DEFAULT_TTL_SECONDS,
+) -> Dict[str, Any]:
+    """
+    Runs a single search query, respecting the per-request and process-wide
+    concurrency limits. Responses are served from the cache while fresh,
+    and concurrent identical queries share a single call.
+
+    Parameters:
+        query (str): the search query
+        max_results (int): maximum number of results to return
+        topic (str): search category, "general" or "news"
+        timeout (float): seconds to wait for the search backend before giving up
+        ttl (float): seconds for which the response may be served from the cache
+    """
+    labels = metrics.current_node()
+
+    async def fetch() -> Dict[str, Any]:
+        metrics.increment("search_calls_total", cache="miss", **labels)
+        with metrics.timed("search", topic, **labels) as span:
+            response = await _search(query, max_results, topic, timeout)
+            results = response.get("results", [])
+            span.update(results=len(results), result_bytes=sum(len(r.get("content", "")) for r in results))
+        return response
+
+    # identical queries running at the same time (e.g. from other requests) share one call
+    response, source = await cache.get_or_compute(cache_key(query, topic, max_results), fetch, ttl)
+    if source != "miss":
+        metrics.increment("search_calls_total", cache=source, **labels)
+    return response
+
+
+async def _search(query: str, max_results: int, topic: str, timeout: float) -> Dict[str, Any]:
+    """Sends the query to the search backend"""
+    run = current_run()
+    async with AsyncExitStack() as stack:
+        # acquire the per-request slot first so a busy request
+        # doesn't hold on to process-wide slots while it waits
+        if run is not None:
+            await stack.enter_async_context(run.search_semaphore)
+        try:
+            return await scheduler.run(
+                lambda: asyncio.wait_for(
+                    get_client().search(query=query, max_results=max_results, topic=topic),
+                    timeout=timeout,
+                )
+            )
+        except asyncio.CancelledError:
+            metrics.increment("search_calls_cancelled_total")
+            raise
+
+
+async def search_all(queries: Sequence[str], requester: Optional[str] = None, **kwargs) -> List[Dict[str, Any]]:
+    """
+    Runs all queries concurrently and returns the responses of those that succeeded.
+    Failed or timed-out queries are logged and skipped so one bad query
+    doesn't sink the whole research step.
+
+    Within a research run, queries of `requester` (a topic) that (nearly) repeat
+    an earlier query of the run are searched as that query, and the documents
+    found go to the run's evidence pool for the other topics (see agents.evidence).
+    """
+    run = current_run()
+    pool = run.evidence if run is not None and requester else None
+    if pool is not None:
+        scope = (kwargs.get("topic", "general"), kwargs.get("max_results", 3))
+        resolved = []
+        for query in queries:
+            searched, shared = pool.resolve(query, requester, scope)
+            metrics.increment("evidence_queries_total", result="shared" if shared else "new", topic=requester)
+            resolved.append(searched)
+        queries = list(dict.fromkeys(resolved))
+
+    responses = await asyncio.gather(
+        *(search(query, **kwargs) for query in queries),
+        return_exceptions=True,
+    )
+    succeeded = []
+    for query, response in zip(queries, responses):
+        if isinstance(response, Exception):
+            logger.warning("Search failed for %r: %r", query, response)
+            metrics.increment("search_failures_total", error=type(response).__name__)
+            continue
+        if isinstance(response, BaseException):
+            raise response
+        succeeded.append(response)
+    if pool is not None:
+        pool.add(requester, (result["content"] for response in succeeded for result in response["results"]))
+    return succeeded
@@ -0,0 +1,155 @@
+"""Finished report sections, kept per company and topic so fresh ones are reused across runs"""
+
+import hashlib
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Optional
+
+from agents import metrics
+from agents.constants import SECTION_FRESHNESS_SECONDS, SUBTOPICS_MAPPING
+from agents.prompts import (
+    CRITIQUE_PROMPT_TEMPLATE,
+    FINAL_REVISION_PROMPT,
+    RESEARCH_CRITIQUE_PROMPT,
+    RESEARCH_PROMPT_TEMPLATE,
+    REVISION_PROMPT_TEMPLATE,
+    WRITER_PROMPT_TEMPLATE,
+)
+
+logger = logging.getLogger(__name__)
+
+# where finished sections are kept; None disables section reuse
+_store = None
+
+
+def set_store(store) -> None:
+    """Sets the section store (MemorySectionStore or MongoSectionStore), or None to disable reuse"""
+    global _store
+    _store = store
+
+
+def normalize_company(company: str) -> str:
+    return " ".join(company.lower().split())
+
+
+def section_version(model_name: Optional[str], topic: str) -> str:
+    """
+    Fingerprint of everything a section is written with besides its
+    research: the model and the prompts. Editing a prompt or switching
+    models makes earlier sections stale.
+    """
+    parts = [
+        str(model_name),
+        SUBTOPICS_MAPPING.get(topic, ""),
+        RESEARCH_PROMPT_TEMPLATE.template,
+        WRITER_PROMPT_TEMPLATE.template,
+        REVISION_PROMPT_TEMPLATE.template,
+        CRITIQUE_PROMPT_TEMPLATE.template,
+        RESEARCH_CRITIQUE_PROMPT,
+        FINAL_REVISION_PROMPT,
+    ]
+    return hashlib.sha1("\x00".join(parts).encode()).hexdigest()[:12]
+
+
+def section_key(company: str, topic: str, version: str) -> str:
+    return f"{normalize_company(company)}:{topic}:{version}"
+
+
+def _age(section: Dict[str, Any]) -> float:
+    # MongoDB returns naive UTC datetimes
+    created_at = section["created_at"].replace(tzinfo=timezone.utc)
+    return (datetime.now(timezone.utc) - created_at).total_seconds()
+
+
+class MemorySectionStore:
+    """Section store kept in this process, for development and benchmarks"""
+
+    def __init__(self):
+        self.sections: Dict[str, Dict[str, Any]] = {}
+
+    async def ensure_indexes(self) -> None:
+        pass
+
+    async def get_many(self, keys: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        return {key: dict(self.sections[key]) for key in keys if key in self.sections}
+
+    async def set(self, section: Dict[str, Any]) -> None:
+        self.sections[section["_id"]] = dict(section)
+
+
+class MongoSectionStore:
+    """
+    Section store backed by a MongoDB collection, shared by all processes.
+    Sections are pruned by a TTL index on `created_at` once they're
+    older than the longest freshness window.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def ensure_indexes(self) -> None:
+        await self.collection.create_index([("company", 1), ("topic", 1)])
+        await self.collection.create_index(
+            "created_at", expireAfterSeconds=max(SECTION_FRESHNESS_SECONDS.values())
+        )
+
+    async def get_many(self, keys: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        cursor = self.collection.find({"_id": {"$in": list(keys)}})
+        return {doc["_id"]: doc for doc in await cursor.to_list(None)}
+
+    async def set(self, section: Dict[str, Any]) -> None:
+        await self.collection.replace_one({"_id": section["_id"]}, section, upsert=True)
+
+
+async def load_fresh(company: str, topics: Iterable[str], model_name: Optional[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Returns the stored sections of `company` that are still fresh, by topic.
+    A section is fresh while it's younger than its topic's window in
+    SECTION_FRESHNESS_SECONDS and was written with the current model and prompts.
+    """
+    if _store is None:
+        return {}
+    keys = {section_key(company, topic, section_version(model_name, topic)): topic for topic in topics}
+    try:
+        stored = await _store.get_many(keys)
+    except Exception as e:
+        logger.warning("Section store read failed: %r", e)
+        stored = {}
+
+    fresh = {}
+    for key, topic in keys.items():
+        section = stored.get(key)
+        if section is None:
+            result = "miss"
+        elif _age(section) >= SECTION_FRESHNESS_SECONDS.get(topic, 0):
+            result = "stale"
+        else:
+            result = "hit"
+            fresh[topic] = section
+        metrics.increment("section_cache_total", topic=topic, result=result)
+    return fresh
+
+
+async def save(
+    company: str,
+    topic: str,
+    model_name: Optional[str],
+    section: str,
+    iterations: Dict[str, Any],
+) -> None:
+    """Stores a finished section for reuse by later runs"""
+    if _store is None:
+        return
+    version = section_version(model_name, topic)
+    try:
+        await _store.set({
+            "_id": section_key(company, topic, version),
+            "company": normalize_company(company),
+            "topic": topic,
+            "version": version,
+            "section": section,
+            "iterations": iterations,
+            "created_at": datetime.now(timezone.utc),
+        })
+    except Exception as e:
+        logger.warning("Section store write failed: %r", e)
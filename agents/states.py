@@ -22,6 +22,7 @@ class ResearchState(TypedDict, total=False):
     task_status: Annotated[Dict[str, Any], add_dicts]  # status of the tasks
 
     final_report: str  # the final report generated by the coordinator agent
+    iterations: Annotated[Dict[str, Any], add_dicts]  # drafts written and why revising stopped, per topic
 
     max_drafts: Annotated[int, reduce_int]  # maximum number of revisions
 
@@ -30,14 +31,18 @@ class TopicState(TypedDict):
 
     company: Annotated[str, reduce_str]  # the company to write the analysis about (user-input)
     topic: str  # the topic to write about (user-input)
-    docs: List[str]  # the documents to analyze
+    docs: List[str]  # references to the documents to analyze, see agents.corpus
     critique: str  # the summary of the documents
     draft: Dict[str, str]  # the ongoing draft of the full analysis
     draft_number: int  # current revision number
+    drafted_docs: int  # number of docs the current draft was written with; later ones are new
+    prompt_tokens: List[int]  # estimated writer prompt tokens of each draft
     max_drafts: Annotated[int, reduce_int]  # maximum number of revisions
+    stop_reason: str  # why revising stopped, empty while it goes on
     task_id: str
 
     # Shared channels with parent
     reports: Annotated[Dict[str, Any], add_dicts]
     task_status: Annotated[Dict[str, Any], add_dicts]
+    iterations: Annotated[Dict[str, Any], add_dicts]
     
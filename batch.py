@@ -0,0 +1,78 @@
+"""
+Researches a list of companies in one batch, e.g. a nightly watchlist refresh:
+
+    python batch.py AAPL MSFT NVDA --topics "background;recent_news"
+    python batch.py --file watchlist.txt --output reports.jsonl
+
+Reports are written as JSON lines ({"company", "report", "iterations"}) as soon as each one
+completes; progress goes to stderr.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import sys
+
+from agents.constants import ALL_TOPICS, BATCH_MAX_CONCURRENCY, DEFAULT_MAX_REVISIONS
+from server import sse
+from server.batch import research_batch
+
+# the app reports its setup on stdout, which carries the reports here
+with contextlib.redirect_stdout(sys.stderr):
+    import main
+
+
+async def run(args: argparse.Namespace) -> int:
+    companies = list(args.companies)
+    if args.file:
+        with open(args.file) as f:
+            companies += [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    if not companies:
+        print("No companies given", file=sys.stderr)
+        return 2
+    try:
+        topics = main.parse_topics(args.topics)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    with contextlib.redirect_stdout(sys.stderr):
+        await main.setup()
+    output = open(args.output, "w") if args.output else sys.stdout
+    failed = 0
+    try:
+        events = research_batch(
+            main.graphs.get(main.model.model_name),
+            companies,
+            topics,
+            max_drafts=args.max_drafts,
+            concurrency=args.concurrency,
+        )
+        async for event, data in events:
+            if event == sse.REPORT:
+                output.write(json.dumps(data) + "\n")
+                output.flush()
+            elif event == sse.ERROR:
+                failed += 1
+                print(f"{data['company']}: {data['message']}", file=sys.stderr)
+            elif event in (sse.PROGRESS, sse.DONE):
+                print(
+                    f"{data['completed']}/{data['total']} done, {data['failed']} failed, {data['elapsed']}s",
+                    file=sys.stderr,
+                )
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        await main.teardown()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Research a list of companies in one batch")
+    parser.add_argument("companies", nargs="*", help="company names")
+    parser.add_argument("--file", help="file with one company per line")
+    parser.add_argument("--topics", default=";".join(sorted(ALL_TOPICS)), help='";"-separated topics')
+    parser.add_argument("--max-drafts", type=int, default=DEFAULT_MAX_REVISIONS)
+    parser.add_argument("--concurrency", type=int, default=BATCH_MAX_CONCURRENCY)
+    parser.add_argument("--output", help="JSON lines file for the reports (default: stdout)")
+    sys.exit(asyncio.run(run(parser.parse_args())))
@@ -0,0 +1,255 @@
+"""
+End-to-end benchmark of the research graph and the /research endpoint,
+run offline against the fakes in benchmarks/fakes.py and an in-memory
+checkpointer.
+
+Reports p50/p95 end-to-end latency, time-to-first-status,
+time-to-first-token and requests/sec at N concurrent streams, as JSON,
+so results can be compared across commits.
+
+Usage:
+    python -m benchmarks.e2e --target app --concurrency 8 --requests 32
+    python -m benchmarks.e2e --target graph --output bench.json
+    python -m benchmarks.e2e --same-company --section-cache  # repeat research of one company
+    python -m benchmarks.e2e --durability batched --checkpoint-latency 0.02
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+# measure model calls, not cache hits
+os.environ.setdefault("LLM_CACHE", "0")
+
+import httpx
+import uvicorn
+
+from agents import metrics, search, sections
+from agents.checkpoint import DURABILITY_MODES, DurableCheckpointer, InstrumentedCheckpointer, checkpoint_boundary
+from agents.constants import ALL_TOPICS, DEFAULT_MAX_REVISIONS
+from agents.context import run_context
+from agents.llm import ModelRouter
+from agents.registry import GraphRegistry
+from benchmarks.fakes import FakeChatModel, FakeSearchClient, SlowSaver
+
+
+class Sample:
+    """Timings of one research run, in seconds from its start"""
+
+    def __init__(self):
+        self.first_status: Optional[float] = None
+        self.first_token: Optional[float] = None
+        self.total: Optional[float] = None
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(round(q * (len(values) - 1))), len(values) - 1)]
+
+
+def summarize(samples: List[Sample], wall_time: float) -> Dict[str, Any]:
+    summary = {"requests": len(samples), "wall_time_s": wall_time, "requests_per_s": len(samples) / wall_time}
+    for name in ("total", "first_status", "first_token"):
+        values = [getattr(s, name) for s in samples if getattr(s, name) is not None]
+        summary[name] = {
+            "p50_s": percentile(values, 0.5),
+            "p95_s": percentile(values, 0.95),
+            "mean_s": statistics.mean(values) if values else None,
+        }
+    return summary
+
+
+async def run_graph(graph, company: str, topics: List[str], max_drafts: int) -> Sample:
+    """Runs the compiled graph directly, timing its progress events and section tokens"""
+    sample, start = Sample(), time.perf_counter()
+    config = {"configurable": {"thread_id": f"bench-{uuid.uuid4().hex}"}}
+    initial_input = {"company": company, "topics": topics, "max_drafts": max_drafts}
+    # like /research, so the run's topic agents share its searches and documents
+    with run_context(task_id=config["configurable"]["thread_id"]):
+        try:
+            async for namespace, mode, chunk in graph.astream(
+                initial_input, config, stream_mode=["custom", "messages"], subgraphs=True,
+            ):
+                now = time.perf_counter() - start
+                if mode == "custom" and sample.first_status is None:
+                    sample.first_status = now
+                elif mode == "messages" and chunk[1].get("langgraph_node") == "polish_node" and sample.first_token is None:
+                    sample.first_token = now
+        finally:
+            await checkpoint_boundary(graph.checkpointer, config)
+    sample.total = time.perf_counter() - start
+    return sample
+
+
+async def run_request(client: httpx.AsyncClient, url: str, company: str, topics: List[str]) -> Sample:
+    """Streams one /research request, timing its server-sent events"""
+    sample, start = Sample(), time.perf_counter()
+    params = {"company": company, "criteria": ";".join(topics)}
+    async with client.stream("GET", url, params=params) as response:
+        async for line in response.aiter_lines():
+            now = time.perf_counter() - start
+            if line == "event: status" and sample.first_status is None:
+                sample.first_status = now
+            elif line == "event: token" and sample.first_token is None:
+                sample.first_token = now
+            elif line == "event: error":
+                raise RuntimeError(f"research failed for {company}")
+    sample.total = time.perf_counter() - start
+    return sample
+
+
+async def run_load(make_run, requests: int, concurrency: int) -> Dict[str, Any]:
+    """Runs `requests` runs with at most `concurrency` at a time"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(i):
+        async with semaphore:
+            return await make_run(i)
+
+    start = time.perf_counter()
+    samples = await asyncio.gather(*(limited(i) for i in range(requests)))
+    return summarize(samples, time.perf_counter() - start)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def benchmark(args) -> Dict[str, Any]:
+    model = FakeChatModel(
+        latency=args.llm_latency,
+        tokens_per_second=args.tokens_per_second,
+        response_tokens=args.response_tokens,
+        structured_latency=args.structured_latency,
+    )
+    if args.fast_structured_latency is not None:
+        # query generation and critiques on a faster tier, as with MODEL_PROFILES
+        fast = FakeChatModel(
+            model_name="fake-fast",
+            latency=args.llm_latency,
+            tokens_per_second=args.tokens_per_second,
+            response_tokens=args.response_tokens,
+            structured_latency=args.fast_structured_latency,
+        )
+        model = ModelRouter({"writer": model, "fast": fast})
+    search_client = FakeSearchClient(latency=args.search_latency)
+    search.set_client(search_client)
+    sections.set_store(sections.MemorySectionStore() if args.section_cache else None)
+    topics = args.topics.split(";")
+    checkpointer = DurableCheckpointer(
+        InstrumentedCheckpointer(SlowSaver(args.checkpoint_latency)), mode=args.durability,
+    )
+    # distinct companies, so neither caches nor request coalescing kick in
+    company = lambda i: f"Company {i}" if not args.same_company else "Company"
+
+    if args.target == "graph":
+        registry = GraphRegistry(checkpointer)
+        graph = registry.register(model.model_name, model)
+        results = await run_load(
+            lambda i: run_graph(graph, company(i), topics, args.max_drafts),
+            args.requests, args.concurrency,
+        )
+    else:
+        import main
+
+        main.model = model
+        main.graphs = GraphRegistry(checkpointer)
+        main.graphs.register(model.model_name, model)
+        port = free_port()
+        # lifespan off: startup would connect to MongoDB
+        server = uvicorn.Server(uvicorn.Config(main.app, port=port, log_level="warning", lifespan="off"))
+        serving = asyncio.create_task(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.05)
+        try:
+            async with httpx.AsyncClient(timeout=None, trust_env=False) as client:
+                url = f"http://127.0.0.1:{port}/research"
+                results = await run_load(
+                    lambda i: run_request(client, url, company(i), topics),
+                    args.requests, args.concurrency,
+                )
+        finally:
+            server.should_exit = True
+            await serving
+
+    results["search_calls"] = search_client.calls
+    counters = metrics.snapshot()
+    results["llm_calls"] = sum(
+        value for labels, value in counters.get("llm_calls_total", {}).items() if "cache=miss" in labels
+    )
+    results["llm_calls_by_model"] = {}
+    for labels, value in counters.get("llm_calls_total", {}).items():
+        if "cache=miss" in labels:
+            model_name = dict(label.split("=", 1) for label in labels.split(",")).get("model")
+            results["llm_calls_by_model"][model_name] = results["llm_calls_by_model"].get(model_name, 0) + value
+    results["checkpoint_bytes_per_report"] = (
+        sum(counters.get("checkpoint_bytes_total", {}).values()) / args.requests
+    )
+    results["shared_queries"] = sum(
+        value for labels, value in counters.get("evidence_queries_total", {}).items() if "result=shared" in labels
+    )
+    results["section_cache"] = {
+        labels: value for labels, value in counters.get("section_cache_total", {}).items()
+    }
+    results["shared_docs"] = sum(counters.get("evidence_docs_shared_total", {}).values())
+    loops = sum(counters.get("topic_loops_total", {}).values())
+    drafts = sum(counters.get("topic_drafts_total", {}).values())
+    results["drafts_per_topic"] = drafts / loops if loops else None
+    results["stop_reasons"] = {
+        labels: value for labels, value in counters.get("topic_loops_total", {}).items()
+    }
+    return results
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", choices=["graph", "app"], default="app")
+    parser.add_argument("--requests", type=int, default=16)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--topics", default=";".join(sorted(ALL_TOPICS)))
+    parser.add_argument("--max-drafts", type=int, default=DEFAULT_MAX_REVISIONS)
+    parser.add_argument("--same-company", action="store_true", help="research one company in every request")
+    parser.add_argument("--section-cache", action="store_true", help="reuse fresh sections of earlier requests")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="seconds to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--response-tokens", type=int, default=150)
+    parser.add_argument("--structured-latency", type=float, default=0.3)
+    parser.add_argument(
+        "--fast-structured-latency", type=float,
+        help="seconds per structured-output call of the fast tier (default: one model for every node)",
+    )
+    parser.add_argument("--search-latency", type=float, default=0.8)
+    parser.add_argument("--durability", choices=DURABILITY_MODES, default=DURABILITY_MODES[0])
+    parser.add_argument("--checkpoint-latency", type=float, default=0.0, help="seconds per checkpoint write")
+    parser.add_argument("--output", help="write the JSON results to this file")
+    args = parser.parse_args()
+
+    results = asyncio.run(benchmark(args))
+    report = {"commit": git_commit(), "params": vars(args), "results": results}
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
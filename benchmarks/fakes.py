@@ -0,0 +1,150 @@
+"""
+Local stand-ins for the external services, so the real graph and app
+can be benchmarked offline: a scripted chat model and a search backend.
+"""
+
+import asyncio
+import hashlib
+import json
+import random
+import typing
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence
+
+from pydantic import BaseModel
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import Runnable, RunnableLambda
+from langgraph.checkpoint.memory import MemorySaver
+
+_WORDS = (
+    "revenue profit margin growth debt market share competitor acquisition launch "
+    "leadership mission culture strategy quarter guidance analyst customers product "
+    "platform expansion regulation lawsuit partnership supply chain demand pricing"
+).split()
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model that answers with scripted text after a configurable
+    latency, streaming it at a configurable token rate.
+    """
+
+    model_name: str = "fake-chat"
+    temperature: float = 0.1
+    latency: float = 0.5  # seconds before the first token
+    tokens_per_second: float = 200.0
+    response_tokens: int = 150
+    structured_latency: float = 0.3  # seconds per structured-output call
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _text(self, messages: List[BaseMessage]) -> str:
+        """Deterministic pseudo-text derived from the prompt"""
+        rng = random.Random(_seed(messages))
+        words = [rng.choice(_WORDS) for _ in range(self.response_tokens)]
+        return "<h2>Section</h2>\n<p>" + " ".join(words) + "</p>"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._text(messages)))])
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.latency)
+        delay = 1 / self.tokens_per_second
+        for i, token in enumerate(self._text(messages).split(" ")):
+            await asyncio.sleep(delay)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token if i == 0 else " " + token))
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        text = ""
+        async for chunk in self._astream(messages, stop, run_manager, **kwargs):
+            text += chunk.text
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def with_structured_output(self, schema: typing.Type[BaseModel], **kwargs) -> Runnable:
+        """Returns instances of `schema` filled in from its field types"""
+
+        async def respond(messages: List[BaseMessage]) -> BaseModel:
+            await asyncio.sleep(self.structured_latency)
+            return _fill(schema, random.Random(_seed(messages)))
+
+        return RunnableLambda(respond)
+
+
+def _seed(messages: List[BaseMessage]) -> str:
+    return hashlib.sha1("".join(str(m.content) for m in messages).encode()).hexdigest()
+
+
+def _fill(schema: typing.Type[BaseModel], rng: random.Random) -> BaseModel:
+    values = {}
+    for name, field in schema.model_fields.items():
+        annotation = field.annotation
+        if annotation is bool:
+            # e.g. critique verdicts: never satisfied, so loops run to their limit
+            values[name] = False
+        elif typing.get_origin(annotation) in (list, List):
+            values[name] = [" ".join(rng.choices(_WORDS, k=4)) for _ in range(3)]
+        elif annotation in (int, float):
+            values[name] = annotation(rng.randint(0, 10))
+        else:
+            values[name] = " ".join(rng.choices(_WORDS, k=30))
+    return schema(**values)
+
+
+class FakeSearchClient:
+    """Search backend answering from a local corpus after a configurable latency"""
+
+    def __init__(self, corpus: Optional[Sequence[str]] = None, latency: float = 0.8, corpus_size: int = 500):
+        self.latency = latency
+        self.calls = 0
+        if corpus is None:
+            rng = random.Random(0)
+            corpus = [" ".join(rng.choices(_WORDS, k=80)) for _ in range(corpus_size)]
+        self.corpus = list(corpus)
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> "FakeSearchClient":
+        """Loads a corpus from a JSON list of strings"""
+        with open(path) as f:
+            return cls(corpus=json.load(f), **kwargs)
+
+    async def search(self, query: str, max_results: int = 5, **kwargs) -> Dict[str, Any]:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        rng = random.Random(query)
+        docs = rng.sample(self.corpus, min(max_results, len(self.corpus)))
+        return {
+            "query": query,
+            "results": [
+                {"url": f"https://example.com/{hashlib.sha1(doc.encode()).hexdigest()[:12]}", "content": doc}
+                for doc in docs
+            ],
+        }
+
+
+class SlowSaver(MemorySaver):
+    """In-memory checkpointer taking `latency` seconds per write, like a remote database"""
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+
+    async def aput(self, *args, **kwargs):
+        await asyncio.sleep(self.latency)
+        return await super().aput(*args, **kwargs)
+
+    async def aput_writes(self, *args, **kwargs):
+        await asyncio.sleep(self.latency)
+        return await super().aput_writes(*args, **kwargs)
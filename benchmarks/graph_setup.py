@@ -0,0 +1,68 @@
+"""
+Micro-benchmark: per-request graph setup cost.
+
+Compares building and compiling a CoordinatorAgent graph on every request
+(the old behavior of the /research handler) with looking up the graph
+compiled once at startup in the GraphRegistry.
+
+Usage:
+    python -m benchmarks.graph_setup [--iterations N]
+"""
+
+import argparse
+import statistics
+import time
+
+from langchain_openai import ChatOpenAI
+from langgraph.checkpoint.memory import MemorySaver
+
+from agents.agents import CoordinatorAgent
+from agents.registry import GraphRegistry
+
+
+def time_calls(fn, iterations: int):
+    """Returns per-call durations in milliseconds"""
+    durations = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        durations.append((time.perf_counter() - start) * 1000)
+    return durations
+
+
+def report(name: str, durations):
+    print(
+        f"{name:<24} mean={statistics.mean(durations):8.3f}ms "
+        f"p50={statistics.median(durations):8.3f}ms "
+        f"max={max(durations):8.3f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    # no requests are sent, the key just has to be non-empty
+    model = ChatOpenAI(model="gpt-4o-mini", temperature=0.1, streaming=True, api_key="benchmark")
+    checkpointer = MemorySaver()
+
+    def per_request():
+        agent = CoordinatorAgent(model=model)
+        agent.workflow.compile(checkpointer=checkpointer)
+
+    registry = GraphRegistry(checkpointer)
+    registry.register(model.model_name, model)
+
+    def from_registry():
+        registry.get(model.model_name)
+
+    before = time_calls(per_request, args.iterations)
+    after = time_calls(from_registry, args.iterations)
+    report("build + compile/request", before)
+    report("registry lookup", after)
+    print(f"speedup: {statistics.mean(before) / statistics.mean(after):.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+gunicorn settings of the web server (see Procfile):
+
+    gunicorn main:app
+
+gunicorn reads this file from the working directory. It imports the app once
+(preload_app) and forks WEB_CONCURRENCY uvicorn workers that share its listening
+socket and, until they write to them, its imported modules. Workers start in the
+time setup() takes instead of re-importing everything, and each one costs only
+its private memory (reported by GET /readyz). On SIGTERM every worker stops
+accepting connections, lets requests in flight finish for up to
+DRAIN_TIMEOUT_SECONDS, then requeues its jobs, flushes checkpoints and exits.
+
+Research jobs run in worker.py, the `worker` entry of the Procfile: web workers
+start with JOB_WORKERS=0, so the server runs as many jobs at a time whatever
+WEB_CONCURRENCY is. Each worker coalesces identical GET /research streams on
+its own, so identical requests that reach different workers each run.
+"""
+import importlib
+import os
+
+from agents.constants import DRAIN_TIMEOUT_SECONDS, WEB_WORKERS
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8000)}"
+workers = int(os.environ.get("WEB_CONCURRENCY", WEB_WORKERS))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+# draining, then requeueing jobs and flushing checkpoints, before the worker is killed
+graceful_timeout = int(DRAIN_TIMEOUT_SECONDS) + 15
+
+# read by main.setup() in each web worker
+os.environ["JOB_WORKERS"] = "0"
+
+# imported on first use by the HTTP clients and models that setup() creates;
+# imported here, they're loaded once and shared instead of once per worker
+PRELOAD = ("httpcore", "openai.resources")
+for module in PRELOAD:
+    importlib.import_module(module)
+
+
+def post_fork(server, worker):
+    # uvicorn otherwise waits for open streams for as long as gunicorn lets it,
+    # and is killed before the app's shutdown handler has run
+    worker.config.timeout_graceful_shutdown = DRAIN_TIMEOUT_SECONDS
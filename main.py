@@ -1,43 +1,70 @@
 """Main app module"""
 import os
-import time
+import uuid
 import secrets
 import asyncio
+from typing import List, Optional, Tuple, Union
 
 import uvicorn
-from fastapi import FastAPI, Request
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware import Middleware
 from starlette.middleware.sessions import SessionMiddleware
 from fastapi.staticfiles import StaticFiles
+from pydantic import BaseModel, Field, field_validator
 
-from pymongo import AsyncMongoClient
-from pymongo.server_api import ServerApi
-
-from langchain_openai import ChatOpenAI
+from langgraph.checkpoint.memory import MemorySaver
 from langgraph.checkpoint.mongodb.aio import AsyncMongoDBSaver
 
-from agents.agents import CoordinatorAgent
+from agents import clients, corpus, llm, metrics, search, sections
+from agents.cache import MongoCacheStore
+from agents.checkpoint import DurableCheckpointer, InstrumentedCheckpointer, ensure_indexes, prune_periodically
+from agents.context import run_context
+from agents.registry import GraphRegistry
+from server import sse
+from server.batch import research_batch
+from server.jobs import JobRunner, MongoJobStore
+from server.lifecycle import InFlightMiddleware, Lifecycle, memory_usage
+from server.research import research_events
+from server.singleflight import SingleFlight
 from agents.constants import (
+    ALL_TOPICS,
+    BATCH_MAX_COMPANIES,
+    BATCH_MAX_CONCURRENCY,
+    CHECKPOINT_DURABILITY,
     DEFAULT_MAX_REVISIONS,
+    DRAIN_TIMEOUT_SECONDS,
+    JOB_WORKERS,
+    MAX_REVISIONS_LIMIT,
     MONGO_CHECKPOINTS_COLLECTION_NAME,
     MONGO_DB_NAME,
+    MONGO_DOCUMENTS_COLLECTION_NAME,
+    MONGO_JOB_EVENTS_COLLECTION_NAME,
+    MONGO_JOBS_COLLECTION_NAME,
+    MONGO_LEASES_COLLECTION_NAME,
+    MONGO_LLM_CACHE_COLLECTION_NAME,
+    MONGO_SEARCH_CACHE_COLLECTION_NAME,
+    MONGO_SECTIONS_COLLECTION_NAME,
     MONGO_WRITES_COLLECTION_NAME,
-    NODE_TO_TEXT,
-    TOPIC_NAMES_MAPPING,
 )
 
 
 from dotenv import load_dotenv
 load_dotenv()
 
+# readiness and graceful drain of this process
+lifecycle = Lifecycle()
+lifecycle.add_check("mongo", clients.ping_mongo)
+lifecycle.add_check("tavily", search.check_client)
+
 # Define app middleware
 middleware = [
+    Middleware(InFlightMiddleware, lifecycle=lifecycle),
     Middleware(
         SessionMiddleware,
         secret_key=os.environ.get("SECRET_KEY", secrets.token_urlsafe(16)),
-    )
+    ),
 ]
 
 app = FastAPI(middleware=middleware)
@@ -46,41 +73,142 @@ app = FastAPI(middleware=middleware)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 
-# Connect to mongo client
-client = AsyncMongoClient(
-    os.environ.get("MONGO_URI"),
-    server_api=ServerApi("1"),
-    uuidRepresentation="standard",
-)
+# Clients and stores are created by setup(), not at import, so gunicorn can
+# import the app once and fork workers that each open their own connections
+db = None
+checkpointer = None
+# "mongo", or "memory" to keep checkpoints in this process (development)
+CHECKPOINT_BACKEND = os.environ.get("CHECKPOINT_BACKEND", "mongo")
+# compiled research graphs, shared across requests
+graphs = None
+# identical research requests running right now, shared by their clients
+in_flight = SingleFlight()
+# background research jobs (POST /research)
+jobs = None
+# deletes the checkpoints of old threads
+pruner = None
 
-# Send a ping to confirm a successful connection
-try:
-    client.admin.command("ping")
-    print("Successfully connected to MongoDB!")
-except Exception as e:
-    print(e)
+# models of each graph node, see MODEL_PROFILES
+model = None
 
-# Create a checkpointer for the agent
-db = client.get_database(MONGO_DB_NAME)
-mongo_checkpointer = None
 
+async def setup():
+    """Connects the checkpointer, caches and job store and compiles the graphs"""
+    global checkpointer, db, graphs, jobs, model
+    db = clients.mongo_client().get_database(MONGO_DB_NAME)
+    model = llm.ModelRouter.from_profiles(
+        streaming=True,
+        stream_usage=True,  # report token usage for streamed responses too
+        max_retries=0,  # retries are left to the scheduler, see agents.llm
+        http_async_client=clients.http_client("openai"),  # one connection pool for all models
+    )
+    print(f"Models: {model.model_name}")
+
+    if CHECKPOINT_BACKEND == "memory":
+        backend = MemorySaver()
+    else:
+        backend = AsyncMongoDBSaver(
+            clients.mongo_client(),
+            db_name=MONGO_DB_NAME,
+            checkpoint_collection_name=MONGO_CHECKPOINTS_COLLECTION_NAME,
+            writes_collection_name=MONGO_WRITES_COLLECTION_NAME,
+        )
+    # CHECKPOINT_DURABILITY trades crash-resume granularity for throughput
+    checkpointer = DurableCheckpointer(
+        InstrumentedCheckpointer(backend),
+        mode=os.environ.get("CHECKPOINT_DURABILITY", CHECKPOINT_DURABILITY),
+    )
+    # Checkpoints only reference documents; their text is stored once, by hash
+    corpus_store = corpus.MongoCorpusStore(db.get_collection(MONGO_DOCUMENTS_COLLECTION_NAME))
+    # Back the search and LLM caches with collections next to the checkpoints
+    search_cache_store = MongoCacheStore(db.get_collection(MONGO_SEARCH_CACHE_COLLECTION_NAME))
+    llm_cache_store = MongoCacheStore(db.get_collection(MONGO_LLM_CACHE_COLLECTION_NAME))
+    # Finished sections are reused by later research of the same company while fresh
+    section_store = sections.MongoSectionStore(db.get_collection(MONGO_SECTIONS_COLLECTION_NAME))
+    job_store = MongoJobStore(
+        db.get_collection(MONGO_JOBS_COLLECTION_NAME),
+        db.get_collection(MONGO_JOB_EVENTS_COLLECTION_NAME),
+    )
+
+    # Check the dependencies and create the indexes (a no-op once they exist) all at once,
+    # so a slow or unreachable MongoDB delays startup by one timeout rather than one per collection
+    index_builds = {
+        "documents": corpus_store.ensure_indexes(),
+        "search cache": search_cache_store.ensure_indexes(),
+        "llm cache": llm_cache_store.ensure_indexes(),
+        "sections": section_store.ensure_indexes(),
+        "jobs": job_store.ensure_indexes(),
+    }
+    if CHECKPOINT_BACKEND != "memory":
+        index_builds["checkpoints"] = ensure_indexes(
+            db.get_collection(MONGO_CHECKPOINTS_COLLECTION_NAME),
+            db.get_collection(MONGO_WRITES_COLLECTION_NAME),
+        )
+    checks, *built = await asyncio.gather(
+        lifecycle.check(max_age=0), *index_builds.values(), return_exceptions=True
+    )
+    for dependency, result in checks.items():
+        print(f"{dependency}: {result}")
+    for name, result in zip(index_builds, built):
+        if isinstance(result, Exception):
+            print(f"Creating the {name} indexes failed: {result}")
+
+    print(f"{type(backend).__name__} initialized ({checkpointer.mode} durability).")
+    corpus.set_store(corpus_store)
+    print("Document store initialized.")
+
+    # Compile the research graph once; requests only differ by state/config
+    graphs = GraphRegistry(checkpointer)
+    graphs.register(model.model_name, model)
+    print("Research graphs compiled.")
+
+    search.set_cache_store(search_cache_store)
+    llm.set_cache_store(llm_cache_store)
+    print("Search and LLM caches initialized.")
+    sections.set_store(section_store)
+    print("Section store initialized.")
+
+    # set JOB_WORKERS=0 to leave all jobs to dedicated worker processes (worker.py)
+    jobs = JobRunner(
+        job_store,
+        lambda: graphs.get(model.model_name),
+        workers=int(os.environ.get("JOB_WORKERS", JOB_WORKERS)),
+    )
 
-model = ChatOpenAI(
-    model="gpt-4o-mini",
-    temperature=0.1,
-    streaming=True,
-)
 
 @app.on_event("startup")
 async def startup_event():
-    global mongo_checkpointer
-    mongo_checkpointer = AsyncMongoDBSaver(
-        client,
-        db_name=MONGO_DB_NAME,
-        checkpoint_collection_name=MONGO_CHECKPOINTS_COLLECTION_NAME,
-        writes_collection_name=MONGO_WRITES_COLLECTION_NAME,
-    )
-    print("AsyncMongoDBSaver initialized.")
+    global pruner
+    await setup()
+    jobs.start()
+    print(f"Started {jobs.workers} research job workers.")
+    if CHECKPOINT_BACKEND == "mongo":
+        pruner = asyncio.create_task(prune_periodically(
+            db.get_collection(MONGO_CHECKPOINTS_COLLECTION_NAME),
+            db.get_collection(MONGO_WRITES_COLLECTION_NAME),
+            db.get_collection(MONGO_LEASES_COLLECTION_NAME),
+        ))
+    print(f"Ready: {lifecycle.mark_started()}")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # stop being ready and give the requests in flight (e.g. research streams) time to finish
+    if not await lifecycle.drain(DRAIN_TIMEOUT_SECONDS):
+        print(f"{lifecycle.in_flight} requests cut off by the shutdown")
+    await teardown()
+
+
+async def teardown():
+    """Stops background work, persists pending checkpoints and closes the clients"""
+    if pruner is not None:
+        pruner.cancel()
+    # unfinished jobs go back to the queue and resume from their checkpoints
+    if jobs is not None:
+        await jobs.stop()
+    if checkpointer is not None:
+        await checkpointer.flush()
+    await clients.close()
 
 
 @app.get("/")
@@ -88,64 +216,258 @@ def root(request: Request):
     return templates.TemplateResponse(name="index.html", context={"request": request})
 
 
+@app.get("/healthz")
+def healthz():
+    """Liveness: the process is up and serving requests"""
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+async def readyz():
+    """
+    Readiness: startup has finished, dependencies respond and the process
+    isn't draining. Also reports the cold-start time and memory of the process.
+    """
+    ready = await lifecycle.ready()
+    body = {
+        "status": "ready" if ready else "unavailable",
+        "draining": lifecycle.draining,
+        "checks": await lifecycle.check(),
+        "in_flight": lifecycle.in_flight,
+        "cold_start_seconds": lifecycle.cold_start,
+        **memory_usage(),
+    }
+    return JSONResponse(body, status_code=200 if ready else 503)
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    """Hit/miss counters of the search and LLM caches"""
+    return {"search": search.cache.stats(), "llm": llm.cache.stats()}
+
+
+@app.get("/scheduler/stats")
+def scheduler_stats():
+    """Current concurrency limit, in-flight and queued calls per provider"""
+    return {"openai": llm.scheduler.stats(), "search": search.scheduler.stats()}
+
+
+@app.get("/stats")
+def stats():
+    """Process-wide counters, e.g. work saved by cancelling abandoned reports"""
+    return metrics.snapshot()
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Node, LLM, search and checkpoint metrics in the Prometheus text format"""
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/research")
 async def research(request: Request):
     """
     When a user makes a GET request, passing in a company and search criteria,
     the team of agents will initialize and begin streaming events back to the client.
-    Up until the final node, intermediate events will flash to the UI 
-    to update the user on the status of the task. Once the final step is reached,
-    the agent will stream its output token-by-token for better user experience.
+    Intermediate events will flash to the UI to update the user on the status
+    of the task. As soon as a topic agent finishes its section, the polished
+    section is streamed in small token batches for better user experience.
+    Events are framed as server-sent events (see server/sse.py for the event types).
 
     Parameters
-        request: a get request send from the client with 'company' and 'criteria' params.
+        request: a get request send from the client with 'company' and 'criteria' params,
+            and optionally 'trace=1' to get a timing trace of the run before the 'done' event.
     """
     company = request.query_params.get("company")
-    criteria = request.query_params.get("criteria").split(";")
-
-    # build agent for task
-    task_id = int(time.time())
-    agent = CoordinatorAgent(
-        model=model,
-        task=company,
-        task_id=task_id,
-    )
-    # Early-stopping at "polish" which is the final node
-    graph = agent.workflow.compile(
-        checkpointer=mongo_checkpointer,
-        interrupt_before=["polish"],
-    )
+    try:
+        criteria = parse_topics(request.query_params.get("criteria"))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    trace = request.query_params.get("trace") == "1"
+
+    graph = graphs.get(model.model_name)
     initial_input = {
         "company": company,
         "topics": criteria,
         "max_drafts": DEFAULT_MAX_REVISIONS,
     }
-    config = {"configurable": {"thread_id": task_id}}
 
     # Stream events to UI for better user experience
     async def stream_events():
-        async for event in graph.astream(input=initial_input, config=config, subgraphs=True):
-            # get node name
-            node = next(iter(event[1]))
-            # yield a user-facing description of the current status
+        # unique, so concurrent requests never share checkpoints
+        task_id = uuid.uuid4().hex
+        config = {"configurable": {"thread_id": task_id}}
+        # scope per-request limits (e.g. search concurrency) to this run
+        with run_context(task_id=task_id) as run:
+            sections = set()
             try:
-                # stream a description of the current node
-                topic = event[1][node].get("topic", "")
-                topic_name = TOPIC_NAMES_MAPPING.get(topic, "")
-                status_description = NODE_TO_TEXT.get(node, node)
-                yield status_description.format(topic=topic_name)
-            except:
-                continue
-
-        # Switch to token-streaming using special token
-        yield "<REPORT_STREAM>"
-        # stream the final node of the graph
-        async for msg, metadata in graph.astream(input=None, config=config, stream_mode="messages"):
-            yield msg.content
-            await asyncio.sleep(0.05)
-    
-    return StreamingResponse(stream_events(), media_type="text/html")
+                events = research_events(graph, initial_input, config)
+                async for event, data in sse.batch_tokens(events):
+                    if event == sse.SECTION:
+                        sections.add(data["id"])
+                    yield sse.format_event(event, data)
+                if trace:
+                    yield sse.format_event(sse.TRACE, {
+                        "summary": metrics.summarize_trace(run.trace),
+                        "spans": run.trace,
+                        "queries": run.evidence.requests,
+                        "checkpoint_bytes": run.checkpoint_bytes,
+                    })
+                yield sse.format_event(sse.DONE, {"task_id": task_id})
+            except asyncio.CancelledError:
+                # every client left; the checkpoints stay in place, so the
+                # thread can still be resumed later
+                metrics.increment("research_runs_abandoned_total")
+                metrics.increment("research_topics_abandoned_total", len(set(criteria) - sections))
+                print(f"Research task {task_id} abandoned by its clients")
+                raise
+            except Exception as e:
+                print(e)
+                yield sse.format_event(sse.ERROR, {"message": "Research failed, please try again."})
+
+    # Identical requests running at the same time share one graph run;
+    # late arrivals get a replay of the events so far, then the live stream
+    key = research_key(company, criteria, DEFAULT_MAX_REVISIONS) + (trace,)
+    return StreamingResponse(
+        sse.until_disconnected(request, in_flight.stream(key, stream_events)),
+        media_type=sse.MEDIA_TYPE,
+        headers=sse.HEADERS,
+    )
+
+
+class ResearchJobRequest(BaseModel):
+    company: str
+    criteria: Union[List[str], str]  # list of topics, or a ";"-separated string
+    max_drafts: Optional[int] = Field(None, ge=1, le=MAX_REVISIONS_LIMIT)
+    # stop the job once nobody follows its stream any more (e.g. the page was closed)
+    cancel_when_abandoned: bool = False
+
+    @field_validator("criteria")
+    @classmethod
+    def known_topics(cls, criteria: Union[List[str], str]) -> List[str]:
+        return parse_topics(criteria)
+
+
+@app.post("/research")
+async def create_research_job(body: ResearchJobRequest):
+    """
+    Queues a research job and returns its id right away. The job runs in the
+    background whether or not anyone follows it; follow it with
+    GET /research/{job_id}/stream. An identical job that is already queued
+    or running is returned instead of starting another one. With
+    `cancel_when_abandoned`, the job is cancelled once nobody has followed
+    its stream for JOB_ABANDON_SECONDS, so reports nobody reads don't keep
+    spending tokens.
+    """
+    max_drafts = body.max_drafts or DEFAULT_MAX_REVISIONS
+    initial_input = {"company": body.company, "topics": body.criteria, "max_drafts": max_drafts}
+    job, created = await jobs.submit(
+        research_key(body.company, body.criteria, max_drafts), initial_input, body.cancel_when_abandoned
+    )
+    return {"job_id": job["_id"], "status": job["status"], "created": created}
+
+
+@app.get("/research/{job_id}")
+async def research_job(job_id: str):
+    """Status of a research job"""
+    job = await jobs.store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown research job")
+    return {key: job.get(key) for key in ("status", "input", "attempts", "created_at", "updated_at")}
+
+
+@app.get("/research/{job_id}/stream")
+async def research_job_stream(job_id: str, request: Request, after: int = 0):
+    """
+    Streams the events of a research job (see server/sse.py for the event types),
+    from the start or, when reconnecting, after the last event received. Every
+    event carries its offset as the SSE id; pass it back in the Last-Event-ID
+    header or the `after` query parameter. Leaving the stream doesn't stop the job.
+    """
+    if await jobs.store.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Unknown research job")
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id:
+        try:
+            after = int(last_event_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Last-Event-ID must be an event offset")
+
+    async def stream_events():
+        async for offset, event, data in jobs.events(job_id, after):
+            yield sse.format_event(event, data, offset)
+
+    return StreamingResponse(
+        sse.until_disconnected(request, stream_events()),
+        media_type=sse.MEDIA_TYPE,
+        headers=sse.HEADERS,
+    )
+
+
+class ResearchBatchRequest(BaseModel):
+    companies: List[str]
+    criteria: Union[List[str], str]  # list of topics, or a ";"-separated string
+    max_drafts: Optional[int] = Field(None, ge=1, le=MAX_REVISIONS_LIMIT)
+    concurrency: Optional[int] = Field(None, ge=1)
+
+    @field_validator("criteria")
+    @classmethod
+    def known_topics(cls, criteria: Union[List[str], str]) -> List[str]:
+        return parse_topics(criteria)
+
+
+@app.post("/research/batch")
+async def research_batch_stream(body: ResearchBatchRequest, request: Request):
+    """
+    Researches a list of companies with one shared graph, streaming each
+    report as soon as it completes ('report' events, or 'error' for a failed
+    company) followed by a 'progress' event, and the totals in a 'done' event.
+    At most `concurrency` companies run at a time; identical searches and
+    prompts across the batch run only once.
+    """
+    if len(body.companies) > BATCH_MAX_COMPANIES:
+        raise HTTPException(status_code=422, detail=f"At most {BATCH_MAX_COMPANIES} companies per batch")
+    concurrency = min(body.concurrency or BATCH_MAX_CONCURRENCY, BATCH_MAX_CONCURRENCY)
+
+    async def stream_events():
+        events = research_batch(
+            graphs.get(model.model_name),
+            body.companies,
+            body.criteria,
+            max_drafts=body.max_drafts or DEFAULT_MAX_REVISIONS,
+            concurrency=concurrency,
+        )
+        async for event, data in events:
+            yield sse.format_event(event, data)
+
+    return StreamingResponse(
+        sse.until_disconnected(request, stream_events()),
+        media_type=sse.MEDIA_TYPE,
+        headers=sse.HEADERS,
+    )
+
+
+def parse_topics(criteria: Union[List[str], str, None]) -> List[str]:
+    """Topics of a request, given as a list or a ";"-separated string; rejects unknown topics"""
+    topics = criteria.split(";") if isinstance(criteria, str) else list(criteria or [])
+    topics = [topic.strip() for topic in topics if topic.strip()]
+    if not topics:
+        raise ValueError("Choose at least one topic")
+    unknown = sorted(set(topics) - ALL_TOPICS)
+    if unknown:
+        raise ValueError(f"Unknown topics: {', '.join(unknown)} (expected {', '.join(sorted(ALL_TOPICS))})")
+    return topics
+
+
+def research_key(company: str, topics: List[str], max_drafts: int) -> Tuple:
+    """Normalizes request parameters so equivalent requests share a key"""
+    return (" ".join(company.lower().split()), tuple(sorted(set(topics))), max_drafts)
 
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT", 8000)))
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=int(os.getenv("PORT", 8000)),
+        timeout_graceful_shutdown=DRAIN_TIMEOUT_SECONDS,
+    )
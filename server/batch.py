@@ -0,0 +1,95 @@
+"""Research of many companies in one batch, e.g. a watchlist refresh"""
+
+import asyncio
+import logging
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, List, Sequence, Tuple
+
+from langgraph.graph.state import CompiledStateGraph
+
+from agents import metrics
+from agents.checkpoint import checkpoint_boundary
+from agents.constants import BATCH_MAX_CONCURRENCY, DEFAULT_MAX_REVISIONS
+from agents.context import run_context
+from server import sse
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_companies(companies: Sequence[str]) -> List[str]:
+    """Drops blank and repeated company names, keeping the first spelling of each"""
+    unique: Dict[str, str] = {}
+    for company in companies:
+        company = " ".join(company.split())
+        if company:
+            unique.setdefault(company.lower(), company)
+    return list(unique.values())
+
+
+async def research_batch(
+    graph: CompiledStateGraph,
+    companies: Sequence[str],
+    topics: List[str],
+    max_drafts: int = DEFAULT_MAX_REVISIONS,
+    concurrency: int = BATCH_MAX_CONCURRENCY,
+) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Researches every company with the shared graph, at most `concurrency`
+    at a time, and yields (event, data) pairs as reports complete:
+    a report (or error) event per company, in completion order, each followed
+    by a progress event, and a done event with the totals at the end.
+
+    All companies share the process-wide provider schedulers, and identical
+    search queries and LLM prompts across the batch run only once
+    (see TieredCache.get_or_compute).
+    """
+    companies = normalize_companies(companies)
+    semaphore = asyncio.Semaphore(concurrency)
+    start = time.monotonic()
+
+    async def research(company: str) -> Dict[str, Any]:
+        async with semaphore:
+            task_id = uuid.uuid4().hex
+            config = {"configurable": {"thread_id": task_id}}
+            with run_context(task_id=task_id) as run:
+                try:
+                    state = await graph.ainvoke(
+                        {"company": company, "topics": topics, "max_drafts": max_drafts}, config
+                    )
+                finally:
+                    await checkpoint_boundary(graph.checkpointer, config)
+                metrics.observe("checkpoint_bytes_per_run", run.checkpoint_bytes, metrics.SIZE_BUCKETS)
+                return state
+
+    tasks = {asyncio.create_task(research(company)): company for company in companies}
+    progress = {"completed": 0, "failed": 0, "total": len(companies)}
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                company = tasks[task]
+                if not task.cancelled() and task.exception() is None:
+                    progress["completed"] += 1
+                    metrics.increment("batch_reports_total", status="ok")
+                    state = task.result()
+                    yield sse.REPORT, {
+                        "company": company,
+                        "report": state["final_report"],
+                        "iterations": state.get("iterations", {}),
+                    }
+                else:
+                    progress["failed"] += 1
+                    metrics.increment("batch_reports_total", status="error")
+                    if task.cancelled():
+                        logger.error("Research of %s was cancelled", company)
+                    else:
+                        logger.error("Research of %s failed", company, exc_info=task.exception())
+                    yield sse.ERROR, {"company": company, "message": "Research failed, please try again."}
+                yield sse.PROGRESS, dict(progress, elapsed=round(time.monotonic() - start, 2))
+        yield sse.DONE, dict(progress, elapsed=round(time.monotonic() - start, 2))
+    finally:
+        # the consumer went away (or failed); don't keep researching for nobody
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,417 @@
+"""Background research jobs with persisted, resumable event streams"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from langgraph.graph.state import CompiledStateGraph
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from agents import metrics
+from agents.constants import (
+    JOB_ABANDON_SECONDS,
+    JOB_EVENT_FLUSH_SECONDS,
+    JOB_EVENT_FLUSH_SIZE,
+    JOB_HEARTBEAT_SECONDS,
+    JOB_POLL_SECONDS,
+    JOB_RETENTION_SECONDS,
+    JOB_STALE_SECONDS,
+    JOB_WORKERS,
+)
+from agents.context import run_context
+from server import sse
+from server.research import research_events
+from server.singleflight import Broadcast
+
+logger = logging.getLogger(__name__)
+
+# Job statuses
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"  # nobody was following it any more, see JobRunner.submit
+FINISHED = (DONE, FAILED, CANCELLED)
+
+# (offset, event, data); offsets of a job's events start at 1
+Event = Tuple[int, str, Dict[str, Any]]
+# attempt n of a job numbers its events from (n - 1) * ATTEMPT_OFFSETS + 1, so
+# events relayed but not persisted by a dead worker never share an offset with a retry's
+ATTEMPT_OFFSETS = 1_000_000
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class MemoryJobStore:
+    """MongoJobStore's in-memory counterpart"""
+
+    def __init__(self):
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self.events: Dict[str, List[Event]] = {}
+
+    async def ensure_indexes(self) -> None:
+        pass
+
+    async def create(self, job: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
+        for existing in self.jobs.values():
+            if existing.get("active_key") == job["key"]:
+                return dict(existing), False
+        self.jobs[job["_id"]] = dict(job, active_key=job["key"])
+        return dict(job), True
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self.jobs.get(job_id)
+        return dict(job) if job is not None else None
+
+    async def claim(self, worker: str, stale_before: datetime) -> Optional[Dict[str, Any]]:
+        for job in sorted(self.jobs.values(), key=lambda job: job["created_at"]):
+            if job["status"] == QUEUED or (job["status"] == RUNNING and job["heartbeat_at"] < stale_before):
+                now = _now()
+                job.update(status=RUNNING, worker=worker, heartbeat_at=now, updated_at=now)
+                job["attempts"] += 1
+                return dict(job)
+        return None
+
+    async def update(self, job_id: str, **fields) -> None:
+        job = self.jobs[job_id]
+        job.update(fields, updated_at=_now())
+        if job["status"] in FINISHED:
+            job.pop("active_key", None)
+
+    async def is_abandoned(self, job_id: str, followed_before: datetime) -> bool:
+        job = self.jobs[job_id]
+        return bool(job.get("cancel_when_abandoned")) and job["followed_at"] < followed_before
+
+    async def append_events(self, job_id: str, events: List[Event]) -> None:
+        self.events.setdefault(job_id, []).extend(events)
+
+    async def read_events(self, job_id: str, after: int, before: Optional[int] = None) -> List[Event]:
+        return [
+            event for event in self.events.get(job_id, [])
+            if event[0] > after and (before is None or event[0] < before)
+        ]
+
+    async def last_offset(self, job_id: str) -> int:
+        events = self.events.get(job_id)
+        return events[-1][0] if events else 0
+
+
+class MongoJobStore:
+    """
+    Job store shared by all web and worker processes. Unfinished jobs hold their
+    key in the uniquely indexed `active_key`, so identical jobs are queued once.
+    """
+
+    def __init__(self, jobs, events):
+        self.jobs = jobs
+        self.events = events
+
+    async def ensure_indexes(self) -> None:
+        await self.jobs.create_index([("status", 1), ("created_at", 1)])
+        await self.jobs.create_index(
+            "active_key", unique=True, partialFilterExpression={"active_key": {"$exists": True}}
+        )
+        await self.jobs.create_index("created_at", expireAfterSeconds=JOB_RETENTION_SECONDS)
+        await self.events.create_index([("job_id", 1), ("offset", 1)], unique=True)
+        await self.events.create_index("created_at", expireAfterSeconds=JOB_RETENTION_SECONDS)
+
+    async def create(self, job: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
+        while True:
+            try:
+                await self.jobs.insert_one(dict(job, active_key=job["key"]))
+                return job, True
+            except DuplicateKeyError:
+                existing = await self.jobs.find_one({"active_key": job["key"]})
+                if existing is not None:
+                    return existing, False
+                # it finished in the meantime; try again
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await self.jobs.find_one({"_id": job_id})
+
+    async def claim(self, worker: str, stale_before: datetime) -> Optional[Dict[str, Any]]:
+        now = _now()
+        return await self.jobs.find_one_and_update(
+            {"$or": [
+                {"status": QUEUED},
+                {"status": RUNNING, "heartbeat_at": {"$lt": stale_before}},
+            ]},
+            {
+                "$set": {"status": RUNNING, "worker": worker, "heartbeat_at": now, "updated_at": now},
+                "$inc": {"attempts": 1},
+            },
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def update(self, job_id: str, **fields) -> None:
+        change: Dict[str, Any] = {"$set": {**fields, "updated_at": _now()}}
+        if fields.get("status") in FINISHED:
+            change["$unset"] = {"active_key": ""}
+        await self.jobs.update_one({"_id": job_id}, change)
+
+    async def is_abandoned(self, job_id: str, followed_before: datetime) -> bool:
+        query = {"_id": job_id, "cancel_when_abandoned": True, "followed_at": {"$lt": followed_before}}
+        return await self.jobs.find_one(query, {"_id": 1}) is not None
+
+    async def append_events(self, job_id: str, events: List[Event]) -> None:
+        now = _now()
+        await self.events.insert_many(
+            [
+                {"job_id": job_id, "offset": offset, "event": event, "data": data, "created_at": now}
+                for offset, event, data in events
+            ],
+            ordered=False,
+        )
+
+    async def read_events(self, job_id: str, after: int, before: Optional[int] = None) -> List[Event]:
+        offsets: Dict[str, int] = {"$gt": after}
+        if before is not None:
+            offsets["$lt"] = before
+        cursor = self.events.find({"job_id": job_id, "offset": offsets}).sort("offset", 1)
+        return [(doc["offset"], doc["event"], doc["data"]) for doc in await cursor.to_list(None)]
+
+    async def last_offset(self, job_id: str) -> int:
+        doc = await self.events.find_one({"job_id": job_id}, sort=[("offset", -1)])
+        return doc["offset"] if doc is not None else 0
+
+
+class JobRunner:
+    """
+    Runs research jobs in background tasks of this process, independently
+    of the clients following them. Workers claim queued jobs, or jobs whose
+    worker stopped sending heartbeats, from the shared store, so any number
+    of web and worker processes can serve one queue. A job that is picked up
+    again resumes from its latest graph checkpoint.
+
+    Parameters:
+        store: MemoryJobStore or MongoJobStore
+        get_graph (callable): returns the compiled research graph to run jobs with
+        workers (int): number of jobs this process runs at a time
+        worker_id (str): name of this process in job documents
+    """
+
+    def __init__(
+        self,
+        store,
+        get_graph: Callable[[], CompiledStateGraph],
+        workers: int = JOB_WORKERS,
+        worker_id: Optional[str] = None,
+    ):
+        self.store = store
+        self.get_graph = get_graph
+        self.workers = workers
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        # jobs running in this process: id -> (offset of their first new event, live events)
+        self.live: Dict[str, Tuple[int, Broadcast]] = {}
+        # jobs running in this process: id -> the task running their graph
+        self._running: Dict[str, asyncio.Task] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        """Stops the workers; their unfinished jobs go back to the queue"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(
+        self,
+        key: Hashable,
+        initial_input: Dict[str, Any],
+        cancel_when_abandoned: bool = False,
+    ) -> Tuple[Dict[str, Any], bool]:
+        """
+        Queues a research job, unless an identical one is already queued or
+        running; returns the job and whether it was newly created. With
+        `cancel_when_abandoned`, it's cancelled once nobody follows its events.
+        """
+        now = _now()
+        job, created = await self.store.create({
+            "_id": uuid.uuid4().hex,
+            "key": json.dumps(key),
+            "input": initial_input,
+            "status": QUEUED,
+            "attempts": 0,
+            "cancel_when_abandoned": cancel_when_abandoned,
+            "followed_at": now,
+            "created_at": now,
+            "updated_at": now,
+        })
+        if created:
+            self._wakeup.set()
+        elif job.get("cancel_when_abandoned") and not cancel_when_abandoned:
+            await self.store.update(job["_id"], cancel_when_abandoned=False)
+        return job, created
+
+    async def events(self, job_id: str, after: int = 0) -> AsyncIterator[Event]:
+        """
+        Yields the events of a job after offset `after`, following the job
+        until it finishes. Events of jobs running in this process are
+        relayed live; others are read from the store as they're persisted.
+        While this runs, the job counts as followed.
+        """
+        following = asyncio.create_task(self._follow(job_id))
+        try:
+            while True:
+                live = self.live.get(job_id)
+                if live is not None:
+                    first, broadcast = live
+                    # events of earlier attempts, e.g. before a redeploy
+                    for offset, event, data in await self.store.read_events(job_id, after, before=first):
+                        yield offset, event, data
+                        after = offset
+                    async for offset, event, data in broadcast.subscribe():
+                        if offset > after:
+                            yield offset, event, data
+                            after = offset
+                    continue  # the job finished or went back to the queue
+
+                job = await self.store.get(job_id)
+                for offset, event, data in await self.store.read_events(job_id, after):
+                    yield offset, event, data
+                    after = offset
+                if job is None or job["status"] in FINISHED:
+                    return
+                await asyncio.sleep(JOB_POLL_SECONDS)
+        finally:
+            following.cancel()
+
+    async def _follow(self, job_id: str) -> None:
+        """Records, every JOB_HEARTBEAT_SECONDS, that someone is following the job"""
+        while True:
+            try:
+                await self.store.update(job_id, followed_at=_now())
+            except Exception:
+                logger.exception("Failed to record a follower of job %s", job_id)
+            await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+
+    async def _abandoned(self, job_id: str) -> bool:
+        return await self.store.is_abandoned(job_id, _now() - timedelta(seconds=JOB_ABANDON_SECONDS))
+
+    async def _work(self) -> None:
+        while True:
+            try:
+                job = await self.store.claim(self.worker_id, _now() - timedelta(seconds=JOB_STALE_SECONDS))
+            except Exception:
+                logger.exception("Failed to claim a research job")
+                job = None
+            if job is None:
+                # sooner when a job is submitted here
+                wakeup = asyncio.ensure_future(self._wakeup.wait())
+                try:
+                    await asyncio.wait({wakeup}, timeout=JOB_POLL_SECONDS)
+                finally:
+                    wakeup.cancel()
+                self._wakeup.clear()
+                continue
+            try:
+                await self._run(job)
+            except Exception:
+                # e.g. the store is unreachable; the job is taken over once its heartbeat is stale
+                logger.exception("Failed to run research job %s", job["_id"])
+
+    async def _heartbeat(self, job_id: str) -> None:
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+            try:
+                await self.store.update(job_id, heartbeat_at=_now())
+                if await self._abandoned(job_id) and job_id in self._running:
+                    self._running[job_id].cancel()
+            except Exception:
+                logger.exception("Failed to send heartbeat of job %s", job_id)
+
+    async def _until_cancelled(self, job_id: str, run: Awaitable[None]) -> bool:
+        """Runs the job's graph in a task `_heartbeat` can cancel; returns False if it did"""
+        task = asyncio.create_task(run)
+        self._running[job_id] = task
+        try:
+            # unlike awaiting the task, this raises only if this worker is stopped
+            await asyncio.wait({task})
+        finally:
+            self._running.pop(job_id, None)
+            if not task.done():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        if task.cancelled():
+            return False
+        task.result()
+        return True
+
+    async def _run(self, job: Dict[str, Any]) -> None:
+        """Runs (or resumes) a job, persisting its events in batches"""
+        job_id = job["_id"]
+        config = {"configurable": {"thread_id": job_id}}
+        resume = job["attempts"] > 1
+        first_offset = (job["attempts"] - 1) * ATTEMPT_OFFSETS
+        next_offset = max(await self.store.last_offset(job_id), first_offset) + 1
+        broadcast = Broadcast()
+        self.live[job_id] = (next_offset, broadcast)
+        pending: List[Event] = []
+        flushed_at = time.monotonic()
+
+        def record(event: str, data: Dict[str, Any]) -> None:
+            nonlocal next_offset
+            item = (next_offset, event, data)
+            next_offset += 1
+            pending.append(item)
+            broadcast.publish(item)
+
+        async def flush() -> None:
+            nonlocal flushed_at
+            if pending:
+                batch = pending[:]
+                pending.clear()
+                await self.store.append_events(job_id, batch)
+            flushed_at = time.monotonic()
+
+        async def research() -> None:
+            with run_context(task_id=job_id):
+                events = research_events(self.get_graph(), job["input"], config, resume=resume)
+                async for event, data in sse.batch_tokens(events):
+                    record(event, data)
+                    if len(pending) >= JOB_EVENT_FLUSH_SIZE or time.monotonic() - flushed_at >= JOB_EVENT_FLUSH_SECONDS:
+                        await flush()
+
+        if resume:
+            metrics.increment("jobs_resumed_total")
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        status = FAILED
+        try:
+            # (a queued job can be abandoned before it starts)
+            if await self._abandoned(job_id) or not await self._until_cancelled(job_id, research()):
+                logger.info("Research job %s was abandoned; cancelled it", job_id)
+                record(sse.ERROR, {"message": "Research was cancelled: nobody was following it."})
+                status = CANCELLED
+            else:
+                record(sse.DONE, {"task_id": job_id})
+                status = DONE
+        except asyncio.CancelledError:
+            # the process is shutting down; another worker picks the job up
+            status = QUEUED
+            raise
+        except Exception:
+            logger.exception("Research job %s failed", job_id)
+            record(sse.ERROR, {"message": "Research failed, please try again."})
+        finally:
+            heartbeat.cancel()
+            try:
+                await flush()
+                await self.store.update(job_id, status=status)
+            finally:
+                metrics.increment("jobs_total", status=status)
+                broadcast.close()
+                self.live.pop(job_id, None)
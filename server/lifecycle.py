@@ -0,0 +1,160 @@
+"""Process lifecycle: dependency checks, readiness, graceful drain and startup cost"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from starlette.responses import JSONResponse
+
+from agents import metrics
+from agents.constants import HEALTH_CHECK_INTERVAL_SECONDS, HEALTH_CHECK_TIMEOUT_SECONDS
+
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# paths that are served while draining, and not counted as in-flight requests
+PROBE_PATHS = ("/healthz", "/readyz", "/metrics")
+
+
+def process_age() -> Optional[float]:
+    """Seconds since this process started (or was forked), None where /proc isn't available"""
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+    return round(uptime - start_ticks / os.sysconf("SC_CLK_TCK"), 2)
+
+
+def memory_usage() -> Dict[str, int]:
+    """
+    Resident memory of this process, in bytes. `private_bytes` leaves out pages
+    still shared with the gunicorn master the worker was forked from (see
+    gunicorn.conf.py), i.e. what each additional worker costs.
+    """
+    usage = {}
+    if resource is not None:
+        usage["max_rss_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+    except OSError:
+        return usage
+    kb = lambda name: int(fields.get(name, "0 kB").split()[0]) * 1024
+    usage["rss_bytes"] = kb("Rss")
+    usage["private_bytes"] = kb("Private_Clean") + kb("Private_Dirty")
+    return usage
+
+
+class Lifecycle:
+    """
+    Tracks whether this process can take traffic. It's ready once startup has
+    finished and its dependency checks pass, and stops being ready as soon
+    as it starts draining, so load balancers move traffic elsewhere while
+    in-flight requests (e.g. research streams) finish.
+    """
+
+    def __init__(self):
+        self.checks: Dict[str, Callable[[], Awaitable[Any]]] = {}
+        self.started = False
+        self.draining = False
+        self.cold_start: Optional[float] = None
+        self.in_flight = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._checked_at = float("-inf")
+        self._results: Dict[str, str] = {}
+
+    def add_check(self, name: str, check: Callable[[], Awaitable[Any]]) -> None:
+        """Adds a dependency check: a coroutine function that raises when the dependency is down"""
+        self.checks[name] = check
+
+    async def check(self, max_age: float = HEALTH_CHECK_INTERVAL_SECONDS) -> Dict[str, str]:
+        """Runs the dependency checks concurrently, unless they ran in the last `max_age` seconds"""
+        if time.monotonic() - self._checked_at < max_age:
+            return self._results
+
+        async def run(check) -> str:
+            try:
+                await asyncio.wait_for(check(), HEALTH_CHECK_TIMEOUT_SECONDS)
+                return "ok"
+            except Exception as e:
+                return f"error: {e!r}"
+
+        results = await asyncio.gather(*(run(check) for check in self.checks.values()))
+        self._results = dict(zip(self.checks, results))
+        self._checked_at = time.monotonic()
+        for name, result in self._results.items():
+            metrics.set_gauge("dependency_up", float(result == "ok"), dependency=name)
+        return self._results
+
+    async def ready(self) -> bool:
+        if not self.started or self.draining:
+            return False
+        return all(result == "ok" for result in (await self.check()).values())
+
+    def mark_started(self) -> Dict[str, Any]:
+        """Records the end of startup, with how long it took and the memory it left in use"""
+        self.started = True
+        self.cold_start = process_age()
+        memory = memory_usage()
+        if self.cold_start is not None:
+            metrics.set_gauge("process_cold_start_seconds", self.cold_start)
+        for name, value in memory.items():
+            metrics.set_gauge(f"process_{name}", value)
+        return {"pid": os.getpid(), "cold_start_seconds": self.cold_start, **memory}
+
+    def request_started(self) -> None:
+        self.in_flight += 1
+        self._idle.clear()
+
+    def request_finished(self) -> None:
+        self.in_flight -= 1
+        if self.in_flight == 0:
+            self._idle.set()
+
+    def start_draining(self) -> None:
+        """Stops being ready; new requests are turned away, in-flight ones go on"""
+        self.draining = True
+
+    async def drain(self, timeout: float) -> bool:
+        """Waits up to `timeout` seconds for in-flight requests to finish; returns whether they did"""
+        self.start_draining()
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            logger.warning("%d requests still running after draining for %ss", self.in_flight, timeout)
+            return False
+
+
+class InFlightMiddleware:
+    """
+    ASGI middleware counting a Lifecycle's in-flight HTTP requests until their
+    response, streams included, has been sent, and turning new ones away while it drains
+    """
+
+    def __init__(self, app, lifecycle: Lifecycle):
+        self.app = app
+        self.lifecycle = lifecycle
+
+    async def __call__(self, scope, receive, send):
+        lifecycle = self.lifecycle
+        if scope["type"] != "http" or scope["path"] in PROBE_PATHS:
+            return await self.app(scope, receive, send)
+        if lifecycle.draining:
+            response = JSONResponse({"detail": "Shutting down"}, status_code=503, headers={"Connection": "close"})
+            return await response(scope, receive, send)
+        lifecycle.request_started()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            lifecycle.request_finished()
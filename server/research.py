@@ -0,0 +1,95 @@
+"""Translation of research graph runs into client-facing stream events"""
+
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+from langgraph.graph.state import CompiledStateGraph
+
+from agents import metrics, progress
+from agents.checkpoint import checkpoint_boundary
+from agents.constants import NODE_TO_TEXT, TOPIC_NAMES_MAPPING
+from agents.context import current_run
+from server import sse
+
+
+async def research_events(
+    graph: CompiledStateGraph,
+    initial_input: Dict[str, Any],
+    config: Dict[str, Any],
+    resume: bool = False,
+) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Runs the research graph and yields (event, data) pairs:
+    status updates while topic agents work, then each section's polished
+    HTML as soon as its topic agent polishes it, independently of the others.
+
+    With `resume`, the run continues from the thread's latest checkpoint,
+    if there is one, instead of starting over. Sections finished before the checkpoint are
+    sent again whole; a section event always (re)starts its section.
+    """
+    topics = initial_input["topics"]
+    # subgraph namespace -> topic, learned from the topic agents' updates
+    topic_of_namespace: Dict[str, str] = {}
+    started = set()
+
+    def start_section(topic: str):
+        started.add(topic)
+        return sse.SECTION, {
+            "id": topic,
+            "title": TOPIC_NAMES_MAPPING.get(topic, topic),
+            "index": topics.index(topic) if topic in topics else len(topics),
+        }
+
+    graph_input: Optional[Dict[str, Any]] = initial_input
+    if resume:
+        state = await graph.aget_state(config)
+        if state.created_at is not None:
+            graph_input = None
+            for topic, section in state.values.get("reports", {}).items():
+                yield start_section(topic)
+                yield sse.TOKEN, {"section": topic, "text": section}
+
+    try:
+        # only the small progress events nodes write and the polished sections'
+        # tokens; full state updates (documents, drafts) never leave the graph
+        async for namespace, mode, chunk in graph.astream(
+            input=graph_input,
+            config=config,
+            stream_mode=["custom", "messages"],
+            subgraphs=True,
+        ):
+            if mode == "messages":
+                msg, metadata = chunk
+                if metadata.get("langgraph_node") != "polish_node" or not msg.content:
+                    continue
+                topic = topic_of_namespace.get(namespace[0]) if namespace else None
+                if topic is None:
+                    continue
+                if topic not in started:
+                    yield start_section(topic)
+                yield sse.TOKEN, {"section": topic, "text": msg.content}
+                continue
+
+            topic = chunk.get("topic") or ""
+            if namespace and topic:
+                topic_of_namespace[namespace[0]] = topic
+
+            # sections reused from earlier runs and cached model responses
+            # aren't streamed; send the section whole
+            if chunk["kind"] == progress.SECTION:
+                if topic not in started:
+                    yield start_section(topic)
+                    yield sse.TOKEN, {"section": topic, "text": chunk["text"]}
+                continue
+
+            # yield a user-facing description of the current status, with the step's progress
+            node = chunk["node"]
+            if node in NODE_TO_TEXT:
+                text = NODE_TO_TEXT[node].format(topic=TOPIC_NAMES_MAPPING.get(topic, ""))
+                yield sse.STATUS, {"text": text, **{k: v for k, v in chunk.items() if k != "kind"}}
+    finally:
+        # the run ended, was interrupted or was abandoned: a boundary for the checkpointer
+        await checkpoint_boundary(graph.checkpointer, config)
+
+    run = current_run()
+    if run is not None:
+        metrics.observe("checkpoint_bytes_per_run", run.checkpoint_bytes, metrics.SIZE_BUCKETS)
@@ -0,0 +1,112 @@
+"""Coalescing of identical in-flight research streams"""
+
+import asyncio
+import logging
+from typing import AsyncIterator, Callable, Dict, Hashable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# marks the end of a broadcast in subscriber queues
+_END = object()
+
+
+class Broadcast:
+    """
+    Fans the chunks of one producer stream out to any number of subscribers.
+    Late subscribers first get a replay of everything published so far,
+    then follow the live stream.
+    """
+
+    def __init__(self):
+        self.history: List[str] = []
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def publish(self, chunk: str) -> None:
+        self.history.append(chunk)
+        for queue in self.subscribers:
+            queue.put_nowait(chunk)
+
+    def close(self, error: Optional[BaseException] = None) -> None:
+        self.done = True
+        self.error = error
+        for queue in self.subscribers:
+            queue.put_nowait(_END)
+
+    def subscribe(self) -> AsyncIterator[str]:
+        """
+        Registers a subscriber right away, before it's first iterated, so the
+        producer isn't cancelled under a caller that has only just joined
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        # snapshot the history and register atomically (no awaits in between)
+        # so no chunk is either missed or delivered twice
+        replay = list(self.history)
+        if not self.done:
+            self.subscribers.add(queue)
+        return self._follow(queue, replay, self.done)
+
+    async def _follow(self, queue: asyncio.Queue, replay: List[str], done: bool) -> AsyncIterator[str]:
+        try:
+            for chunk in replay:
+                yield chunk
+            if not done:
+                while (chunk := await queue.get()) is not _END:
+                    yield chunk
+            if self.error is not None:
+                raise self.error
+        finally:
+            self.subscribers.discard(queue)
+            # nobody is listening anymore: stop the producer instead of
+            # spending LLM and search calls on a report nobody will read
+            if not self.subscribers and not self.done and self.task is not None:
+                logger.info("All subscribers left, cancelling stream")
+                self.task.cancel()
+
+    async def run(self, source: AsyncIterator[str]) -> None:
+        """Publishes every chunk of `source`, then closes the broadcast"""
+        try:
+            async for chunk in source:
+                self.publish(chunk)
+        except asyncio.CancelledError as e:
+            self.close(e)
+            raise
+        except Exception as e:
+            logger.exception("Broadcast source failed")
+            self.close(e)
+        else:
+            self.close()
+
+
+class SingleFlight:
+    """
+    Runs at most one stream per key. Callers asking for a key that is already
+    in flight attach to the running stream instead of starting a new one.
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, Broadcast] = {}
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    def stream(
+        self, key: Hashable, factory: Callable[[], AsyncIterator[str]]
+    ) -> AsyncIterator[str]:
+        """
+        Returns a subscription to the stream for `key`,
+        calling `factory` to start it if none is in flight.
+        """
+        broadcast = self._flights.get(key)
+        if broadcast is None:
+            broadcast = self._flights[key] = Broadcast()
+            broadcast.task = asyncio.create_task(broadcast.run(factory()))
+            broadcast.task.add_done_callback(lambda _: self._forget(key, broadcast))
+        return broadcast.subscribe()
+
+    def _forget(self, key: Hashable, broadcast: Broadcast) -> None:
+        # a newer stream may have taken the key since
+        if self._flights.get(key) is broadcast:
+            del self._flights[key]
@@ -0,0 +1,140 @@
+"""Server-sent events (SSE) framing and token batching"""
+
+import asyncio
+import contextlib
+import json
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from starlette.requests import Request
+
+from agents.constants import (
+    DISCONNECT_POLL_SECONDS,
+    TOKEN_BATCH_MAX_CHARS,
+    TOKEN_BATCH_MAX_DELAY_SECONDS,
+)
+
+# Event types of the /research stream
+STATUS = "status"  # {"text", "node", "topic", "iteration", "docs", "elapsed"}: user-facing description of the step just finished, and its progress
+SECTION = "section"  # {"id", "title", "index"}: a report section (re)starts
+TOKEN = "token"  # {"section", "text"}: report text to append to a section
+TRACE = "trace"  # {"summary", "spans", "queries", "checkpoint_bytes"}: timing trace, search queries and checkpoint size of the run, when requested
+DONE = "done"  # {"task_id"}: the report is complete
+ERROR = "error"  # {"message"}: the run failed
+# ... and of the /research/batch stream
+REPORT = "report"  # {"company", "report", "iterations"}: one company's finished report
+PROGRESS = "progress"  # {"completed", "failed", "total", "elapsed"}: batch progress, also sent with done
+
+# SSE comment line; ignored by clients, but lets us notice dead connections
+HEARTBEAT = ": keep-alive\n\n"
+
+MEDIA_TYPE = "text/event-stream"
+HEADERS = {
+    "Cache-Control": "no-cache",
+    # ask nginx-style proxies not to buffer the stream
+    "X-Accel-Buffering": "no",
+}
+
+
+def format_event(event: str, data: Any, event_id: Optional[int] = None) -> str:
+    """
+    Frames one event; the blank line terminator survives proxy chunk merging.
+    An `event_id` lets a reconnecting client resume after it (Last-Event-ID).
+    """
+    frame = f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    return frame if event_id is None else f"id: {event_id}\n{frame}"
+
+
+async def batch_tokens(
+    events: AsyncIterator[Tuple[str, Dict[str, Any]]],
+    max_chars: int = TOKEN_BATCH_MAX_CHARS,
+    max_delay: float = TOKEN_BATCH_MAX_DELAY_SECONDS,
+) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Coalesces the token events of an (event, data) stream, per section.
+    Pending tokens are flushed whenever they reach `max_chars`, the oldest one
+    has waited `max_delay` seconds, or any other event comes through
+    (so events keep their relative order).
+    """
+    loop = asyncio.get_running_loop()
+    iterator = events.__aiter__()
+    buffers: Dict[str, List[str]] = {}
+    size, deadline = 0, None
+    pending = None
+
+    def flush():
+        nonlocal size, deadline
+        batches = [(TOKEN, {"section": section, "text": "".join(texts)}) for section, texts in buffers.items()]
+        buffers.clear()
+        size, deadline = 0, None
+        return batches
+
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            timeout = None if deadline is None else max(deadline - loop.time(), 0)
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+
+            if done:
+                finished, pending = pending, None
+                try:
+                    event, data = finished.result()
+                except StopAsyncIteration:
+                    break
+                if event != TOKEN:
+                    for batch in flush():
+                        yield batch
+                    yield event, data
+                    continue
+                if deadline is None:
+                    deadline = loop.time() + max_delay
+                buffers.setdefault(data["section"], []).append(data["text"])
+                size += len(data["text"])
+
+            if buffers and (size >= max_chars or loop.time() >= deadline):
+                for batch in flush():
+                    yield batch
+
+        for batch in flush():
+            yield batch
+    finally:
+        if pending is not None:
+            pending.cancel()
+
+
+async def until_disconnected(
+    request: Request,
+    stream: AsyncIterator[str],
+    interval: float = DISCONNECT_POLL_SECONDS,
+) -> AsyncIterator[str]:
+    """
+    Relays `stream` to the client, checking for a disconnect whenever the
+    stream has been quiet for `interval` seconds (e.g. while a long LLM call
+    runs). On disconnect the stream is closed, which lets its producer stop.
+    """
+    iterator = stream.__aiter__()
+    pending = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            done, _ = await asyncio.wait({pending}, timeout=interval)
+            if not done:
+                if await request.is_disconnected():
+                    return
+                yield HEARTBEAT
+                continue
+            finished, pending = pending, None
+            try:
+                chunk = finished.result()
+            except StopAsyncIteration:
+                return
+            yield chunk
+    finally:
+        # closing the stream runs its cleanup (e.g. unsubscribing),
+        # but only once no step of it is still running
+        if pending is not None:
+            pending.cancel()
+            with contextlib.suppress(asyncio.CancelledError, StopAsyncIteration):
+                await pending
+        await iterator.aclose()
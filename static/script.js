@@ -1,4 +1,91 @@
+// closing tags that end a top-level block of report HTML
+const BLOCK_END = /<\/(p|h[1-6]|ul|ol|table|pre|blockquote)>/gi;
 
+// whether all lists/tables opened in the html are closed again
+function isBalanced(html) {
+    const opened = (html.match(/<(ul|ol|table)[\s>]/gi) || []).length;
+    const closed = (html.match(/<\/(ul|ol|table)>/gi) || []).length;
+    return opened === closed;
+}
+
+// Creates the container a report section streams into. Sections arrive
+// in whatever order their topics finish; `index` keeps the requested order.
+// A section that starts again (e.g. after a resumed job) replaces the old one.
+function createSection(report, id, index) {
+    const previous = document.getElementById("section-" + id);
+    if (previous) previous.remove();
+    const element = document.createElement("div");
+    element.id = "section-" + id;
+    element.className = "report-section";
+    element.dataset.index = index;
+    const tail = document.createElement("div");
+    element.appendChild(tail);
+
+    const next = [...report.querySelectorAll(".report-section")].find(
+        (section) => Number(section.dataset.index) > index
+    );
+    report.insertBefore(element, next || null);
+    return { element: element, tail: tail, pending: "" };
+}
+
+// Appends streamed HTML to a section. Complete blocks are inserted into the
+// DOM once; only the unfinished tail is re-rendered on each update.
+function appendToSection(section, text) {
+    section.pending += text;
+    let commitAt = -1;
+    for (const match of section.pending.matchAll(BLOCK_END)) {
+        const end = match.index + match[0].length;
+        if (isBalanced(section.pending.slice(0, end))) commitAt = end;
+    }
+    if (commitAt > 0) {
+        section.tail.insertAdjacentHTML("beforebegin", section.pending.slice(0, commitAt));
+        section.pending = section.pending.slice(commitAt);
+    }
+    section.tail.innerHTML = section.pending;
+}
+
+// Parses server-sent event frames, calling onEvent(type, data, id) for each one.
+// Frames may be split or merged arbitrarily across network chunks.
+async function readEvents(response, onEvent) {
+    const decoder = new TextDecoder();
+    const reader = response.body.getReader();
+    let buffer = "";
+
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+            const frame = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let type = "message";
+            let id = null;
+            const data = [];
+            for (const line of frame.split("\n")) {
+                if (line.startsWith("event:")) type = line.slice(6).trim();
+                else if (line.startsWith("data:")) data.push(line.slice(5).trimStart());
+                else if (line.startsWith("id:")) id = line.slice(3).trim();
+            }
+            if (data.length) onEvent(type, JSON.parse(data.join("\n")), id);
+        }
+    }
+}
+
+// Message to show for a failed request: the server's detail, or the HTTP status
+async function errorMessage(response) {
+    try {
+        const body = await response.json();
+        if (typeof body.detail === "string") return body.detail;
+        // request validation errors: a list of {loc, msg}
+        if (Array.isArray(body.detail) && body.detail.length) return body.detail[0].msg;
+    } catch (error) {
+        // not JSON
+    }
+    return "Request failed (" + response.status + "), please try again.";
+}
 
 document.getElementById('startResearch').addEventListener('click', async () => {
     // hide header to get more space
@@ -7,46 +94,70 @@ document.getElementById('startResearch').addEventListener('click', async () => {
     // get user's search criteria
     const searchCriteria = [...document.querySelectorAll( ":checked" )].map( e => e.id)
     const userInput = document.getElementById('userInput').value;
-    // post a loading message
     var report = document.getElementById('report')
 
-    // make a GET request to server
-    criteriaString = searchCriteria.join(";")
-    const response = await fetch(
-        '/research?' + new URLSearchParams({ company: userInput, criteria: criteriaString}).toString(), 
-        {
-            method: "GET",
-            headers: {"Content-Type": "text/html"},
+    // status line above the sections, kept until the report is done
+    report.innerHTML = "";
+    const status = document.createElement("p");
+    status.className = "status";
+    report.appendChild(status);
+    const sections = {};
 
+    // queue the research job; it keeps running through dropped connections,
+    // and is cancelled once this page has stopped following it for a while
+    let job;
+    try {
+        const response = await fetch("/research", {
+            method: "POST",
+            headers: {"Content-Type": "application/json"},
+            body: JSON.stringify({ company: userInput, criteria: searchCriteria, cancel_when_abandoned: true }),
+        });
+        if (!response.ok) {
+            status.textContent = await errorMessage(response);
+            return;
         }
-    );
-    // TextDecoder to decode chunks
-    const decoder = new TextDecoder(); 
-    const reader = response.body.getReader();
-    var streamingReport = false;
-    var output = ""
-
-    while (true) {
-        const { done, value } = await reader.read();
-
-        // Decode and append the chunk
-        const chunk = decoder.decode(value);
+        job = await response.json();
+    } catch (error) {
+        status.textContent = "Could not reach the server, please try again.";
+        return;
+    }
 
-        if (chunk == "<REPORT_STREAM>"){
-            console.log("streaming report...")
-            // clean screen
-            output = '';
-            // from now on add input 
-            streamingReport = true
-        }
-        else if (streamingReport == true){
-            output += chunk
+    // follow the job, reconnecting after the last event received until it ends
+    let lastEventId = "0";
+    let finished = false;
+    while (!finished) {
+        try {
+            const response = await fetch("/research/" + job.job_id + "/stream", {
+                headers: {"Accept": "text/event-stream", "Last-Event-ID": lastEventId},
+            });
+            if (!response.ok) {
+                // e.g. the job is unknown; retrying wouldn't help
+                status.textContent = await errorMessage(response);
+                break;
+            }
+            await readEvents(response, (type, data, id) => {
+                if (id !== null) lastEventId = id;
+                if (type == "status") {
+                    status.textContent = data.text;
+                }
+                else if (type == "section") {
+                    sections[data.id] = createSection(report, data.id, data.index);
+                }
+                else if (type == "token") {
+                    appendToSection(sections[data.section], data.text);
+                }
+                else if (type == "done") {
+                    status.remove();
+                    finished = true;
+                }
+                else if (type == "error") {
+                    status.textContent = data.message;
+                    finished = true;
+                }
+            });
+        } catch (error) {
+            // connection lost; retry below
         }
-        else {
-            output = chunk
-        }
-        report.innerHTML = output
-        if (done) break;
+        if (!finished) await new Promise((resolve) => setTimeout(resolve, 1000));
     }
-
 });
@@ -0,0 +1,43 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from server.jobs import JobRunner, MemoryJobStore
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(main, "jobs", JobRunner(MemoryJobStore(), lambda: None, workers=0))
+    return TestClient(main.app)
+
+
+@pytest.mark.parametrize("criteria", ["", [], "background;nonsense", ["recent_news", "weather"]])
+def test_job_with_no_or_unknown_topics_is_rejected(client, criteria):
+    response = client.post("/research", json={"company": "Acme", "criteria": criteria})
+    assert response.status_code == 422
+    assert len(main.jobs.store.jobs) == 0
+
+
+def test_job_topics_may_be_a_list_or_a_string(client):
+    for criteria in ["background;recent_news", ["background", "recent_news"]]:
+        response = client.post("/research", json={"company": "Acme", "criteria": criteria})
+        assert response.status_code == 200
+    job = main.jobs.store.jobs[response.json()["job_id"]]
+    assert job["input"]["topics"] == ["background", "recent_news"]
+    assert len(main.jobs.store.jobs) == 1
+
+
+@pytest.mark.parametrize("query", ["company=Acme", "company=Acme&criteria=", "company=Acme&criteria=nonsense"])
+def test_research_stream_with_no_or_unknown_topics_is_rejected(client, query):
+    assert client.get(f"/research?{query}").status_code == 422
+
+
+def test_batch_with_unknown_topics_is_rejected(client):
+    response = client.post("/research/batch", json={"companies": ["Acme", "Globex"], "criteria": "background;weather"})
+    assert response.status_code == 422
+
+
+def test_stream_with_a_malformed_last_event_id_is_rejected(client):
+    job_id = client.post("/research", json={"company": "Acme", "criteria": ["background"]}).json()["job_id"]
+    response = client.get(f"/research/{job_id}/stream", headers={"Last-Event-ID": "abc"})
+    assert response.status_code == 400
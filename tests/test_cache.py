@@ -0,0 +1,50 @@
+import asyncio
+
+from agents.cache import InFlight
+
+
+def test_concurrent_callers_share_one_computation():
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def main():
+        flights = InFlight()
+        results = await asyncio.gather(*(flights.run("key", compute) for _ in range(3)))
+        await asyncio.sleep(0)
+        return results, len(flights)
+
+    results, remaining = asyncio.run(main())
+    assert results == [("result", False), ("result", True), ("result", True)]
+    assert calls == [1]
+    assert remaining == 0
+
+
+def test_a_caller_after_a_cancelled_computation_starts_over():
+    started = []
+
+    async def compute():
+        started.append(1)
+        try:
+            await asyncio.sleep(0.05)
+        except asyncio.CancelledError:
+            await asyncio.sleep(0.01)  # slow to wind down
+            raise
+        return "result"
+
+    async def main():
+        flights = InFlight()
+        first = asyncio.create_task(flights.run("key", compute))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        await asyncio.sleep(0)
+        # the cancelled computation is still winding down
+        result = await flights.run("key", compute)
+        await asyncio.sleep(0.02)
+        return result, len(flights)
+
+    assert asyncio.run(main()) == (("result", False), 0)
+    assert len(started) == 2
@@ -0,0 +1,151 @@
+import asyncio
+from typing import TypedDict
+
+import pytest
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph import END, START, StateGraph
+
+from agents import metrics
+from agents.checkpoint import (
+    BATCHED,
+    BOUNDARY_ONLY,
+    EVERY_STEP,
+    DurableCheckpointer,
+    InstrumentedCheckpointer,
+    _latest,
+    checkpoint_boundary,
+)
+from agents.context import run_context
+
+
+class State(TypedDict):
+    steps: int
+
+
+def build_graph(checkpointer, steps: int = 3):
+    async def step(state):
+        await asyncio.sleep(0)
+        return {"steps": state["steps"] + 1}
+
+    graph = StateGraph(State)
+    names = [f"step{i}" for i in range(steps)]
+    for name in names:
+        graph.add_node(name, step)
+    for a, b in zip([START] + names, names + [END]):
+        graph.add_edge(a, b)
+    return graph.compile(checkpointer=checkpointer)
+
+
+def persisted(saver: MemorySaver, thread_id: str) -> int:
+    """Checkpoints of the thread in the backend, across namespaces"""
+    return sum(len(checkpoints) for checkpoints in saver.storage.get(thread_id, {}).values())
+
+
+def config(thread_id: str):
+    return {"configurable": {"thread_id": thread_id}}
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        DurableCheckpointer(MemorySaver(), mode="sometimes")
+
+
+def test_every_step_persists_each_checkpoint():
+    backend = MemorySaver()
+    checkpointer = DurableCheckpointer(backend, mode=EVERY_STEP)
+
+    async def main():
+        await build_graph(checkpointer).ainvoke({"steps": 0}, config("t"))
+
+    asyncio.run(main())
+    assert persisted(backend, "t") == 5  # input, three steps and the end
+    assert not checkpointer.local.storage
+
+
+def test_boundary_only_persists_the_latest_checkpoint_at_the_boundary():
+    backend = MemorySaver()
+    checkpointer = DurableCheckpointer(backend, mode=BOUNDARY_ONLY)
+    graph = build_graph(checkpointer)
+
+    async def main():
+        await graph.ainvoke({"steps": 0}, config("t"))
+        assert persisted(backend, "t") == 0
+        # the running thread is read from memory
+        assert (await graph.aget_state(config("t"))).values == {"steps": 3}
+        await checkpoint_boundary(checkpointer, config("t"))
+        assert persisted(backend, "t") == 1
+        assert not checkpointer.local.storage
+        return (await graph.aget_state(config("t"))).values
+
+    assert asyncio.run(main()) == {"steps": 3}
+
+
+def test_batched_flushes_in_the_background():
+    backend = MemorySaver()
+    checkpointer = DurableCheckpointer(backend, mode=BATCHED, flush_size=2, flush_seconds=0.01)
+
+    async def main():
+        await build_graph(checkpointer).ainvoke({"steps": 0}, config("t"))
+        await asyncio.sleep(0.1)
+        return persisted(backend, "t")
+
+    assert asyncio.run(main()) == 5
+
+
+def test_a_resumed_thread_continues_from_its_persisted_checkpoint():
+    backend = MemorySaver()
+
+    async def main():
+        first = DurableCheckpointer(backend, mode=BOUNDARY_ONLY)
+        await build_graph(first).ainvoke({"steps": 0}, config("t"))
+        await checkpoint_boundary(first, config("t"))
+        # e.g. another process: nothing in memory, read from the backend
+        second = DurableCheckpointer(backend, mode=BOUNDARY_ONLY)
+        return await build_graph(second).aget_state(config("t"))
+
+    assert asyncio.run(main()).values == {"steps": 3}
+
+
+def test_batched_flushes_charge_each_run_for_its_own_bytes():
+    checkpointer = DurableCheckpointer(
+        InstrumentedCheckpointer(MemorySaver()), mode=BATCHED, flush_size=4, flush_seconds=0.01
+    )
+    graph = build_graph(checkpointer, steps=6)
+    before = sum(metrics.snapshot().get("checkpoint_bytes_total", {}).values())
+
+    async def research(thread_id):
+        with run_context(task_id=thread_id) as run:
+            await graph.ainvoke({"steps": 0}, config(thread_id))
+            await checkpoint_boundary(checkpointer, config(thread_id))
+        return run.checkpoint_bytes
+
+    async def main():
+        return await asyncio.gather(*(research(f"t{i}") for i in range(3)))
+
+    charged = asyncio.run(main())
+    total = sum(metrics.snapshot()["checkpoint_bytes_total"].values()) - before
+    assert sum(charged) == total
+    # the runs are alike, so each one's share should be about a third
+    assert all(bytes_ > total / 6 for bytes_ in charged)
+
+
+def put(ns: str, checkpoint_id: str):
+    return ("put", ({"configurable": {"checkpoint_ns": ns}}, {"id": checkpoint_id}, {}, {}))
+
+
+def writes(ns: str, checkpoint_id: str):
+    return ("writes", ({"configurable": {"checkpoint_ns": ns, "checkpoint_id": checkpoint_id}}, [], "task", ""))
+
+
+def test_latest_keeps_the_last_checkpoint_of_each_namespace_and_its_writes():
+    ops = [
+        put("", "1"), writes("", "1"),
+        put("sub", "a"),
+        put("", "2"), writes("", "2"),
+        put("sub", "b"), writes("sub", "a"), writes("sub", "b"),
+    ]
+    assert _latest(ops) == [put("", "2"), put("sub", "b"), writes("", "2"), writes("sub", "b")]
+
+
+def test_latest_of_nothing_is_nothing():
+    assert _latest([]) == []
@@ -0,0 +1,20 @@
+import asyncio
+
+from agents import corpus, metrics
+
+
+def test_document_counts_are_values_not_labels():
+    before = dict(metrics.snapshot().get("corpus_docs_total", {}))
+
+    async def main():
+        corpus.set_store(corpus.MemoryCorpusStore())
+        refs = await corpus.store(["first document", "second document", "third document"])
+        corpus._memory.clear()
+        return await corpus.load(refs)
+
+    assert asyncio.run(main()) == ["first document", "second document", "third document"]
+    after = metrics.snapshot()["corpus_docs_total"]
+    assert after["name=put"] - before.get("name=put", 0) == 3
+    assert after["name=get"] - before.get("name=get", 0) == 3
+    durations = [line for line in metrics.render_prometheus().splitlines() if line.startswith("corpus_duration")]
+    assert durations and not any("docs=" in line for line in durations)
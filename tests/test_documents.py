@@ -0,0 +1,30 @@
+from agents.documents import DocumentStore, minhash, similarity
+
+ARTICLE = (
+    "Acme Corporation reported record quarterly revenue of 4.2 billion dollars, driven by strong "
+    "demand for its industrial robots in Europe and Asia. The company raised its full year guidance "
+    "and announced a new share buyback program worth 500 million dollars."
+)
+
+
+def test_exact_and_empty_documents_are_dropped():
+    store = DocumentStore()
+    assert store.add(ARTICLE)
+    assert not store.add(ARTICLE)
+    assert not store.add("   ")
+    assert len(store) == 1
+
+
+def test_near_duplicates_are_dropped():
+    store = DocumentStore([ARTICLE])
+    syndicated = ARTICLE + " (Reuters)"
+    assert similarity(minhash(ARTICLE), minhash(syndicated)) > store.threshold
+    assert not store.add(syndicated)
+    assert store.add("Globex announced the departure of its chief financial officer after six years.")
+    assert store.docs[0] == ARTICLE
+    assert len(store) == 2
+
+
+def test_extend_counts_new_documents():
+    store = DocumentStore()
+    assert store.extend([ARTICLE, ARTICLE, "Another, unrelated document about shipping rates."]) == 2
@@ -0,0 +1,162 @@
+import asyncio
+from datetime import timedelta
+
+import pytest
+from langgraph.checkpoint.memory import MemorySaver
+
+from agents import search
+from agents.registry import GraphRegistry
+from benchmarks.fakes import FakeChatModel, FakeSearchClient
+from server import jobs as jobs_module
+from server.jobs import (
+    ATTEMPT_OFFSETS,
+    CANCELLED,
+    DONE,
+    QUEUED,
+    RUNNING,
+    JobRunner,
+    MemoryJobStore,
+    _now,
+)
+
+INPUT = {"company": "Acme", "topics": ["background"], "max_drafts": 1}
+
+
+@pytest.fixture
+def graph(monkeypatch):
+    monkeypatch.setattr("agents.llm.CACHE_ENABLED", False)
+    search.set_client(FakeSearchClient(latency=0.01))
+    search.cache.memory.clear()
+    model = FakeChatModel(latency=0.01, structured_latency=0.01, tokens_per_second=5000)
+    return GraphRegistry(MemorySaver()).register("fake", model)
+
+
+def job_document(job_id: str, **fields):
+    now = _now()
+    job = {"_id": job_id, "key": job_id, "input": INPUT, "status": QUEUED, "attempts": 0,
+           "created_at": now, "updated_at": now}
+    job.update(fields)
+    return job
+
+
+def test_store_dedupes_unfinished_jobs_by_key():
+    async def main():
+        store = MemoryJobStore()
+        job, created = await store.create(job_document("a", key="k"))
+        same, created_again = await store.create(job_document("b", key="k"))
+        assert (created, created_again, same["_id"]) == (True, False, "a")
+        await store.update("a", status=DONE)
+        # a finished job releases its key
+        new, created_new = await store.create(job_document("c", key="k"))
+        assert (created_new, new["_id"]) == (True, "c")
+
+    asyncio.run(main())
+
+
+def test_claim_takes_the_oldest_queued_job_then_stale_running_ones():
+    async def main():
+        store = MemoryJobStore()
+        now = _now()
+        await store.create(job_document("new", created_at=now))
+        await store.create(job_document("old", created_at=now - timedelta(minutes=1)))
+        await store.create(job_document(
+            "stale", key="s", status=RUNNING, attempts=1,
+            heartbeat_at=now - timedelta(minutes=5), created_at=now - timedelta(minutes=10),
+        ))
+        await store.create(job_document(
+            "alive", key="l", status=RUNNING, attempts=1,
+            heartbeat_at=now, created_at=now - timedelta(minutes=20),
+        ))
+        stale_before = now - timedelta(minutes=1)
+        claimed = [await store.claim("w", stale_before) for _ in range(4)]
+        return [(job["_id"], job["attempts"]) if job else None for job in claimed]
+
+    assert asyncio.run(main()) == [("stale", 2), ("old", 1), ("new", 1), None]
+
+
+def test_job_runs_to_done_with_offsets_from_one(graph):
+    async def main():
+        runner = JobRunner(MemoryJobStore(), lambda: graph, workers=1)
+        runner.start()
+        try:
+            job, created = await runner.submit(("acme",), INPUT)
+            events = [event async for event in runner.events(job["_id"])]
+            replay = [event async for event in runner.events(job["_id"], after=3)]
+            return created, events, replay, await runner.store.get(job["_id"])
+        finally:
+            await runner.stop()
+
+    created, events, replay, job = asyncio.run(main())
+    assert created
+    assert [offset for offset, _, _ in events] == list(range(1, len(events) + 1))
+    assert events[-1][1] == "done"
+    assert replay == events[3:]
+    assert job["status"] == DONE
+
+
+def test_stopped_job_is_resumed_from_a_new_offset_range(graph):
+    async def main():
+        store = MemoryJobStore()
+        first = JobRunner(store, lambda: graph, workers=1)
+        first.start()
+        job, _ = await first.submit(("acme",), INPUT)
+        seen = []
+
+        async def follow():
+            async for event in first.events(job["_id"]):
+                seen.append(event)
+
+        following = asyncio.create_task(follow())
+        while len(seen) < 2:
+            await asyncio.sleep(0.005)
+        await first.stop()
+        following.cancel()
+        status_after_stop = (await store.get(job["_id"]))["status"]
+
+        second = JobRunner(store, lambda: graph, workers=1)
+        second.start()
+        try:
+            rest = [event async for event in second.events(job["_id"], after=seen[-1][0])]
+        finally:
+            await second.stop()
+        return status_after_stop, seen, rest, await store.get(job["_id"])
+
+    status_after_stop, seen, rest, job = asyncio.run(main())
+    assert status_after_stop == QUEUED
+    assert job["attempts"] == 2
+    assert seen[0][0] == 1
+    # events the first attempt relayed but maybe didn't persist can't be shadowed
+    assert rest[0][0] == ATTEMPT_OFFSETS + 1
+    assert rest[-1][1] == "done"
+
+
+def test_abandoned_job_is_cancelled(graph, monkeypatch):
+    monkeypatch.setattr(jobs_module, "JOB_HEARTBEAT_SECONDS", 0.01)
+    monkeypatch.setattr(jobs_module, "JOB_ABANDON_SECONDS", 0.05)
+
+    async def main():
+        runner = JobRunner(MemoryJobStore(), lambda: graph, workers=1)
+        job, _ = await runner.submit(("acme",), INPUT, cancel_when_abandoned=True)
+        await asyncio.sleep(0.1)  # nobody follows it before it starts
+        runner.start()
+        try:
+            events = [event async for event in runner.events(job["_id"])]
+        finally:
+            await runner.stop()
+        return events, await runner.store.get(job["_id"])
+
+    events, job = asyncio.run(main())
+    assert job["status"] == CANCELLED
+    assert [event for _, event, _ in events] == ["error"]
+
+
+def test_identical_submission_without_the_flag_keeps_the_job():
+    async def main():
+        runner = JobRunner(MemoryJobStore(), lambda: None, workers=0)
+        job, _ = await runner.submit(("acme",), INPUT, cancel_when_abandoned=True)
+        same, created = await runner.submit(("acme",), INPUT)
+        return job, same, created, await runner.store.get(job["_id"])
+
+    job, same, created, stored = asyncio.run(main())
+    assert (same["_id"], created) == (job["_id"], False)
+    assert stored["cancel_when_abandoned"] is False
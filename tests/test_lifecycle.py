@@ -0,0 +1,30 @@
+import asyncio
+
+from agents import search
+from server.lifecycle import Lifecycle, memory_usage
+
+
+def test_not_ready_without_a_search_api_key(monkeypatch):
+    monkeypatch.delenv("TAVILY_API_KEY", raising=False)
+    monkeypatch.setattr(search, "_client", None)
+    lifecycle = Lifecycle()
+    lifecycle.add_check("tavily", search.check_client)
+    lifecycle.mark_started()
+    assert not asyncio.run(lifecycle.ready())
+    assert lifecycle._results["tavily"].startswith("error")
+
+    monkeypatch.setenv("TAVILY_API_KEY", "key")
+    assert asyncio.run(lifecycle.ready()) is False  # checked less than a few seconds ago
+    assert asyncio.run(lifecycle.check(max_age=0)) == {"tavily": "ok"}
+
+
+def test_draining_process_is_not_ready():
+    lifecycle = Lifecycle()
+    lifecycle.mark_started()
+    assert asyncio.run(lifecycle.ready())
+    lifecycle.start_draining()
+    assert not asyncio.run(lifecycle.ready())
+
+
+def test_memory_usage_is_reported():
+    assert all(value > 0 for value in memory_usage().values())
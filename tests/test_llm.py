@@ -0,0 +1,84 @@
+import asyncio
+from typing import TypedDict
+
+import httpx
+import openai
+import pytest
+from langchain_core.messages import HumanMessage
+from langchain_openai import ChatOpenAI
+from langgraph.graph import END, START, StateGraph
+
+from agents import llm
+from benchmarks.fakes import FakeChatModel
+
+
+class FlakyChatModel(FakeChatModel):
+    """Streams its answer, but the first call fails after `fail_after` tokens"""
+
+    fail_after: int = 0
+    calls: int = 0
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        sent = 0
+        if self.calls == 1 and self.fail_after == 0:
+            raise openai.APIConnectionError(request=httpx.Request("POST", "https://api.openai.com"))
+        async for chunk in super()._astream(messages, stop, run_manager, **kwargs):
+            yield chunk
+            sent += 1
+            if self.calls == 1 and sent == self.fail_after:
+                raise openai.APIConnectionError(request=httpx.Request("POST", "https://api.openai.com"))
+
+
+class State(TypedDict):
+    text: str
+
+
+@pytest.fixture(autouse=True)
+def no_cache_or_backoff(monkeypatch):
+    monkeypatch.setattr(llm, "CACHE_ENABLED", False)
+    monkeypatch.setattr(llm.scheduler, "_backoff", lambda attempt, error: 0)
+
+
+def stream_tokens(model):
+    """Runs a one-node graph calling the model, as the messages stream mode sees it"""
+    async def polish_node(state):
+        return {"text": (await llm.call_model([HumanMessage("Write it")], model)).content}
+
+    graph = StateGraph(State)
+    graph.add_node("polish_node", polish_node)
+    graph.add_edge(START, "polish_node")
+    graph.add_edge("polish_node", END)
+    graph = graph.compile()
+
+    async def main():
+        tokens = []
+        async for message, _ in graph.astream({"text": ""}, stream_mode="messages"):
+            tokens.append(message.content)
+        return tokens
+
+    return asyncio.run(main())
+
+
+def test_call_failing_before_streaming_is_retried():
+    model = FlakyChatModel(latency=0, tokens_per_second=10_000, response_tokens=5, fail_after=0)
+    assert len(stream_tokens(model)) == 5
+    assert model.calls == 2
+
+
+def test_call_failing_after_streaming_is_not_retried():
+    model = FlakyChatModel(latency=0, tokens_per_second=10_000, response_tokens=5, fail_after=2)
+    with pytest.raises(openai.APIConnectionError):
+        stream_tokens(model)
+    assert model.calls == 1
+
+
+def test_cache_key_covers_every_setting_that_changes_the_output():
+    def key(**settings):
+        settings = {"model": "gpt-4o-mini", "temperature": 0.1, "max_tokens": 100, "api_key": "test", **settings}
+        return llm.cache_key([HumanMessage("Write it")], ChatOpenAI(**settings))
+
+    assert key() != key(max_tokens=200)
+    assert key() != key(top_p=0.5)
+    assert key() != key(seed=1)
+    assert key() == key(streaming=True, timeout=5.0)
@@ -0,0 +1,28 @@
+from agents.retrieval import PassageIndex
+
+
+def test_bm25_ranks_matching_passages_first():
+    index = PassageIndex([
+        "Acme's revenue grew 12 percent on robot demand.",
+        "The weather in Springfield was sunny all week.",
+        "Acme appointed a new chief executive; revenue guidance was unchanged.",
+    ])
+    ranked = index.search("Acme revenue robot demand", k=3)
+    assert ranked[0] == 0
+    assert 1 not in ranked
+    assert index.search("nothing matches this", k=3) == []
+    assert PassageIndex().search("anything", k=3) == []
+
+
+def test_select_shares_the_budget_and_uses_each_passage_once():
+    index = PassageIndex([
+        "Acme revenue grew strongly.",
+        "Acme profit margins improved.",
+        "Acme opened a new factory.",
+    ])
+    selected = index.select({"revenue": "Acme revenue", "profit": "Acme profit"}, k=2, token_budget=1000)
+    used = selected["revenue"] + selected["profit"]
+    assert selected["revenue"][0] == "Acme revenue grew strongly."
+    assert selected["profit"][0] == "Acme profit margins improved."
+    assert len(used) == len(set(used))
+    assert index.select({"revenue": "Acme revenue"}, k=3, token_budget=0) == {"revenue": []}
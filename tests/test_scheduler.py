@@ -0,0 +1,190 @@
+import asyncio
+
+import pytest
+
+from agents import scheduler as scheduler_module
+from agents.scheduler import LATENCY_BACKOFF, OVERLOAD_BACKOFF, Scheduler, TokenBucket
+
+
+class Overloaded(Exception):
+    pass
+
+
+class Transient(Exception):
+    pass
+
+
+def make_scheduler(**kwargs) -> Scheduler:
+    options = dict(
+        requests_per_minute=60_000,
+        max_concurrency=8,
+        target_latency=1.0,
+        overload_on=(Overloaded,),
+        retry_on=(Transient,),
+        max_retries=2,
+    )
+    options.update(kwargs)
+    scheduler = Scheduler("test", **options)
+    scheduler._backoff = lambda attempt, error: 0
+    return scheduler
+
+
+@pytest.fixture(autouse=True)
+def no_cooldown(monkeypatch):
+    monkeypatch.setattr(scheduler_module, "SCHEDULER_DECREASE_COOLDOWN_SECONDS", 0)
+
+
+def test_overload_cuts_limit_multiplicatively():
+    scheduler = make_scheduler()
+    scheduler._on_failure(Overloaded())
+    assert scheduler.limit == 8 * OVERLOAD_BACKOFF
+    scheduler._on_failure(Overloaded())
+    assert scheduler.limit == 8 * OVERLOAD_BACKOFF ** 2
+
+
+def test_transient_errors_leave_limit_alone():
+    scheduler = make_scheduler()
+    scheduler._on_failure(Transient())
+    assert scheduler.limit == 8
+
+
+def test_limit_never_drops_below_min_concurrency():
+    scheduler = make_scheduler(min_concurrency=2)
+    for _ in range(10):
+        scheduler._on_failure(Overloaded())
+    assert scheduler.limit == 2
+    assert scheduler.stats()["limit"] == 2
+
+
+def test_fast_successes_grow_limit_additively_up_to_max():
+    scheduler = make_scheduler()
+    scheduler.limit = 2.0
+    scheduler._on_success(0.1)
+    assert scheduler.limit == pytest.approx(2.5)
+    for _ in range(100):
+        scheduler._on_success(0.1)
+    assert scheduler.limit == 8
+
+
+def test_slow_successes_shrink_limit():
+    scheduler = make_scheduler()
+    scheduler._on_success(5.0)
+    assert scheduler.limit == pytest.approx(8 * LATENCY_BACKOFF)
+
+
+def test_decreases_within_cooldown_count_once(monkeypatch):
+    monkeypatch.setattr(scheduler_module, "SCHEDULER_DECREASE_COOLDOWN_SECONDS", 60)
+    scheduler = make_scheduler()
+    scheduler._on_failure(Overloaded())
+    scheduler._on_failure(Overloaded())
+    assert scheduler.limit == 8 * OVERLOAD_BACKOFF
+
+
+def test_backoff_is_jittered_exponential_and_honours_retry_after(monkeypatch):
+    monkeypatch.setattr(scheduler_module, "SCHEDULER_RETRY_BASE_DELAY_SECONDS", 1.0)
+    monkeypatch.setattr(scheduler_module, "SCHEDULER_RETRY_MAX_DELAY_SECONDS", 10.0)
+    scheduler = Scheduler("test", requests_per_minute=60, max_concurrency=1)
+    for attempt, ceiling in [(0, 1.0), (2, 4.0), (10, 10.0)]:
+        delays = [scheduler._backoff(attempt, Transient()) for _ in range(50)]
+        assert all(0 <= delay <= ceiling for delay in delays)
+
+    class Response:
+        headers = {"retry-after": "30"}
+
+    error = Overloaded()
+    error.response = Response()
+    assert scheduler._backoff(0, error) == 30.0
+
+
+def test_run_retries_transient_errors():
+    scheduler = make_scheduler()
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise Transient()
+        return "ok"
+
+    assert asyncio.run(scheduler.run(call)) == "ok"
+    assert len(attempts) == 3
+    assert scheduler.in_flight == 0
+
+
+def test_run_gives_up_after_max_retries():
+    scheduler = make_scheduler(max_retries=1)
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        raise Overloaded()
+
+    with pytest.raises(Overloaded):
+        asyncio.run(scheduler.run(call))
+    assert len(attempts) == 2
+    assert scheduler.in_flight == 0
+
+
+def test_run_does_not_retry_other_errors():
+    scheduler = make_scheduler()
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        raise ValueError()
+
+    with pytest.raises(ValueError):
+        asyncio.run(scheduler.run(call))
+    assert len(attempts) == 1
+
+
+def test_run_does_not_retry_when_retry_if_says_no():
+    scheduler = make_scheduler()
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        raise Transient()
+
+    with pytest.raises(Transient):
+        asyncio.run(scheduler.run(call, retry_if=lambda: False))
+    assert len(attempts) == 1
+
+
+def test_concurrency_is_limited_and_waiters_go_in_priority_order():
+    scheduler = make_scheduler(max_concurrency=1)
+    order = []
+
+    async def main():
+        release = asyncio.Event()
+
+        async def first():
+            order.append("first")
+            await release.wait()
+
+        async def named(name):
+            order.append(name)
+
+        running = asyncio.create_task(scheduler.run(first, priority=0))
+        await asyncio.sleep(0)
+        late = asyncio.create_task(scheduler.run(lambda: named("late"), priority=2))
+        early = asyncio.create_task(scheduler.run(lambda: named("early"), priority=1))
+        await asyncio.sleep(0.01)
+        assert scheduler.stats() == {"limit": 1, "in_flight": 1, "waiting": 2}
+        release.set()
+        await asyncio.gather(running, late, early)
+
+    asyncio.run(main())
+    assert order == ["first", "early", "late"]
+
+
+def test_token_bucket_waits_for_refill():
+    async def main():
+        bucket = TokenBucket(rate_per_minute=600)  # 10 per second
+        await bucket.acquire(600)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        await bucket.acquire(1)
+        return loop.time() - start
+
+    assert 0.05 <= asyncio.run(main()) < 1.0
@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+
+from server.singleflight import Broadcast, SingleFlight
+
+
+def test_late_subscribers_get_a_replay_then_the_live_stream():
+    async def main():
+        broadcast = Broadcast()
+        broadcast.publish("a")
+        early = broadcast.subscribe()
+        assert await early.__anext__() == "a"
+        broadcast.publish("b")
+        late = broadcast.subscribe()
+        broadcast.close()
+        return [chunk async for chunk in early], [chunk async for chunk in late]
+
+    assert asyncio.run(main()) == (["b"], ["a", "b"])
+
+
+def test_source_errors_reach_subscribers():
+    async def failing():
+        yield "a"
+        raise RuntimeError("boom")
+
+    async def main():
+        broadcast = Broadcast()
+        await broadcast.run(failing())
+        return [chunk async for chunk in broadcast.subscribe()]
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(main())
+
+
+def test_identical_streams_share_one_run():
+    started = []
+
+    async def source():
+        started.append(1)
+        for chunk in "abc":
+            await asyncio.sleep(0.01)
+            yield chunk
+
+    async def consume(stream):
+        return [chunk async for chunk in stream]
+
+    async def run():
+        flights = SingleFlight()
+        streams = [flights.stream("key", source), flights.stream("key", source)]
+        assert len(flights) == 1
+        results = await asyncio.gather(*(consume(stream) for stream in streams))
+        await asyncio.sleep(0)
+        return results, len(flights)
+
+    results, remaining = asyncio.run(run())
+    assert results == [list("abc"), list("abc")]
+    assert started == [1]
+    assert remaining == 0
+
+
+def test_producer_is_cancelled_when_the_last_subscriber_leaves():
+    cancelled = asyncio.Event()
+
+    async def endless():
+        try:
+            while True:
+                await asyncio.sleep(0.01)
+                yield "chunk"
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    async def main():
+        flights = SingleFlight()
+        first = flights.stream("key", endless)
+        second = flights.stream("key", endless)
+        await first.__anext__()
+        await second.__anext__()
+        await first.aclose()
+        await asyncio.sleep(0.05)
+        one_left = cancelled.is_set()
+        await second.aclose()
+        await asyncio.sleep(0.05)
+        return one_left, cancelled.is_set(), len(flights)
+
+    assert asyncio.run(main()) == (False, True, 0)
+
+
+def test_a_caller_that_has_not_started_reading_keeps_the_producer():
+    async def source():
+        for chunk in "abc":
+            await asyncio.sleep(0.01)
+            yield chunk
+
+    async def main():
+        flights = SingleFlight()
+        first = flights.stream("key", source)
+        await first.__anext__()
+        second = flights.stream("key", source)
+        await first.aclose()
+        await asyncio.sleep(0.05)
+        return [chunk async for chunk in second]
+
+    assert asyncio.run(main()) == list("abc")
+
+
+def test_a_finished_flight_leaves_a_newer_one_for_its_key_alone():
+    async def source():
+        yield "a"
+
+    async def main():
+        flights = SingleFlight()
+        stream = flights.stream("key", source)
+        newer = flights._flights["key"] = Broadcast()
+        chunks = [chunk async for chunk in stream]
+        await asyncio.sleep(0)
+        return chunks, flights._flights.get("key") is newer
+
+    assert asyncio.run(main()) == (["a"], True)
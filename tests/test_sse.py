@@ -0,0 +1,81 @@
+import asyncio
+
+from server import sse
+
+
+async def collect(stream):
+    return [item async for item in stream]
+
+
+async def scripted(items, delay: float = 0):
+    for item in items:
+        if delay:
+            await asyncio.sleep(delay)
+        yield item
+
+
+def token(section, text):
+    return sse.TOKEN, {"section": section, "text": text}
+
+
+def test_format_event():
+    assert sse.format_event("status", {"text": "hi"}) == 'event: status\ndata: {"text": "hi"}\n\n'
+    assert sse.format_event("done", {}, 7) == "id: 7\nevent: done\ndata: {}\n\n"
+
+
+def test_batch_tokens_merges_tokens_per_section_and_keeps_order():
+    events = [
+        token("a", "Hel"), token("b", "Wor"), token("a", "lo"),
+        (sse.STATUS, {"text": "step"}),
+        token("a", "!"),
+    ]
+    batched = asyncio.run(collect(sse.batch_tokens(scripted(events), max_chars=100, max_delay=10)))
+    assert batched == [
+        token("a", "Hello"), token("b", "Wor"),
+        (sse.STATUS, {"text": "step"}),
+        token("a", "!"),
+    ]
+
+
+def test_batch_tokens_flushes_at_max_chars():
+    events = [token("a", "abc")] * 4
+    batched = asyncio.run(collect(sse.batch_tokens(scripted(events), max_chars=6, max_delay=10)))
+    assert batched == [token("a", "abcabc"), token("a", "abcabc")]
+
+
+def test_batch_tokens_flushes_after_max_delay():
+    events = [token("a", "x")] * 3
+    # each token has waited out the delay before the next one arrives
+    stream = sse.batch_tokens(scripted(events, delay=0.05), max_chars=100, max_delay=0.01)
+    assert asyncio.run(collect(stream)) == events
+
+
+class Request:
+    """Stands in for a starlette Request whose client leaves after `polls` checks"""
+
+    def __init__(self, polls: int):
+        self.polls = polls
+
+    async def is_disconnected(self) -> bool:
+        self.polls -= 1
+        return self.polls < 0
+
+
+def test_until_disconnected_sends_heartbeats_then_closes_the_stream():
+    closed = asyncio.Event()
+
+    async def quiet():
+        try:
+            yield "first"
+            await asyncio.sleep(10)
+            yield "never"
+        finally:
+            closed.set()
+
+    async def main():
+        chunks = await collect(sse.until_disconnected(Request(polls=2), quiet(), interval=0.01))
+        return chunks, closed.is_set()
+
+    chunks, was_closed = asyncio.run(main())
+    assert chunks == ["first", sse.HEARTBEAT, sse.HEARTBEAT]
+    assert was_closed
@@ -0,0 +1,34 @@
+"""
+Research job worker, run next to the web process (see Procfile):
+
+    python worker.py
+
+Runs queued research jobs from the shared job store until it's stopped.
+Set JOB_WORKERS to the number of jobs it runs at a time; on web processes,
+JOB_WORKERS=0 leaves all jobs to workers like this one.
+"""
+import asyncio
+import signal
+
+import main
+
+
+async def run():
+    await main.setup()
+    main.jobs.start()
+    print(f"Worker {main.jobs.worker_id} running {main.jobs.workers} research jobs at a time.")
+    print(f"Ready: {main.lifecycle.mark_started()}")
+
+    stopped = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopped.set)
+    await stopped.wait()
+
+    # unfinished jobs go back to the queue and resume from their checkpoints
+    await main.teardown()
+    print("Worker stopped.")
+
+
+if __name__ == "__main__":
+    asyncio.run(run())